@@ -14,20 +14,99 @@ class Settings(BaseSettings):
     META_REDIRECT_URI: str = "https://your-app.com/oauth/callback"
     GRAPH_API_BASE_URL: str = "https://graph.facebook.com/v21.0"
     META_WEBHOOK_VERIFY_TOKEN: str = "your-verify-token"
+    META_HTTP_MAX_CONNECTIONS: int = 100  # Graph API向けコネクションプールの上限
+    META_HTTP_MAX_KEEPALIVE: int = 20  # keep-aliveで保持する接続数
+    META_HTTP_KEEPALIVE_EXPIRY: float = 30.0  # アイドル接続の保持秒数
     
     # データベース設定
     DATABASE_URL: str = "sqlite:///./insta_tool.db"
-    
+    READ_DATABASE_URL: str | None = None  # 読み取り専用DB（未指定ならDATABASE_URLを使う）
+    SQLITE_PROFILE: str = "production"  # production: WAL等を有効化 / default: SQLite標準設定
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # ロック待ちの最大時間
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # メモリマップI/Oのサイズ（バイト）
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024  # 接続ごとのページキャッシュ（KB）
+    DB_POOL_SIZE: int | None = None  # 未指定ならスケジューラー＋Webhookワーカー数から算出
+    DB_MAX_OVERFLOW: int = 20
+
+    # スケジューラー設定
+    SCHEDULER_BATCH_SIZE: int = 100  # 1回のクレームで確保する投稿数
+    SCHEDULER_MAX_WORKERS: int = 8  # 投稿処理ワーカー数
+    SCHEDULER_PER_ACCOUNT_CONCURRENCY: int = 1  # アカウントごとの同時リクエスト数
+    SCHEDULER_SWEEP_MINUTES: int = 10  # 期限キューの取りこぼしを拾う安全スイープの間隔
+    # 複数プロセス構成（uvicorn --workers N）では leader にして1プロセスだけでスケジューラーを動かす
+    SCHEDULER_MODE: str = "embedded"  # embedded / leader / disabled
+    SCHEDULER_LEASE_SECONDS: int = 30  # リーダーのリース期間（更新が途絶えたらこの時間で他プロセスが引き継ぐ）
+    SCHEDULER_LEASE_RENEW_SECONDS: int = 10  # リースの更新・取得を試みる間隔
+    SCHEDULER_LEADER_SWEEP_SECONDS: int = 5  # leaderモードで他プロセスが作成した投稿を取り込む間隔
+    CONTAINER_POLL_INITIAL_SECONDS: float = 5.0  # 動画コンテナの最初のステータス確認までの秒数
+    CONTAINER_POLL_MAX_SECONDS: float = 60.0  # ステータス確認間隔の上限
+    CONTAINER_MAX_WAIT_MINUTES: int = 30  # 処理完了を待つ上限（超えたらFAILED）
+
+    # 予約投稿一括インポート設定
+    BULK_IMPORT_CHUNK_SIZE: int = 1000  # 1回のINSERT・コミットで書き込む行数
+    BULK_IMPORT_MAX_ERRORS: int = 1000  # レスポンスに含めるエラー行数の上限
+    BULK_IMPORT_SPOOL_BYTES: int = 8 * 1024 * 1024  # これを超えたリクエスト本文は一時ファイルに退避
+
+    # Graph APIレート制限設定（アカウント×エンドポイント種別ごと）
+    RATE_LIMIT_PUBLISH_PER_MINUTE: float = 10.0  # メディア作成・公開
+    RATE_LIMIT_COMMENT_REPLY_PER_MINUTE: float = 30.0  # コメント返信
+    RATE_LIMIT_DM_PER_MINUTE: float = 60.0  # DM送信
+    RATE_LIMIT_CONTAINER_STATUS_PER_MINUTE: float = 60.0  # コンテナのステータス確認
+    RATE_LIMIT_BURST: int = 5  # バケット容量（連続で送れる回数）
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 5.0  # これ以上待つ場合は待たずに後回しにする
+    RATE_LIMIT_USAGE_SOFT_THRESHOLD: int = 75  # 使用率がこの%を超えたら送信レートを下げる
+    RETRY_MAX_ATTEMPTS: int = 5  # 一時的なエラーで予約投稿を再キューする上限回数
+    RETRY_BASE_DELAY_SECONDS: float = 30.0  # 一時的なエラー後のバックオフ初期値（予約投稿・自動返信）
+    RETRY_MAX_DELAY_SECONDS: float = 3600.0  # 一時的なエラー後のバックオフ上限（予約投稿・自動返信）
+
+    # Webhook受信キュー設定
+    WEBHOOK_QUEUE_PATH: str = "./webhook_queue.db"  # キュー用SQLiteファイル
+    WEBHOOK_CONSUMER_WORKERS: int = 4  # キューを処理するワーカー数
+    WEBHOOK_QUEUE_BATCH_SIZE: int = 50  # 1回に取り出すイベント数
+    WEBHOOK_QUEUE_POLL_INTERVAL: float = 1.0  # キューが空のときの待機秒数
+    WEBHOOK_QUEUE_MAX_ATTEMPTS: int = 5  # 処理失敗時のリトライ上限
+    WEBHOOK_QUEUE_STALE_SECONDS: int = 300  # processingのままこの秒数を過ぎたイベントは落ちたワーカーの分とみなして戻す
+    WEBHOOK_DEDUP_RETENTION_HOURS: int = 24  # 重複判定用に処理済みイベントを保持する時間
+    CONVERSATION_CACHE_SIZE: int = 50000  # 24時間ルール判定用にメモリ保持する会話数
+    CONVERSATION_CACHE_TTL_SECONDS: int = 300  # 他プロセスでの更新を拾うためのキャッシュ有効期間
+
+    # 自動返信ルールキャッシュ設定
+    RULE_CACHE_TTL_SECONDS: int = 60  # 他プロセスでの変更を拾うためのキャッシュ有効期間
+    TEMPLATE_TIMEZONE: str = "Asia/Tokyo"  # 返信テンプレートの{greeting}・{time_of_day}を判定するタイムゾーン
+
+    # ダッシュボード設定
+    DASHBOARD_RECONCILE_MINUTES: int = 15  # 集計カウンターを実数と照合する間隔
+
+    # ログ保持設定（保持期間を過ぎたログは日次集計に畳み込み、アーカイブしてから削除）
+    RETENTION_COMMENT_LOG_DAYS: int = 90  # コメントログの保持日数（0で無期限）
+    RETENTION_DM_LOG_DAYS: int = 90  # DMログの保持日数（0で無期限）
+    RETENTION_APP_EVENT_LOG_DAYS: int = 30  # アプリケーションイベントログの保持日数（0で無期限）
+    RETENTION_BATCH_SIZE: int = 1000  # 1トランザクションで削除する行数
+    RETENTION_ARCHIVE_DIR: str = "./archive"  # gzip JSONLのアーカイブ先（空文字でアーカイブしない）
+    RETENTION_INTERVAL_HOURS: int = 24  # 保持処理の実行間隔（0で無効）
+    RETENTION_VACUUM_PAGES: int = 2000  # 1回のincremental_vacuumで解放するページ数（0で無効）
+
+    # エクスポート設定
+    EXPORT_YIELD_PER: int = 1000  # /export/* でDBから一度に読み出して送る行数
+
+    # メトリクス設定
+    METRICS_ENABLED: bool = True  # /metrics でPrometheus形式のメトリクスを公開する
+
     # ログ設定
     DEBUG: bool = False
     LOG_LEVEL: str = "INFO"
     LOG_TO_FILE: bool = True
     LOG_FILE_PATH: str = "./logs/app.log"
+    EVENT_LOG_BUFFER_SIZE: int = 10000  # AppEventLogの書き込みバッファ上限（超えたら古い順に破棄）
+    EVENT_LOG_FLUSH_BATCH_SIZE: int = 200  # この件数たまったら書き込み
+    EVENT_LOG_FLUSH_INTERVAL: float = 1.0  # 最大でこの秒数ごとに書き込み
     
     # Google Sheets連携（オプション）
     GOOGLE_SHEETS_SERVICE_ACCOUNT_JSON: str | None = None
     GOOGLE_SHEETS_SPREADSHEET_ID: str | None = None
     GOOGLE_SHEETS_LOG_SHEET_NAME: str = "ログ"
+    SHEETS_SYNC_MINUTES: int = 5  # AppEventLogをシートへ差分エクスポートする間隔
+    SHEETS_SYNC_BATCH_SIZE: int = 1000  # 1回のappend_rowsで送る行数
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,170 @@
+"""
+メディアコンテナのステータスポーリング
+動画・リールのコンテナは作成直後には公開できないため、
+作成済みコンテナを溜めておき、アカウントごとにまとめてステータスを問い合わせる
+
+- 問い合わせ間隔はコンテナごとに指数バックオフで延ばす
+- FINISHED / ERROR / EXPIRED / PUBLISHED / タイムアウトになったコンテナは
+  ワーカープールでコールバックに渡す（公開処理がポーリングを止めない）
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from app.enums import ContainerStatus
+
+logger = logging.getLogger(__name__)
+
+# 処理待ちとみなすステータス（それ以外は確定）
+_WAITING_STATUSES = {ContainerStatus.IN_PROGRESS, None}
+
+
+class ContainerPoller:
+    """
+    作成済みコンテナのステータスをバッチで確認し、確定したものをコールバックに渡す
+
+    check_statuses(container_ids, access_token, ig_user_id) -> {container_id: status_code}
+    on_resolved(job, creation_id, status) はワーカースレッドで呼ばれる。
+    """
+
+    def __init__(
+        self,
+        check_statuses: Callable[[list[str], str, str], dict[str, str]],
+        on_resolved: Callable[[dict, str, str], None],
+        *,
+        initial_delay: float,
+        max_delay: float,
+        max_wait: float,
+        workers: int,
+    ):
+        self.check_statuses = check_statuses
+        self.on_resolved = on_resolved
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self.workers = max(1, workers)
+        self._entries: dict[int, dict] = {}
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: threading.Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    def add(self, job: dict, creation_id: str, delay: float | None = None):
+        """コンテナを監視対象に追加（delay秒後に最初の確認）"""
+        now = time.time()
+        with self._cond:
+            previous = self._entries.get(job["post_id"])
+            self._entries[job["post_id"]] = {
+                "job": job,
+                "creation_id": creation_id,
+                "next_check": now + (self.initial_delay if delay is None else delay),
+                "polls": 0,
+                "deadline": previous["deadline"] if previous else now + self.max_wait,
+            }
+            self._cond.notify_all()
+
+    def pending_count(self) -> int:
+        """監視中のコンテナ数"""
+        with self._cond:
+            return len(self._entries)
+
+    def start(self):
+        """ポーリングスレッドを開始"""
+        with self._cond:
+            self._stop = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="container-publisher",
+        )
+        self._thread = threading.Thread(target=self._run, name="container-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """ポーリングを止め、実行中の公開処理の完了を待つ"""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._cond:
+            self._entries = {}
+
+    def poll_once(self) -> int:
+        """確認時刻が来たコンテナを1回分処理（処理したコンテナ数を返す）"""
+        now = time.time()
+        with self._cond:
+            due = [entry for entry in self._entries.values() if entry["next_check"] <= now]
+            for entry in due:
+                del self._entries[entry["job"]["post_id"]]
+        if not due:
+            return 0
+
+        groups: dict[tuple[str, str], list[dict]] = defaultdict(list)
+        for entry in due:
+            job = entry["job"]
+            groups[(job["ig_user_id"], job["access_token"])].append(entry)
+
+        for (ig_user_id, access_token), entries in groups.items():
+            try:
+                statuses = self.check_statuses(
+                    [entry["creation_id"] for entry in entries],
+                    access_token,
+                    ig_user_id,
+                )
+            except Exception as e:
+                logger.warning(f"Container status check failed: account={ig_user_id} error={e}")
+                statuses = {}
+            for entry in entries:
+                self._handle(entry, statuses.get(entry["creation_id"]), now)
+        return len(due)
+
+    def _handle(self, entry: dict, status: str | None, now: float):
+        if status in _WAITING_STATUSES:
+            if now < entry["deadline"]:
+                entry["polls"] += 1
+                delay = min(self.max_delay, self.initial_delay * 2 ** entry["polls"])
+                entry["next_check"] = now + delay
+                with self._cond:
+                    # 待機中に再登録されていればそちらを優先
+                    self._entries.setdefault(entry["job"]["post_id"], entry)
+                return
+            status = ContainerStatus.TIMEOUT
+        self._resolve(entry["job"], entry["creation_id"], status)
+
+    def _resolve(self, job: dict, creation_id: str, status: str):
+        def run():
+            try:
+                self.on_resolved(job, creation_id, status)
+            except Exception as e:
+                logger.error(f"Container handler crashed: post_id={job['post_id']} error={e}")
+
+        if self._executor is None:
+            run()
+        else:
+            self._executor.submit(run)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stop:
+                    next_check = min(
+                        (entry["next_check"] for entry in self._entries.values()),
+                        default=None,
+                    )
+                    if next_check is not None and next_check <= time.time():
+                        break
+                    timeout = None if next_check is None else max(0.0, next_check - time.time())
+                    self._cond.wait(timeout)
+                if self._stop:
+                    return
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"Container poller error: {e}")
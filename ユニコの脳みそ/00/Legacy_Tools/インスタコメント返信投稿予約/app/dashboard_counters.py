@@ -0,0 +1,107 @@
+"""
+ダッシュボード集計カウンター
+投稿・Webhook・アカウント操作の各処理が同じトランザクション内でカウンターを増減し、
+サマリー取得時はカウンターを読むだけで済ませる
+
+カウンターのずれは定期的な照合ジョブで実数に合わせる。
+"""
+from datetime import datetime, timezone
+from sqlalchemy import select, update, func, literal
+from sqlalchemy.orm import Session
+
+from app.models import IGAccount, ScheduledPost, CommentLog, DMLog, DashboardCounter
+from app.enums import PostStatus, DashboardCounterName
+
+
+def _count_queries() -> dict[str, object]:
+    """各カウンターの実数を求めるスカラーサブクエリ"""
+    def count_where(model, *criteria):
+        return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+    return {
+        DashboardCounterName.TOTAL_ACCOUNTS: count_where(IGAccount),
+        DashboardCounterName.ACTIVE_ACCOUNTS: count_where(IGAccount, IGAccount.is_active == 1),
+        DashboardCounterName.PENDING_POSTS: count_where(
+            ScheduledPost, ScheduledPost.status == PostStatus.PENDING
+        ),
+        DashboardCounterName.UNHANDLED_COMMENTS: count_where(CommentLog, CommentLog.replied == 0),
+        DashboardCounterName.UNHANDLED_DMS: count_where(
+            DMLog, DMLog.direction == "in", DMLog.replied == 0
+        ),
+    }
+
+
+def bump_counters(db: Session, **deltas: int):
+    """
+    カウンターを増減（コミットは呼び出し側のトランザクションで行う）
+
+    例: bump_counters(db, pending_posts=1)
+    """
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        db.execute(
+            update(DashboardCounter)
+            .where(DashboardCounter.name == name)
+            .values(value=DashboardCounter.value + delta)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def reconcile_dashboard_counters(db: Session):
+    """
+    カウンターを実数と照合して上書き
+
+    値の計算と書き込みを1文のUPDATEで行うため、照合中の増減を取りこぼさない。
+    """
+    now = datetime.utcnow()
+    queries = _count_queries()
+    existing = set(db.execute(select(DashboardCounter.name)).scalars())
+    for name, count_query in queries.items():
+        if name not in existing:
+            db.add(DashboardCounter(name=name, value=0))
+    db.flush()
+    for name, count_query in queries.items():
+        db.execute(
+            update(DashboardCounter)
+            .where(DashboardCounter.name == name)
+            .values(value=count_query, reconciled_at=literal(now))
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+
+def read_dashboard_counters(db: Session) -> dict[str, int]:
+    """
+    ダッシュボード用の集計値を取得
+
+    今日以降の予約数（today_posts）は、pending総数から期限切れのpending数を引いて求める。
+    期限切れのpendingはスケジューラーがすぐ処理するため、ごく少数の行しか数えない。
+    """
+    counters = dict(db.execute(select(DashboardCounter.name, DashboardCounter.value)).all())
+    if len(counters) < len(_count_queries()):
+        # 初回（照合前）は実数を直接集計
+        counters = dict(zip(
+            _count_queries().keys(),
+            db.execute(select(*_count_queries().values())).one(),
+        ))
+
+    now = datetime.now(timezone.utc)
+    today_start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+    overdue_pending = db.execute(
+        select(func.count())
+        .select_from(ScheduledPost)
+        .where(
+            ScheduledPost.status == PostStatus.PENDING,
+            ScheduledPost.scheduled_at < today_start,
+        )
+    ).scalar()
+
+    return {
+        "total_accounts": counters[DashboardCounterName.TOTAL_ACCOUNTS],
+        "active_accounts": counters[DashboardCounterName.ACTIVE_ACCOUNTS],
+        "pending_posts": counters[DashboardCounterName.PENDING_POSTS],
+        "today_posts": max(0, counters[DashboardCounterName.PENDING_POSTS] - overdue_pending),
+        "unhandled_comments": counters[DashboardCounterName.UNHANDLED_COMMENTS],
+        "unhandled_dms": counters[DashboardCounterName.UNHANDLED_DMS],
+    }
@@ -1,22 +1,153 @@
 """
 データベース接続とセッション管理
+
+SQLiteの場合はSettings.SQLITE_PROFILEで接続設定を切り替える。
+- production: incremental auto_vacuum、WAL、synchronous=NORMAL、busy_timeout、mmap、キャッシュサイズを設定
+- default: SQLiteの標準設定のまま
+
+書き込み用のengineとは別に、ダッシュボード等の読み取り専用engineを用意する。
+WALモードでは読み取りが書き込みをブロックしないため、Webhookの書き込みと並行して読める。
+
+接続の貸し出し時間とプールの使用状況はapp.metricsで公開する。
 """
-from sqlalchemy import create_engine
+import time
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import settings
+from app.metrics import histogram, gauge
+
+SQLITE_PROFILE_PRODUCTION = "production"
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+
+def _pool_size() -> int:
+    """スケジューラー・Webhookワーカー・ログライター分の接続を確保"""
+    if settings.DB_POOL_SIZE:
+        return settings.DB_POOL_SIZE
+    return settings.SCHEDULER_MAX_WORKERS + settings.WEBHOOK_CONSUMER_WORKERS + 4
+
+
+def _apply_sqlite_pragmas(engine, *, read_only: bool = False):
+    """接続ごとにSQLiteのPRAGMAを設定"""
+    production = settings.SQLITE_PROFILE == SQLITE_PROFILE_PRODUCTION
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if production:
+                # 新規DBのみ有効（テーブル作成前・WAL切り替え前に設定する必要がある）
+                # 既存DBは python -m app.retention --enable-incremental-vacuum で変換する
+                cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+                cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+                # 負の値はKB単位の指定
+                cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+                cursor.execute("PRAGMA temp_store=MEMORY")
+            if read_only:
+                cursor.execute("PRAGMA query_only=ON")
+        finally:
+            cursor.close()
+
+
+def _create_engine(url: str, *, read_only: bool = False):
+    """設定に応じたengineを作成"""
+    kwargs = {"echo": settings.DEBUG}  # DEBUGモードでSQLをログ出力
+    if _is_sqlite(url):
+        # SQLiteの場合はcheck_same_thread=Falseが必要
+        kwargs["connect_args"] = {
+            "check_same_thread": False,
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+        if _is_sqlite_memory(url):
+            return create_engine(url, **kwargs)
+    kwargs["pool_size"] = _pool_size()
+    kwargs["max_overflow"] = settings.DB_MAX_OVERFLOW
+    kwargs["pool_pre_ping"] = not _is_sqlite(url)
+
+    new_engine = create_engine(url, **kwargs)
+    if _is_sqlite(url):
+        _apply_sqlite_pragmas(new_engine, read_only=read_only)
+    return new_engine
+
 
-# SQLiteの場合はcheck_same_thread=Falseが必要
-connect_args = {}
-if settings.DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
+# ==================== メトリクス ====================
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args=connect_args,
-    echo=settings.DEBUG,  # DEBUGモードでSQLをログ出力
+DB_CONNECTION_HOLD_SECONDS = histogram(
+    "db_connection_hold_seconds",
+    "DB接続をプールから借りていた時間（セッションの処理時間）",
+    ["engine"],
 )
 
+# メトリクスを出すengine（ラベル -> engine）
+_instrumented_engines: dict[str, object] = {}
+
+
+def _instrument_engine(target_engine, label: str):
+    """接続の貸し出し・返却を計測し、プール使用状況のゲージに加える"""
+    if label in _instrumented_engines:
+        return
+    _instrumented_engines[label] = target_engine
+
+    @event.listens_for(target_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    @event.listens_for(target_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            DB_CONNECTION_HOLD_SECONDS.observe(time.perf_counter() - started, engine=label)
+
+
+def _pool_gauge(read):
+    def collect():
+        values = {}
+        for label, target_engine in list(_instrumented_engines.items()):
+            try:
+                values[(label,)] = read(target_engine.pool)
+            except AttributeError:
+                # SingletonThreadPool等、統計を持たないプール
+                continue
+        return values
+    return collect
+
+
+gauge("db_pool_checked_out", "貸し出し中のDB接続数", _pool_gauge(lambda pool: pool.checkedout()), ["engine"])
+gauge("db_pool_size", "DBプールの常設接続数", _pool_gauge(lambda pool: pool.size()), ["engine"])
+gauge(
+    "db_pool_overflow",
+    "プールサイズを超えて作成された接続数",
+    _pool_gauge(lambda pool: max(0, pool.overflow())),
+    ["engine"],
+)
+
+
+engine = _create_engine(settings.DATABASE_URL)
+
+if settings.READ_DATABASE_URL:
+    read_engine = _create_engine(settings.READ_DATABASE_URL, read_only=True)
+elif _is_sqlite(settings.DATABASE_URL) and not _is_sqlite_memory(settings.DATABASE_URL):
+    read_engine = _create_engine(settings.DATABASE_URL, read_only=True)
+else:
+    read_engine = engine
+
+_instrument_engine(engine, "write")
+if read_engine is not engine:
+    _instrument_engine(read_engine, "read")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
 
@@ -29,3 +160,10 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """FastAPI用の読み取り専用DBセッション依存性（ダッシュボード・一覧表示用）"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,51 +1,206 @@
 """
 DM関連ユーティリティ
 24時間ルールの判定など
+
+会話ごとの最終メッセージ時刻はメモリ上のLRUキャッシュに保持し、
+24時間ルールの判定は通常DBを参照せずに行う。
+DBへの書き込みはキャッシュに溜めておき、Webhookのバッチ処理ごとにまとめて反映する。
 """
+import logging
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
+from app.config import settings
 from app.models import UserConversation
 
+logger = logging.getLogger(__name__)
+
 # 24時間ルールの時間窓
 AUTO_REPLY_WINDOW_HOURS = 24
 
+# まとめて書き込む際の1クエリあたりのキー数
+_FLUSH_CHUNK_SIZE = 200
+
+_MISSING = object()
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    """DBから読んだnaiveな日時をUTCとして扱う"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class ConversationWindowCache:
+    """
+    (ig_account_id, instagram_user_id) -> last_user_message_at のLRU/TTLキャッシュ
+    
+    記録した更新は書き込み待ちとして保持し、flush()でDBにまとめて反映する。
+    """
+    
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple[int, str], tuple[datetime | None, float]] = OrderedDict()
+        self._pending: dict[tuple[int, str], dict] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key: tuple[int, str]):
+        """キャッシュされた最終メッセージ時刻（なければ_MISSING）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, loaded_at = entry
+            # 書き込み待ちの値はDBより新しいので期限切れにしない
+            if key not in self._pending and time.monotonic() - loaded_at > self.ttl_seconds:
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key: tuple[int, str], last_user_message_at: datetime | None):
+        """キャッシュに格納（容量を超えたら古い順に破棄）"""
+        with self._lock:
+            self._store(key, last_user_message_at)
+    
+    def record_user_message(self, ig_account_id: int, instagram_user_id: str, at: datetime):
+        """ユーザーからのメッセージ受信を記録"""
+        key = (ig_account_id, instagram_user_id)
+        with self._lock:
+            self._store(key, at)
+            pending = self._pending.setdefault(key, {})
+            pending["last_user_message_at"] = at
+            pending["is_open"] = 1
+    
+    def record_bot_message(self, ig_account_id: int, instagram_user_id: str, at: datetime):
+        """Botからの送信を記録"""
+        key = (ig_account_id, instagram_user_id)
+        with self._lock:
+            self._pending.setdefault(key, {})["last_bot_message_at"] = at
+    
+    def flush(self, db: Session) -> int:
+        """
+        書き込み待ちの更新をDBにまとめて反映
+        
+        Returns:
+            反映した会話数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        
+        try:
+            keys = list(pending)
+            for start in range(0, len(keys), _FLUSH_CHUNK_SIZE):
+                chunk = keys[start:start + _FLUSH_CHUNK_SIZE]
+                existing = (
+                    db.query(UserConversation)
+                    .filter(
+                        tuple_(
+                            UserConversation.ig_account_id,
+                            UserConversation.instagram_user_id,
+                        ).in_(chunk)
+                    )
+                    .all()
+                )
+                found = set()
+                for conv in existing:
+                    key = (conv.ig_account_id, conv.instagram_user_id)
+                    found.add(key)
+                    for field, value in pending[key].items():
+                        setattr(conv, field, value)
+                db.add_all([
+                    UserConversation(
+                        ig_account_id=key[0],
+                        instagram_user_id=key[1],
+                        **{"is_open": 1, **pending[key]},
+                    )
+                    for key in chunk
+                    if key not in found
+                ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            # 反映できなかった更新は次回に回す（その間に記録された更新を優先）
+            with self._lock:
+                for key, fields in pending.items():
+                    self._pending[key] = {**fields, **self._pending.get(key, {})}
+            raise
+        return len(pending)
+    
+    def pending_count(self) -> int:
+        """書き込み待ちの会話数"""
+        with self._lock:
+            return len(self._pending)
+    
+    def clear(self):
+        """キャッシュを空にする（書き込み待ちは残す）"""
+        with self._lock:
+            self._entries.clear()
+    
+    def _store(self, key: tuple[int, str], value: datetime | None):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            # 書き込み待ちのエントリは捨てない
+            for candidate in self._entries:
+                if candidate not in self._pending:
+                    del self._entries[candidate]
+                    break
+            else:
+                break
+
+
+conversation_cache = ConversationWindowCache(
+    max_size=settings.CONVERSATION_CACHE_SIZE,
+    ttl_seconds=settings.CONVERSATION_CACHE_TTL_SECONDS,
+)
 
-def get_or_create_conversation(
+
+def flush_conversation_updates(db: Session | None = None) -> int:
+    """書き込み待ちの会話更新をDBに反映"""
+    if db is not None:
+        return conversation_cache.flush(db)
+    from app.db import SessionLocal
+    
+    session = SessionLocal()
+    try:
+        return conversation_cache.flush(session)
+    finally:
+        session.close()
+
+
+def get_last_user_message_at(
     db: Session,
     ig_account_id: int,
     instagram_user_id: str,
-) -> UserConversation:
+) -> datetime | None:
     """
-    ユーザー会話を取得または作成
-    
-    Args:
-        db: データベースセッション
-        ig_account_id: InstagramアカウントID
-        instagram_user_id: InstagramユーザーID
-        
-    Returns:
-        UserConversationオブジェクト
+    ユーザーからの最終メッセージ時刻を取得（キャッシュになければDBから読み込む）
     """
-    conv = (
-        db.query(UserConversation)
+    key = (ig_account_id, instagram_user_id)
+    cached = conversation_cache.get(key)
+    if cached is not _MISSING:
+        return cached
+    
+    last_user_message_at = (
+        db.query(UserConversation.last_user_message_at)
         .filter(
             UserConversation.ig_account_id == ig_account_id,
             UserConversation.instagram_user_id == instagram_user_id,
         )
-        .first()
+        .order_by(UserConversation.last_user_message_at.desc())
+        .limit(1)
+        .scalar()
     )
-    
-    if not conv:
-        conv = UserConversation(
-            ig_account_id=ig_account_id,
-            instagram_user_id=instagram_user_id,
-            is_open=1,
-        )
-        db.add(conv)
-        db.commit()
-        db.refresh(conv)
-    
-    return conv
+    last_user_message_at = _as_utc(last_user_message_at)
+    conversation_cache.put(key, last_user_message_at)
+    return last_user_message_at
 
 
 def can_auto_reply(
@@ -64,21 +219,12 @@ def can_auto_reply(
     Returns:
         自動返信可能な場合True
     """
-    conv = (
-        db.query(UserConversation)
-        .filter(
-            UserConversation.ig_account_id == ig_account_id,
-            UserConversation.instagram_user_id == instagram_user_id,
-        )
-        .first()
-    )
+    last_user_message_at = get_last_user_message_at(db, ig_account_id, instagram_user_id)
     
-    if not conv or not conv.last_user_message_at:
+    if not last_user_message_at:
         return False
     
     now_utc = datetime.now(timezone.utc)
-    diff = now_utc - conv.last_user_message_at
+    diff = now_utc - last_user_message_at
     
     return diff <= timedelta(hours=AUTO_REPLY_WINDOW_HOURS)
-
-
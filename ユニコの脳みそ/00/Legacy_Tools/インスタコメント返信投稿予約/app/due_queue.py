@@ -0,0 +1,118 @@
+"""
+予約投稿の期限キュー
+pendingの投稿の予約時刻をメモリ上の最小ヒープで保持し、
+ディスパッチャーは次の期限までスリープして期限ちょうどに起きる
+
+- 投稿の作成・リスケジュール・キャンセル時にAPIから更新する
+- 他プロセスでの変更は低頻度の安全スイープで取り込む
+- キャンセル・リスケジュール前のエントリは取り出し時に読み飛ばす（遅延削除）
+"""
+import heapq
+import threading
+import time
+from datetime import datetime, timezone
+
+
+def due_timestamp(scheduled_at: datetime) -> float:
+    """
+    予約時刻をUNIX時刻に変換
+
+    SQLiteはタイムゾーンを落として保存し、claim_due_postsはそれをUTCとして比較するため、
+    ここでも同じくタイムゾーンを無視してUTCとみなす。
+    """
+    return scheduled_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+class DueQueue:
+    """投稿IDを予約時刻順に保持するスレッドセーフな最小ヒープ"""
+
+    def __init__(self):
+        self._heap: list[tuple[float, int]] = []
+        self._due: dict[int, float] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def schedule(self, post_id: int, scheduled_at: datetime):
+        """投稿の予約時刻を登録（登録済みなら置き換え）"""
+        ts = due_timestamp(scheduled_at)
+        with self._cond:
+            if self._due.get(post_id) == ts:
+                return
+            self._due[post_id] = ts
+            heapq.heappush(self._heap, (ts, post_id))
+            self._compact_if_needed()
+            # 先頭が変わったときだけディスパッチャーを起こす
+            if self._heap[0] == (ts, post_id):
+                self._cond.notify_all()
+
+    def schedule_many(self, entries: list[tuple[int, datetime]]):
+        """複数の投稿をまとめて登録"""
+        with self._cond:
+            for post_id, scheduled_at in entries:
+                ts = due_timestamp(scheduled_at)
+                if self._due.get(post_id) == ts:
+                    continue
+                self._due[post_id] = ts
+                heapq.heappush(self._heap, (ts, post_id))
+            self._compact_if_needed()
+            self._cond.notify_all()
+
+    def cancel(self, post_id: int):
+        """投稿を期限キューから外す"""
+        with self._cond:
+            self._due.pop(post_id, None)
+
+    def wait_for_due(self) -> list[int]:
+        """
+        次の期限まで待ち、期限が来た投稿IDを取り出す
+
+        Returns:
+            期限が来た投稿IDのリスト（close()された場合は空）
+        """
+        with self._cond:
+            while not self._closed:
+                now = time.time()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    ts, post_id = heapq.heappop(self._heap)
+                    if self._due.get(post_id) == ts:
+                        del self._due[post_id]
+                        due.append(post_id)
+                if due:
+                    return due
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
+            return []
+
+    def next_due(self) -> float | None:
+        """次の期限（UNIX時刻）"""
+        with self._cond:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def close(self):
+        """待機中のディスパッチャーを起こして終了させる"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reset(self):
+        """空にして再利用可能にする（起動時・テスト用）"""
+        with self._cond:
+            self._heap = []
+            self._due = {}
+            self._closed = False
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._due)
+
+    def _compact_if_needed(self):
+        # 読み飛ばすだけのエントリが増えすぎたら作り直す
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(ts, post_id) for post_id, ts in self._due.items()]
+            heapq.heapify(self._heap)
+
+
+due_queue = DueQueue()
@@ -12,6 +12,7 @@ class PostStatus:
     FAILED = "failed"
     CANCELED = "canceled"
     PAUSED = "paused"
+    PUBLISHING = "publishing"  # コンテナ作成済み・処理完了待ち
 
 
 class PostType:
@@ -50,3 +51,43 @@ class LogLevel:
     ERROR = "ERROR"
 
 
+class WebhookEventStatus:
+    """Webhook受信キューのイベントステータス"""
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    DEAD = "dead"  # リトライ上限に達したイベント
+
+
+class DashboardCounterName:
+    """ダッシュボード集計カウンター名"""
+    TOTAL_ACCOUNTS = "total_accounts"
+    ACTIVE_ACCOUNTS = "active_accounts"
+    PENDING_POSTS = "pending_posts"
+    UNHANDLED_COMMENTS = "unhandled_comments"
+    UNHANDLED_DMS = "unhandled_dms"
+
+
+class ApiEndpointClass:
+    """Graph APIのレート制限を分けるエンドポイント種別"""
+    PUBLISH = "publish"
+    COMMENT_REPLY = "comment_reply"
+    DM = "dm"
+    CONTAINER_STATUS = "container_status"
+
+
+class ContainerStatus:
+    """メディアコンテナのステータス（Graph APIのstatus_code）"""
+    IN_PROGRESS = "IN_PROGRESS"
+    FINISHED = "FINISHED"
+    PUBLISHED = "PUBLISHED"
+    ERROR = "ERROR"
+    EXPIRED = "EXPIRED"
+    TIMEOUT = "TIMEOUT"  # 待機上限を超えた（アプリ側の判定）
+
+
+class SchedulerMode:
+    """スケジューラーの起動方法（SCHEDULER_MODE）"""
+    EMBEDDED = "embedded"  # 各プロセスで起動（単一プロセス向け）
+    LEADER = "leader"  # リースを取得した1プロセスだけで起動
+    DISABLED = "disabled"  # このプロセスでは起動しない
@@ -1,18 +1,29 @@
 """
 Google Sheets連携
 サービスアカウントを使用してスプレッドシートにデータを書き込む
+
+認証済みクライアントはサービスアカウントのファイルごとにキャッシュする
+（アクセストークンの更新はgoogle-authが自動で行う）
 """
+import threading
 import gspread
 from google.oauth2.service_account import Credentials
-from typing import List
+from typing import Iterable, List
 from app.config import settings
+from app.sheets_sync import SheetsSyncService
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 
+_clients: dict[str, gspread.Client] = {}
+_clients_lock = threading.Lock()
+
+# スプレッドシートごとの同期サービス（ワークシートのハンドルをキャッシュ）
+_services: dict = {}
+
 
 def get_sheets_client(service_account_json_path: str):
     """
-    Google Sheetsクライアントを取得
+    Google Sheetsクライアントを取得（初回のみ認証し、以降はキャッシュを返す）
     
     Args:
         service_account_json_path: サービスアカウントのJSONファイルパス
@@ -20,11 +31,18 @@ def get_sheets_client(service_account_json_path: str):
     Returns:
         gspreadクライアント
     """
-    creds = Credentials.from_service_account_file(
-        service_account_json_path,
-        scopes=SCOPES,
-    )
-    client = gspread.authorize(creds)
+    client = _clients.get(service_account_json_path)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(service_account_json_path)
+        if client is None:
+            creds = Credentials.from_service_account_file(
+                service_account_json_path,
+                scopes=SCOPES,
+            )
+            client = gspread.authorize(creds)
+            _clients[service_account_json_path] = client
     return client
 
 
@@ -43,51 +61,62 @@ def append_log_rows(
         rows: 追加する行のリスト（各行は文字列のリスト）
         service_account_json_path: サービスアカウントのJSONファイルパス
     """
-    client = get_sheets_client(service_account_json_path)
-    sh = client.open_by_key(spreadsheet_id)
-    worksheet = sh.worksheet(sheet_name)
-    worksheet.append_rows(rows, value_input_option="RAW")
+    service = _services.get((spreadsheet_id, service_account_json_path))
+    if service is None:
+        service = SheetsSyncService(spreadsheet_id, service_account_json_path)
+        _services[(spreadsheet_id, service_account_json_path)] = service
+    service.append_rows(sheet_name, rows)
 
 
 def export_event_logs_to_sheets(
     spreadsheet_id: str,
     sheet_name: str,
-    logs: List[dict],
+    logs: Iterable[dict],
     service_account_json_path: str,
+    batch_size: int | None = None,
 ):
     """
     アプリケーションイベントログをスプレッドシートにエクスポート
     
+    ログはbatch_size件ずつ送るため、ジェネレーターを渡せば全件をメモリに載せずに済む。
+    
     Args:
         spreadsheet_id: スプレッドシートID
         sheet_name: シート名
-        logs: ログのリスト（辞書形式）
+        logs: ログのイテラブル（辞書形式）
         service_account_json_path: サービスアカウントのJSONファイルパス
+        batch_size: 1回に送る行数（未指定ならSHEETS_SYNC_BATCH_SIZE）
     """
-    if not logs:
-        return
-    
+    batch_size = batch_size or settings.SHEETS_SYNC_BATCH_SIZE
     # ヘッダー行
     headers = ["日時", "レベル", "ソース", "イベントタイプ", "メッセージ", "メタデータ"]
     
     # データ行
     rows = [headers]
+    sent = False
     for log in logs:
-        row = [
+        rows.append([
             log.get("created_at", ""),
             log.get("level", ""),
             log.get("source", ""),
             log.get("event_type", ""),
             log.get("message", ""),
             log.get("meta", ""),
-        ]
-        rows.append(row)
+        ])
+        if len(rows) >= batch_size:
+            append_log_rows(
+                spreadsheet_id=spreadsheet_id,
+                sheet_name=sheet_name,
+                rows=rows,
+                service_account_json_path=service_account_json_path,
+            )
+            rows = []
+            sent = True
     
-    append_log_rows(
-        spreadsheet_id=spreadsheet_id,
-        sheet_name=sheet_name,
-        rows=rows,
-        service_account_json_path=service_account_json_path,
-    )
-
-
+    if rows and (sent or len(rows) > 1):
+        append_log_rows(
+            spreadsheet_id=spreadsheet_id,
+            sheet_name=sheet_name,
+            rows=rows,
+            service_account_json_path=service_account_json_path,
+        )
@@ -0,0 +1,217 @@
+"""
+スケジューラーのリーダー選出
+複数のWebプロセス（uvicorn --workers N）のうち、DBのリースを取得した1プロセスだけが
+スケジューラーを動かす（SCHEDULER_MODE=leader）
+
+- リースはscheduler_leasesの1行。期限切れか自分が保持者の場合だけUPDATEで取得・更新できる
+- リーダーはSCHEDULER_LEASE_RENEW_SECONDSごとに期限を延ばし、落ちたプロセスのリースは
+  SCHEDULER_LEASE_SECONDSで切れて他プロセスが引き継ぐ
+- 更新に失敗したリーダーは、取得済みの期限が切れる前に自分からスケジューラーを止める
+- 正常終了時はリースを削除し、すぐに他プロセスが引き継げるようにする
+
+期限は各プロセスの時計で判定するため、複数ホストで動かす場合は時刻を同期しておくこと。
+投稿のクレーム自体も原子的なので、引き継ぎの瞬間に2プロセスが重なっても二重投稿にはならない。
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LEASE_NAME = "scheduler"
+
+
+def default_holder_id() -> str:
+    """このプロセスの保持者ID"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderLease:
+    """DBの1行を使ったリース"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        name: str,
+        holder: str,
+        lease_seconds: float,
+    ):
+        self.session_factory = session_factory
+        self.name = name
+        self.holder = holder
+        self.lease_seconds = lease_seconds
+
+    def try_acquire(self) -> bool:
+        """
+        リースを取得または更新
+
+        Returns:
+            このプロセスがリースを保持しているか
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        db = self.session_factory()
+        try:
+            result = db.execute(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.name == self.name,
+                    or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now),
+                )
+                .values(holder=self.holder, expires_at=expires_at)
+            )
+            if result.rowcount:
+                db.commit()
+                return True
+            if db.get(SchedulerLease, self.name) is not None:
+                # 他プロセスが有効なリースを保持している
+                db.rollback()
+                return False
+            db.add(SchedulerLease(
+                name=self.name, holder=self.holder, expires_at=expires_at, acquired_at=now
+            ))
+            db.commit()
+            return True
+        except IntegrityError:
+            # 同時に作成した他プロセスが先にコミットした
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def mark_acquired(self):
+        """リーダーになった時刻を記録（表示用）"""
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name, SchedulerLease.holder == self.holder)
+                .values(acquired_at=datetime.utcnow())
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self):
+        """保持しているリースを手放す"""
+        db = self.session_factory()
+        try:
+            db.execute(
+                delete(SchedulerLease).where(
+                    SchedulerLease.name == self.name, SchedulerLease.holder == self.holder
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+class LeaderElector:
+    """
+    リースの取得・更新を定期的に行い、リーダーになったら on_elected、
+    リーダーでなくなったら on_demoted を呼ぶ（専用スレッドで実行）
+    """
+
+    def __init__(
+        self,
+        lease: LeaderLease,
+        on_elected: Callable[[], None],
+        on_demoted: Callable[[], None],
+        *,
+        renew_interval: float,
+    ):
+        self.lease = lease
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.renew_interval = renew_interval
+        self._is_leader = False
+        # 最後に更新できたリースの期限（time.monotonic基準）
+        self._held_until = 0.0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def step(self):
+        """リースを1回取得・更新し、状態が変われば切り替える"""
+        attempted_at = time.monotonic()
+        try:
+            held = self.lease.try_acquire()
+        except SQLAlchemyError as e:
+            logger.warning(f"Leader lease renewal failed: {e}")
+            # DBに届かない間は、取得済みの期限まで（更新1回分の余裕を残して）リーダーを続ける
+            held = self._is_leader and attempted_at + self.renew_interval < self._held_until
+        else:
+            if held:
+                self._held_until = attempted_at + self.lease.lease_seconds
+
+        if held and not self._is_leader:
+            logger.info(f"Acquired scheduler lease as {self.lease.holder}")
+            try:
+                self.lease.mark_acquired()
+            except SQLAlchemyError:
+                pass
+            try:
+                self.on_elected()
+            except Exception:
+                # スケジューラーが動いていないのにリースを持ち続けないよう、手放して次のstepで再試行する
+                self._abandon()
+                raise
+            self._is_leader = True
+        elif not held and self._is_leader:
+            logger.warning(f"Lost scheduler lease as {self.lease.holder}")
+            self._is_leader = False
+            self.on_demoted()
+
+    def start(self):
+        """選出スレッドを開始"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader-elector", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """選出を止め、リーダーならスケジューラーを止めてリースを手放す"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        if self._is_leader:
+            self._is_leader = False
+            self.on_demoted()
+            try:
+                self.lease.release()
+            except SQLAlchemyError as e:
+                logger.warning(f"Failed to release scheduler lease: {e}")
+
+    def _abandon(self):
+        """開始に失敗したスケジューラーの途中まで起動した分を止め、リースを手放す"""
+        self._held_until = 0.0
+        try:
+            self.on_demoted()
+        except Exception as e:
+            logger.warning(f"Failed to clean up after scheduler start failure: {e}")
+        try:
+            self.lease.release()
+        except SQLAlchemyError as e:
+            logger.warning(f"Failed to release scheduler lease: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                logger.error(f"Leader election error: {e}")
+            self._stop.wait(self.renew_interval)
@@ -0,0 +1,160 @@
+"""
+ログのストリーミングエクスポート
+コメント/DM/アプリケーションイベントのログをCSV / NDJSONで1チャンクずつ書き出す
+
+- ORMオブジェクトやPydanticモデルを作らず、必要な列だけをSELECTしてタプルのまま変換する
+- yield_perでサーバーサイドカーソルから一定件数ずつ読み、読んだ分だけエンコードして返す
+  （件数に関係なくメモリ使用量は一定で、最初のチャンクはすぐに送り始められる）
+- 並びはIDの昇順（主キーを辿るだけでソートが発生しない）
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, timezone
+from typing import Callable, Iterator, NamedTuple
+
+from sqlalchemy import Select, select
+from sqlalchemy.orm import Session
+
+from app.models import AppEventLog, CommentLog, DMLog
+
+EXPORT_FORMAT_CSV = "csv"
+EXPORT_FORMAT_NDJSON = "ndjson"
+
+EXPORT_MEDIA_TYPES = {
+    EXPORT_FORMAT_CSV: "text/csv; charset=utf-8",
+    EXPORT_FORMAT_NDJSON: "application/x-ndjson",
+}
+
+
+class ExportSpec(NamedTuple):
+    """エクスポート対象のテーブルと出力する列"""
+    name: str
+    model: type
+    columns: tuple[str, ...]
+
+
+COMMENT_LOG_EXPORT = ExportSpec(
+    "comment_logs",
+    CommentLog,
+    (
+        "id", "ig_account_id", "instagram_comment_id", "instagram_user_id", "media_id",
+        "text", "replied", "used_rule_id", "created_at", "replied_at",
+    ),
+)
+DM_LOG_EXPORT = ExportSpec(
+    "dm_logs",
+    DMLog,
+    (
+        "id", "ig_account_id", "instagram_user_id", "thread_id", "message_id", "direction",
+        "text", "replied", "used_rule_id", "created_at", "replied_at",
+    ),
+)
+APP_EVENT_EXPORT = ExportSpec(
+    "app_events",
+    AppEventLog,
+    ("id", "level", "source", "event_type", "message", "meta", "created_at"),
+)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """DBの日時（タイムゾーンなしのUTC）と比較できる形に変換"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def build_export_query(
+    spec: ExportSpec,
+    *,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    filters: tuple = (),
+) -> Select:
+    """
+    エクスポート用のSELECT文を作成
+
+    Args:
+        start: この日時以降（含む）のログ
+        end: この日時より前（含まない）のログ
+        filters: 追加の絞り込み条件
+    """
+    model = spec.model
+    query = select(*(getattr(model, column) for column in spec.columns))
+    if start is not None:
+        query = query.where(model.created_at >= _naive_utc(start))
+    if end is not None:
+        query = query.where(model.created_at < _naive_utc(end))
+    if filters:
+        query = query.where(*filters)
+    return query.order_by(model.id.asc())
+
+
+def _format_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(columns: tuple[str, ...]) -> tuple[bytes, Callable[[list], bytes]]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    def take() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    # Excelで文字化けしないようにBOMを付ける
+    writer.writerow(columns)
+    header = "\ufeff".encode("utf-8") + take()
+
+    def encode(rows: list) -> bytes:
+        writer.writerows(
+            ["" if value is None else _format_value(value) for value in row] for row in rows
+        )
+        return take()
+
+    return header, encode
+
+
+def _encode_ndjson(columns: tuple[str, ...]) -> tuple[bytes, Callable[[list], bytes]]:
+    def encode(rows: list) -> bytes:
+        return "".join(
+            json.dumps(
+                {column: _format_value(value) for column, value in zip(columns, row)},
+                ensure_ascii=False,
+            ) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+    return b"", encode
+
+
+def iter_export_chunks(
+    session_factory: Callable[[], Session],
+    spec: ExportSpec,
+    query: Select,
+    fmt: str,
+    *,
+    yield_per: int = 1000,
+) -> Iterator[bytes]:
+    """
+    クエリ結果をyield_per件ごとにエンコードして返す
+
+    セッションはこのジェネレーターの中で開いて閉じる（レスポンスを送り終わるまで使うため、
+    リクエストの依存性で渡されるセッションは使わない）。
+    """
+    encoders = {EXPORT_FORMAT_CSV: _encode_csv, EXPORT_FORMAT_NDJSON: _encode_ndjson}
+    header, encode = encoders[fmt](spec.columns)
+    if header:
+        yield header
+
+    db = session_factory()
+    try:
+        result = db.execute(query.execution_options(yield_per=yield_per))
+        for rows in result.partitions():
+            yield encode(rows)
+    finally:
+        db.close()
@@ -1,31 +1,59 @@
 """
 FastAPIメインアプリケーション
 """
+import codecs
+import io
 import json
-from datetime import datetime, timezone
+import tempfile
+import time
+from datetime import date, datetime, timezone
 from typing import List, Optional
 from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import or_, and_
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 
-from app.db import Base, engine, get_db
+from app.db import engine, get_db, get_read_db, ReadSessionLocal
+from app.migrations import run_migrations
 from app.config import settings
 from app.logging_config import setup_logging
 from app.models import (
     IGAccount, ScheduledPost, CommentReplyRule, CommentLog,
-    DMReplyRule, DMLog, UserConversation, MessageTemplate, AppEventLog
+    DMReplyRule, DMLog, UserConversation, MessageTemplate, AppEventLog,
+    LogDailyStat, RuleDailyHit
 )
-from app.meta_client import (
-    reply_to_comment, send_instagram_dm, MetaAPIError
+from app.meta_client import close_sync_client
+from app.log_export import (
+    EXPORT_FORMAT_CSV, EXPORT_FORMAT_NDJSON, EXPORT_MEDIA_TYPES, ExportSpec,
+    COMMENT_LOG_EXPORT, DM_LOG_EXPORT, APP_EVENT_EXPORT, build_export_query, iter_export_chunks
 )
-from app.dm_utils import get_or_create_conversation, can_auto_reply
-from app.utils_logging import log_event
+from app.metrics import registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.dm_utils import can_auto_reply
+from app.dashboard_counters import bump_counters, read_dashboard_counters
+from app.post_import import (
+    BULK_FORMAT_CSV, BULK_FORMAT_JSONL, validate_post_media, iter_rows, import_posts
+)
+from app.rule_matcher import comment_rule_cache, dm_rule_cache, invalidate_rule_caches
+from app.templating import TemplateContext, TemplateSyntaxError, compile_template
 from app.enums import (
     PostStatus, PostType, MediaType, InboxStatus,
     MessageTemplateKind
 )
-from app.scheduler import start_scheduler
+from app.scheduler import (
+    start_scheduler_service, stop_scheduler_service, notify_post_scheduled, notify_post_canceled,
+    notify_posts_scheduled
+)
+from app.utils_logging import stop_event_log_writer
+from app.webhook_queue import (
+    enqueue_webhook_events, start_webhook_consumers, stop_webhook_consumers,
+    WEBHOOK_STAGE_SECONDS
+)
+from app.webhook_processor import (
+    parse_comment_events, parse_dm_events, EVENT_KIND_COMMENT, EVENT_KIND_DM
+)
 
 # ログ設定
 setup_logging()
@@ -63,8 +91,19 @@ if settings.DEBUG:
 # 起動時にDBテーブル作成とスケジューラー開始
 @app.on_event("startup")
 async def startup_event():
-    Base.metadata.create_all(bind=engine)
-    start_scheduler()
+    run_migrations(engine)
+    start_scheduler_service()
+    start_webhook_consumers()
+
+
+# 終了時にWebhookワーカーとスケジューラーを止め、
+# Graph APIのコネクションプールを閉じてイベントログを書き切る
+@app.on_event("shutdown")
+async def shutdown_event():
+    stop_webhook_consumers()
+    stop_scheduler_service()
+    close_sync_client()
+    stop_event_log_writer()
 
 
 # ==================== Pydantic Schemas ====================
@@ -121,6 +160,12 @@ class MessageTemplateCreate(BaseModel):
     body: str
 
 
+class MessageTemplateUpdate(BaseModel):
+    name: Optional[str] = None
+    body: Optional[str] = None
+    is_active: Optional[int] = None
+
+
 class MessageTemplateRead(BaseModel):
     id: int
     ig_account_id: int
@@ -247,6 +292,28 @@ class AppEventLogRead(BaseModel):
         from_attributes = True
 
 
+class LogDailyStatRead(BaseModel):
+    day: date
+    ig_account_id: int
+    kind: str
+    received: int
+    replied: int
+    
+    class Config:
+        from_attributes = True
+
+
+class RuleDailyHitRead(BaseModel):
+    day: date
+    ig_account_id: int
+    kind: str
+    rule_id: int
+    hits: int
+    
+    class Config:
+        from_attributes = True
+
+
 class DashboardSummary(BaseModel):
     total_accounts: int
     active_accounts: int
@@ -267,6 +334,19 @@ class CalendarPost(BaseModel):
         from_attributes = True
 
 
+class BulkImportError(BaseModel):
+    row: int
+    error: str
+
+
+class BulkImportResult(BaseModel):
+    total: int
+    created: int
+    failed: int
+    errors: List[BulkImportError]
+    errors_truncated: bool
+
+
 class ReschedulePayload(BaseModel):
     scheduled_at: datetime
 
@@ -277,6 +357,7 @@ class RuleOrderUpdate(BaseModel):
 
 class RuleTestRequest(BaseModel):
     text: str
+    username: Optional[str] = None  # テンプレートの{username}に差し込む値
 
 
 class RuleTestResult(BaseModel):
@@ -284,6 +365,7 @@ class RuleTestResult(BaseModel):
     rule_id: Optional[int]
     rule_keyword: Optional[str]
     reply_text: Optional[str]
+    rendered_text: Optional[str] = None  # 変数を差し込んだ返信テキストの例
 
 
 # ==================== API Endpoints ====================
@@ -300,6 +382,12 @@ def create_account(account: IGAccountCreate, db: Session = Depends(get_db)):
     """アカウント作成"""
     db_account = IGAccount(**account.dict())
     db.add(db_account)
+    db.flush()
+    bump_counters(
+        db,
+        total_accounts=1,
+        active_accounts=1 if db_account.is_active == 1 else 0,
+    )
     db.commit()
     db.refresh(db_account)
     return db_account
@@ -320,8 +408,14 @@ def delete_account(account_id: int, db: Session = Depends(get_db)):
     account = db.query(IGAccount).filter(IGAccount.id == account_id).first()
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
+    bump_counters(
+        db,
+        total_accounts=-1,
+        active_accounts=-1 if account.is_active == 1 else 0,
+    )
     db.delete(account)
     db.commit()
+    invalidate_rule_caches(account_id)
     return {"status": "ok"}
 
 
@@ -330,42 +424,92 @@ def delete_account(account_id: int, db: Session = Depends(get_db)):
 def create_post(post: ScheduledPostCreate, db: Session = Depends(get_db)):
     """予約投稿作成"""
     # バリデーション
-    if post.post_type == PostType.REEL:
-        if not post.video_url:
-            raise HTTPException(
-                status_code=400,
-                detail="video_url is required for reel posts"
-            )
-    elif post.post_type == PostType.STORY:
-        if post.media_type == MediaType.IMAGE and not post.image_url:
-            raise HTTPException(
-                status_code=400,
-                detail="image_url is required for story image"
-            )
-        elif post.media_type == MediaType.VIDEO and not post.video_url:
-            raise HTTPException(
-                status_code=400,
-                detail="video_url is required for story video"
-            )
-    elif post.post_type == PostType.FEED:
-        if post.media_type == MediaType.IMAGE and not post.image_url:
-            raise HTTPException(
-                status_code=400,
-                detail="image_url is required for feed image"
-            )
-        elif post.media_type == MediaType.VIDEO and not post.video_url:
-            raise HTTPException(
-                status_code=400,
-                detail="video_url is required for feed video"
-            )
+    error = validate_post_media(post.post_type, post.media_type, post.image_url, post.video_url)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
     
     db_post = ScheduledPost(**post.dict(), status=PostStatus.PENDING)
     db.add(db_post)
+    bump_counters(db, pending_posts=1)
     db.commit()
     db.refresh(db_post)
+    notify_post_scheduled(db_post.id, db_post.scheduled_at)
     return db_post
 
 
+@app.post("/posts/bulk", response_model=BulkImportResult)
+async def bulk_create_posts(
+    request: Request,
+    format: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    予約投稿の一括作成（CSV / JSONL）
+    
+    本文はストリームで受け取り、一定サイズを超えたら一時ファイルに退避してから1行ずつ処理する。
+    形式は format クエリ（csv / jsonl）か Content-Type で指定する。
+    """
+    fmt = _bulk_import_format(format, request.headers.get("content-type", ""))
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.BULK_IMPORT_SPOOL_BYTES)
+    try:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        return await run_in_threadpool(_import_spooled_posts, db, spool, fmt)
+    finally:
+        spool.close()
+
+
+def _bulk_import_format(format: Optional[str], content_type: str) -> str:
+    """一括インポートの形式を決定"""
+    if format:
+        if format not in (BULK_FORMAT_CSV, BULK_FORMAT_JSONL):
+            raise HTTPException(status_code=400, detail="format must be csv or jsonl")
+        return format
+    if "csv" in content_type:
+        return BULK_FORMAT_CSV
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return BULK_FORMAT_JSONL
+    raise HTTPException(
+        status_code=415,
+        detail="Use text/csv or application/x-ndjson, or pass ?format=csv|jsonl",
+    )
+
+
+def _import_spooled_posts(db: Session, spool, fmt: str) -> dict:
+    """一時ファイルに退避した本文をインポート（スレッドプールで実行）"""
+    # チャンクごとにコミットするため、途中で失敗して一部だけ登録されないよう先に全体を検証する
+    if not _is_utf8(spool):
+        raise HTTPException(status_code=400, detail="Body must be UTF-8")
+    stream = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    try:
+        return import_posts(
+            db,
+            iter_rows(stream, fmt),
+            chunk_size=settings.BULK_IMPORT_CHUNK_SIZE,
+            max_errors=settings.BULK_IMPORT_MAX_ERRORS,
+            on_inserted=notify_posts_scheduled,
+        )
+    finally:
+        # spool自体は呼び出し側で閉じる
+        stream.detach()
+
+
+def _is_utf8(spool, block_size: int = 1024 * 1024) -> bool:
+    """一時ファイル全体がUTF-8として読めるか（読み終えたら先頭に戻す）"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while True:
+            block = spool.read(block_size)
+            decoder.decode(block, final=not block)
+            if not block:
+                return True
+    except UnicodeDecodeError:
+        return False
+    finally:
+        spool.seek(0)
+
+
 @app.get("/posts", response_model=List[ScheduledPostRead])
 def list_posts(
     account_id: Optional[int] = None,
@@ -401,9 +545,12 @@ def delete_post(post_id: int, db: Session = Depends(get_db)):
             status_code=400,
             detail="Cannot delete already posted item"
         )
+    if post.status == PostStatus.PENDING:
+        bump_counters(db, pending_posts=-1)
     post.status = PostStatus.CANCELED
     db.add(post)
     db.commit()
+    notify_post_canceled(post_id)
     return {"status": "ok"}
 
 
@@ -413,7 +560,7 @@ def get_calendar_posts(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     account_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """カレンダー表示用の投稿一覧"""
     query = db.query(ScheduledPost, IGAccount.name).join(
@@ -458,11 +605,23 @@ def reschedule_post(
         )
     
     post.scheduled_at = payload.scheduled_at
+    post.next_attempt_at = None  # 再キュー中の投稿も新しい予約時刻に従う
     db.add(post)
     db.commit()
+    if post.status == PostStatus.PENDING:
+        notify_post_scheduled(post.id, post.scheduled_at)
     return {"status": "ok"}
 
 
+# --- 返信テキストの書式 ---
+def _validate_template_body(body: str):
+    """テンプレートの書式を検証（閉じていない候補グループなどは400）"""
+    try:
+        compile_template(body)
+    except TemplateSyntaxError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid template: {e}")
+
+
 # --- コメント自動返信ルール ---
 @app.get("/comment-rules", response_model=List[CommentReplyRuleRead])
 def list_comment_rules(
@@ -482,10 +641,12 @@ def create_comment_rule(
     db: Session = Depends(get_db),
 ):
     """コメント返信ルール作成"""
+    _validate_template_body(rule.reply_text)
     db_rule = CommentReplyRule(**rule.dict())
     db.add(db_rule)
     db.commit()
     db.refresh(db_rule)
+    comment_rule_cache.invalidate(db_rule.ig_account_id)
     return db_rule
 
 
@@ -495,6 +656,7 @@ def reorder_comment_rules(
     db: Session = Depends(get_db),
 ):
     """コメント返信ルールの優先度を更新"""
+    account_ids = set()
     for priority, rule_id in enumerate(payload.rule_ids, start=1):
         rule = db.query(CommentReplyRule).filter(
             CommentReplyRule.id == rule_id
@@ -502,7 +664,10 @@ def reorder_comment_rules(
         if rule:
             rule.priority = priority
             db.add(rule)
+            account_ids.add(rule.ig_account_id)
     db.commit()
+    for account_id in account_ids:
+        comment_rule_cache.invalidate(account_id)
     return {"status": "ok"}
 
 
@@ -513,33 +678,18 @@ def test_comment_rule(
     db: Session = Depends(get_db),
 ):
     """コメント返信ルールのテスト"""
-    rules = (
-        db.query(CommentReplyRule)
-        .filter(
-            CommentReplyRule.ig_account_id == account_id,
-            CommentReplyRule.is_active == 1,
-        )
-        .order_by(CommentReplyRule.priority.asc())
-        .all()
-    )
-    
-    matched_rule = None
-    lower_text = request.text.lower()
-    for rule in rules:
-        if rule.keyword.lower() in lower_text:
-            matched_rule = rule
-            break
+    matched_rule = comment_rule_cache.get(db, account_id).match(request.text)
     
     if matched_rule:
-        reply_text = matched_rule.reply_text
-        if matched_rule.template and matched_rule.template.is_active == 1:
-            reply_text = matched_rule.template.body
-        
         return RuleTestResult(
             matched=True,
             rule_id=matched_rule.id,
             rule_keyword=matched_rule.keyword,
-            reply_text=reply_text,
+            reply_text=matched_rule.reply_text,
+            rendered_text=matched_rule.template.render(TemplateContext(
+                username=request.username,
+                now=datetime.now(timezone.utc),
+            )),
         )
     else:
         return RuleTestResult(
@@ -569,10 +719,12 @@ def create_dm_rule(
     db: Session = Depends(get_db),
 ):
     """DM返信ルール作成"""
+    _validate_template_body(rule.reply_text)
     db_rule = DMReplyRule(**rule.dict())
     db.add(db_rule)
     db.commit()
     db.refresh(db_rule)
+    dm_rule_cache.invalidate(db_rule.ig_account_id)
     return db_rule
 
 
@@ -582,12 +734,16 @@ def reorder_dm_rules(
     db: Session = Depends(get_db),
 ):
     """DM返信ルールの優先度を更新"""
+    account_ids = set()
     for priority, rule_id in enumerate(payload.rule_ids, start=1):
         rule = db.query(DMReplyRule).filter(DMReplyRule.id == rule_id).first()
         if rule:
             rule.priority = priority
             db.add(rule)
+            account_ids.add(rule.ig_account_id)
     db.commit()
+    for account_id in account_ids:
+        dm_rule_cache.invalidate(account_id)
     return {"status": "ok"}
 
 
@@ -598,33 +754,18 @@ def test_dm_rule(
     db: Session = Depends(get_db),
 ):
     """DM返信ルールのテスト"""
-    rules = (
-        db.query(DMReplyRule)
-        .filter(
-            DMReplyRule.ig_account_id == account_id,
-            DMReplyRule.is_active == 1,
-        )
-        .order_by(DMReplyRule.priority.asc())
-        .all()
-    )
-    
-    matched_rule = None
-    lower_text = request.text.lower()
-    for rule in rules:
-        if rule.keyword.lower() in lower_text:
-            matched_rule = rule
-            break
+    matched_rule = dm_rule_cache.get(db, account_id).match(request.text)
     
     if matched_rule:
-        reply_text = matched_rule.reply_text
-        if matched_rule.template and matched_rule.template.is_active == 1:
-            reply_text = matched_rule.template.body
-        
         return RuleTestResult(
             matched=True,
             rule_id=matched_rule.id,
             rule_keyword=matched_rule.keyword,
-            reply_text=reply_text,
+            reply_text=matched_rule.reply_text,
+            rendered_text=matched_rule.template.render(TemplateContext(
+                username=request.username,
+                now=datetime.now(timezone.utc),
+            )),
         )
     else:
         return RuleTestResult(
@@ -657,6 +798,7 @@ def create_template(
     db: Session = Depends(get_db),
 ):
     """テンプレート作成"""
+    _validate_template_body(template.body)
     db_template = MessageTemplate(**template.dict())
     db.add(db_template)
     db.commit()
@@ -675,6 +817,30 @@ def get_template(template_id: int, db: Session = Depends(get_db)):
     return template
 
 
+@app.patch("/templates/{template_id}", response_model=MessageTemplateRead)
+def update_template(
+    template_id: int,
+    payload: MessageTemplateUpdate,
+    db: Session = Depends(get_db),
+):
+    """テンプレート更新（このテンプレートを使うルールのキャッシュを作り直す）"""
+    template = db.query(MessageTemplate).filter(
+        MessageTemplate.id == template_id
+    ).first()
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    values = payload.dict(exclude_unset=True)
+    if values.get("body") is not None:
+        _validate_template_body(values["body"])
+    for field, value in values.items():
+        if value is not None:
+            setattr(template, field, value)
+    db.commit()
+    db.refresh(template)
+    invalidate_rule_caches(template.ig_account_id)
+    return template
+
+
 @app.delete("/templates/{template_id}")
 def delete_template(template_id: int, db: Session = Depends(get_db)):
     """テンプレート削除"""
@@ -683,23 +849,91 @@ def delete_template(template_id: int, db: Session = Depends(get_db)):
     ).first()
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
+    account_id = template.ig_account_id
     db.delete(template)
     db.commit()
+    invalidate_rule_caches(account_id)
     return {"status": "ok"}
 
 
+# --- 一覧のページング ---
+def apply_keyset(query, model, before_created_at: Optional[datetime], before_id: Optional[int]):
+    """
+    キーセットページング（created_at, idの降順）
+    
+    前ページの最後の要素のcreated_atとidを渡すと、その続きを返す。
+    OFFSETと違い、深いページでも読み飛ばしが発生しない。
+    """
+    if before_created_at is not None and before_id is not None:
+        query = query.filter(
+            or_(
+                model.created_at < before_created_at,
+                and_(model.created_at == before_created_at, model.id < before_id),
+            )
+        )
+    elif before_id is not None:
+        query = query.filter(model.id < before_id)
+    return query.order_by(model.created_at.desc(), model.id.desc())
+
+
 # --- コメントログ ---
 @app.get("/comment-logs", response_model=List[CommentLogRead])
 def list_comment_logs(
     account_id: Optional[int] = None,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    before_created_at: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_read_db),
 ):
-    """コメントログ一覧"""
+    """コメントログ一覧（before_created_at/before_idで続きを取得）"""
     query = db.query(CommentLog)
     if account_id:
         query = query.filter(CommentLog.ig_account_id == account_id)
-    return query.order_by(CommentLog.created_at.desc()).limit(limit).all()
+    query = apply_keyset(query, CommentLog, before_created_at, before_id)
+    return query.limit(limit).all()
+
+
+# --- 日次集計（保持期間を過ぎて削除したログの履歴） ---
+@app.get("/stats/daily", response_model=List[LogDailyStatRead])
+def list_daily_stats(
+    account_id: Optional[int] = None,
+    kind: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(get_read_db),
+):
+    """コメント/DMの日次集計（受信数・自動返信数）"""
+    query = db.query(LogDailyStat)
+    if account_id:
+        query = query.filter(LogDailyStat.ig_account_id == account_id)
+    if kind:
+        query = query.filter(LogDailyStat.kind == kind)
+    if start:
+        query = query.filter(LogDailyStat.day >= start)
+    if end:
+        query = query.filter(LogDailyStat.day <= end)
+    return query.order_by(LogDailyStat.day.asc(), LogDailyStat.ig_account_id.asc()).all()
+
+
+@app.get("/stats/rule-hits", response_model=List[RuleDailyHitRead])
+def list_rule_daily_hits(
+    account_id: Optional[int] = None,
+    kind: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(get_read_db),
+):
+    """自動返信ルールの日次ヒット数"""
+    query = db.query(RuleDailyHit)
+    if account_id:
+        query = query.filter(RuleDailyHit.ig_account_id == account_id)
+    if kind:
+        query = query.filter(RuleDailyHit.kind == kind)
+    if start:
+        query = query.filter(RuleDailyHit.day >= start)
+    if end:
+        query = query.filter(RuleDailyHit.day <= end)
+    return query.order_by(RuleDailyHit.day.asc(), RuleDailyHit.rule_id.asc()).all()
 
 
 # --- インボックス（コメント） ---
@@ -707,9 +941,12 @@ def list_comment_logs(
 def get_comment_inbox(
     account_id: Optional[int] = None,
     status: Optional[str] = None,
-    db: Session = Depends(get_db),
+    limit: int = 100,
+    before_created_at: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_read_db),
 ):
-    """コメントインボックス取得"""
+    """コメントインボックス取得（before_created_at/before_idで続きを取得）"""
     query = (
         db.query(CommentLog, IGAccount.name)
         .join(IGAccount, CommentLog.ig_account_id == IGAccount.id)
@@ -723,7 +960,8 @@ def get_comment_inbox(
         elif status == InboxStatus.AUTO_REPLIED:
             query = query.filter(CommentLog.replied == 1)
     
-    results = query.order_by(CommentLog.created_at.desc()).limit(100).all()
+    query = apply_keyset(query, CommentLog, before_created_at, before_id)
+    results = query.limit(limit).all()
     
     return [
         CommentInboxItem(
@@ -744,9 +982,12 @@ def get_comment_inbox(
 def get_dm_inbox(
     account_id: Optional[int] = None,
     status: Optional[str] = None,
-    db: Session = Depends(get_db),
+    limit: int = 100,
+    before_created_at: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_read_db),
 ):
-    """DMインボックス取得"""
+    """DMインボックス取得（before_created_at/before_idで続きを取得）"""
     query = (
         db.query(DMLog, IGAccount.name)
         .join(IGAccount, DMLog.ig_account_id == IGAccount.id)
@@ -761,7 +1002,8 @@ def get_dm_inbox(
         elif status == InboxStatus.AUTO_REPLIED:
             query = query.filter(DMLog.replied == 1)
     
-    results = query.order_by(DMLog.created_at.desc()).limit(100).all()
+    query = apply_keyset(query, DMLog, before_created_at, before_id)
+    results = query.limit(limit).all()
     
     inbox_items = []
     for log, name in results:
@@ -784,36 +1026,18 @@ def get_dm_inbox(
 
 # --- ダッシュボード ---
 @app.get("/dashboard/summary", response_model=DashboardSummary)
-def get_dashboard_summary(db: Session = Depends(get_db)):
-    """ダッシュボードサマリー取得"""
-    now = datetime.now(timezone.utc)
-    today_start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
-    
-    total_accounts = db.query(IGAccount).count()
-    active_accounts = db.query(IGAccount).filter(IGAccount.is_active == 1).count()
-    pending_posts = db.query(ScheduledPost).filter(
-        ScheduledPost.status == PostStatus.PENDING
-    ).count()
-    today_posts = db.query(ScheduledPost).filter(
-        ScheduledPost.scheduled_at >= today_start,
-        ScheduledPost.status == PostStatus.PENDING,
-    ).count()
-    unhandled_comments = db.query(CommentLog).filter(
-        CommentLog.replied == 0
-    ).count()
-    unhandled_dms = db.query(DMLog).filter(
-        DMLog.direction == "in",
-        DMLog.replied == 0,
-    ).count()
-    
-    return DashboardSummary(
-        total_accounts=total_accounts,
-        active_accounts=active_accounts,
-        pending_posts=pending_posts,
-        today_posts=today_posts,
-        unhandled_comments=unhandled_comments,
-        unhandled_dms=unhandled_dms,
-    )
+def get_dashboard_summary(db: Session = Depends(get_read_db)):
+    """ダッシュボードサマリー取得（集計カウンターを読むだけで全件数は数えない）"""
+    return DashboardSummary(**read_dashboard_counters(db))
+
+
+# --- メトリクス ---
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """プロセス内メトリクスをPrometheusのテキスト形式で返す（DBには書き込まない）"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 
 # --- アプリケーションイベントログ ---
@@ -822,15 +1046,82 @@ def list_app_event_logs(
     level: Optional[str] = None,
     source: Optional[str] = None,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    before_created_at: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_read_db),
 ):
-    """アプリケーションイベントログ一覧"""
+    """アプリケーションイベントログ一覧（before_created_at/before_idで続きを取得）"""
     query = db.query(AppEventLog)
     if level:
         query = query.filter(AppEventLog.level == level.upper())
     if source:
         query = query.filter(AppEventLog.source == source)
-    return query.order_by(AppEventLog.created_at.desc()).limit(limit).all()
+    query = apply_keyset(query, AppEventLog, before_created_at, before_id)
+    return query.limit(limit).all()
+
+
+# --- ログのエクスポート（ストリーミング） ---
+def _export_response(spec: ExportSpec, query, format: str) -> StreamingResponse:
+    """クエリ結果をCSV / NDJSONでストリーミング返却"""
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    extension = "csv" if format == EXPORT_FORMAT_CSV else "ndjson"
+    return StreamingResponse(
+        iter_export_chunks(
+            ReadSessionLocal, spec, query, format, yield_per=settings.EXPORT_YIELD_PER
+        ),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{spec.name}.{extension}"'},
+    )
+
+
+@app.get("/export/comment-logs")
+def export_comment_logs(
+    format: str = EXPORT_FORMAT_CSV,
+    account_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """コメントログのエクスポート（start以上end未満、ID順）"""
+    filters = (CommentLog.ig_account_id == account_id,) if account_id else ()
+    query = build_export_query(COMMENT_LOG_EXPORT, start=start, end=end, filters=filters)
+    return _export_response(COMMENT_LOG_EXPORT, query, format)
+
+
+@app.get("/export/dm-logs")
+def export_dm_logs(
+    format: str = EXPORT_FORMAT_CSV,
+    account_id: Optional[int] = None,
+    direction: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """DMログのエクスポート（start以上end未満、ID順）"""
+    filters = []
+    if account_id:
+        filters.append(DMLog.ig_account_id == account_id)
+    if direction:
+        filters.append(DMLog.direction == direction)
+    query = build_export_query(DM_LOG_EXPORT, start=start, end=end, filters=tuple(filters))
+    return _export_response(DM_LOG_EXPORT, query, format)
+
+
+@app.get("/export/app-events")
+def export_app_events(
+    format: str = EXPORT_FORMAT_NDJSON,
+    level: Optional[str] = None,
+    source: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """アプリケーションイベントログのエクスポート（start以上end未満、ID順）"""
+    filters = []
+    if level:
+        filters.append(AppEventLog.level == level.upper())
+    if source:
+        filters.append(AppEventLog.source == source)
+    query = build_export_query(APP_EVENT_EXPORT, start=start, end=end, filters=tuple(filters))
+    return _export_response(APP_EVENT_EXPORT, query, format)
 
 
 # --- Webhook: Instagram コメント ---
@@ -848,375 +1139,37 @@ def verify_webhook(request: Request):
 
 @app.post("/webhook/instagram")
 async def handle_instagram_comments(request: Request):
-    """InstagramコメントWebhook処理"""
-    payload = await request.json()
-    db: Session = SessionLocal()
-    
-    try:
-        entries = payload.get("entry", [])
-        for entry in entries:
-            changes = entry.get("changes", [])
-            for change in changes:
-                value = change.get("value", {})
-                field = change.get("field")
-                
-                if field != "comments":
-                    continue
-                
-                # Webhookペイロードの構造は実際のMeta APIに合わせて調整が必要
-                # 以下は一般的な構造の例
-                comment_id = value.get("id")
-                text = value.get("text")
-                from_user = value.get("from", {})
-                instagram_user_id = from_user.get("id")
-                media_id = value.get("media", {}).get("id")
-                
-                # ig_user_idを取得（アカウント特定用）
-                # 実際のWebhookペイロード構造に応じて調整
-                ig_user_id = entry.get("id")  # または適切なフィールド
-                
-                if not comment_id or not ig_user_id:
-                    log_event(
-                        db,
-                        level="WARN",
-                        source="webhook_comment",
-                        event_type="comment_parse_failed",
-                        message="Missing comment_id or ig_user_id in webhook",
-                        meta={"payload_snippet": str(payload)[:200]},
-                    )
-                    continue
-                
-                account = db.query(IGAccount).filter(
-                    IGAccount.ig_user_id == ig_user_id
-                ).first()
-                
-                if not account:
-                    log_event(
-                        db,
-                        level="WARN",
-                        source="webhook_comment",
-                        event_type="comment_account_not_found",
-                        message=f"IGAccount not found for ig_user_id: {ig_user_id}",
-                        meta={"comment_id": comment_id},
-                    )
-                    continue
-                
-                # 重複チェック
-                existing = db.query(CommentLog).filter(
-                    CommentLog.instagram_comment_id == comment_id
-                ).first()
-                
-                if existing:
-                    log_event(
-                        db,
-                        level="DEBUG",
-                        source="webhook_comment",
-                        event_type="comment_duplicate",
-                        message="Duplicate comment webhook ignored",
-                        meta={"comment_id": comment_id},
-                    )
-                    continue
-                
-                # コメントログ保存
-                log = CommentLog(
-                    ig_account_id=account.id,
-                    instagram_comment_id=comment_id,
-                    instagram_user_id=instagram_user_id,
-                    media_id=media_id,
-                    text=text,
-                )
-                db.add(log)
-                db.commit()
-                db.refresh(log)
-                
-                log_event(
-                    db,
-                    level="INFO",
-                    source="webhook_comment",
-                    event_type="comment_received",
-                    message="Comment received and logged",
-                    meta={
-                        "comment_log_id": log.id,
-                        "comment_id": comment_id,
-                        "text_preview": (text or "")[:50],
-                    },
-                )
-                
-                # 自動返信ルール適用
-                rules = (
-                    db.query(CommentReplyRule)
-                    .filter(
-                        CommentReplyRule.ig_account_id == account.id,
-                        CommentReplyRule.is_active == 1,
-                    )
-                    .order_by(CommentReplyRule.priority.asc())
-                    .all()
-                )
-                
-                matched_rule = None
-                lower_text = (text or "").lower()
-                for rule in rules:
-                    if rule.keyword.lower() in lower_text:
-                        matched_rule = rule
-                        break
-                
-                if not matched_rule:
-                    log_event(
-                        db,
-                        level="DEBUG",
-                        source="webhook_comment",
-                        event_type="comment_no_rule_match",
-                        message="No comment reply rule matched",
-                        meta={"comment_log_id": log.id},
-                    )
-                    continue
-                
-                # 返信テキスト決定
-                reply_text = matched_rule.reply_text
-                if matched_rule.template and matched_rule.template.is_active == 1:
-                    reply_text = matched_rule.template.body
-                
-                # コメント返信
-                try:
-                    reply_id = reply_to_comment(
-                        comment_id=comment_id,
-                        message=reply_text,
-                        access_token=account.access_token,
-                    )
-                    
-                    now_utc = datetime.now(timezone.utc)
-                    log.replied = 1
-                    log.used_rule_id = matched_rule.id
-                    log.replied_at = now_utc
-                    db.add(log)
-                    db.commit()
-                    
-                    log_event(
-                        db,
-                        level="INFO",
-                        source="webhook_comment",
-                        event_type="comment_auto_replied",
-                        message="Comment auto-replied successfully",
-                        meta={
-                            "comment_log_id": log.id,
-                            "rule_id": matched_rule.id,
-                            "reply_id": reply_id,
-                        },
-                    )
-                except Exception as e:
-                    log_event(
-                        db,
-                        level="ERROR",
-                        source="webhook_comment",
-                        event_type="comment_auto_reply_failed",
-                        message=f"Failed to auto-reply to comment: {e}",
-                        meta={
-                            "comment_log_id": log.id,
-                            "error": str(e),
-                        },
-                    )
-                    db.add(log)
-                    db.commit()
-        
-        return {"status": "ok"}
-    
-    finally:
-        db.close()
+    """InstagramコメントWebhook受信（キューに保存して即座に応答）"""
+    started = time.perf_counter()
+    payload = await _read_webhook_payload(request)
+    events = parse_comment_events(payload)
+    await run_in_threadpool(enqueue_webhook_events, events)
+    WEBHOOK_STAGE_SECONDS.observe(
+        time.perf_counter() - started, kind=EVENT_KIND_COMMENT, stage="receive"
+    )
+    return {"status": "ok"}
 
 
 # --- Webhook: Instagram DM ---
 @app.post("/webhook/instagram-messages")
 async def handle_instagram_messages(request: Request):
-    """Instagram DM Webhook処理"""
-    payload = await request.json()
-    db: Session = SessionLocal()
-    
-    try:
-        entries = payload.get("entry", [])
-        for entry in entries:
-            changes = entry.get("changes", [])
-            for change in changes:
-                value = change.get("value", {})
-                field = change.get("field")
-                
-                if field not in ("messages", "instagram_messages"):
-                    continue
-                
-                # Webhookペイロードの構造は実際のMeta APIに合わせて調整が必要
-                to_list = value.get("to", [])
-                ig_user_id = to_list[0].get("id") if to_list else None
-                from_user = value.get("from", {})
-                sender_id = from_user.get("id")
-                message_obj = value.get("message", {})
-                text = message_obj.get("text")
-                message_id = message_obj.get("mid")
-                
-                if not ig_user_id or not sender_id:
-                    log_event(
-                        db,
-                        level="WARN",
-                        source="webhook_dm",
-                        event_type="dm_parse_failed",
-                        message="Missing ig_user_id or sender_id in DM webhook",
-                        meta={"payload_snippet": str(payload)[:200]},
-                    )
-                    continue
-                
-                account = db.query(IGAccount).filter(
-                    IGAccount.ig_user_id == ig_user_id
-                ).first()
-                
-                if not account:
-                    log_event(
-                        db,
-                        level="WARN",
-                        source="webhook_dm",
-                        event_type="dm_account_not_found",
-                        message=f"IGAccount not found for ig_user_id: {ig_user_id}",
-                        meta={"sender_id": sender_id},
-                    )
-                    continue
-                
-                # 会話状態更新
-                now_utc = datetime.now(timezone.utc)
-                conv = get_or_create_conversation(db, account.id, sender_id)
-                conv.last_user_message_at = now_utc
-                conv.is_open = 1
-                db.add(conv)
-                db.commit()
-                
-                log_event(
-                    db,
-                    level="DEBUG",
-                    source="webhook_dm",
-                    event_type="conversation_updated",
-                    message="User conversation updated",
-                    meta={"conv_id": conv.id, "sender_id": sender_id},
-                )
-                
-                # DMログ保存
-                log = DMLog(
-                    ig_account_id=account.id,
-                    instagram_user_id=sender_id,
-                    thread_id=None,  # 必要に応じて取得
-                    message_id=message_id,
-                    direction="in",
-                    text=text,
-                )
-                db.add(log)
-                db.commit()
-                db.refresh(log)
-                
-                log_event(
-                    db,
-                    level="INFO",
-                    source="webhook_dm",
-                    event_type="dm_received",
-                    message="DM received and logged",
-                    meta={
-                        "dm_log_id": log.id,
-                        "sender_id": sender_id,
-                        "text_preview": (text or "")[:50],
-                    },
-                )
-                
-                # 自動返信ルール適用
-                rules = (
-                    db.query(DMReplyRule)
-                    .filter(
-                        DMReplyRule.ig_account_id == account.id,
-                        DMReplyRule.is_active == 1,
-                    )
-                    .order_by(DMReplyRule.priority.asc())
-                    .all()
-                )
-                
-                matched_rule = None
-                lower_text = (text or "").lower()
-                for rule in rules:
-                    if rule.keyword.lower() in lower_text:
-                        matched_rule = rule
-                        break
-                
-                if not matched_rule:
-                    log_event(
-                        db,
-                        level="DEBUG",
-                        source="webhook_dm",
-                        event_type="dm_no_rule_match",
-                        message="No DM reply rule matched",
-                        meta={"dm_log_id": log.id},
-                    )
-                    continue
-                
-                # 24時間ルールチェック
-                if not can_auto_reply(db, account.id, sender_id):
-                    log_event(
-                        db,
-                        level="WARN",
-                        source="webhook_dm",
-                        event_type="dm_auto_reply_blocked_24h",
-                        message="DM auto-reply blocked by 24-hour rule",
-                        meta={"dm_log_id": log.id, "sender_id": sender_id},
-                    )
-                    continue
-                
-                # 返信テキスト決定
-                message_body = matched_rule.reply_text
-                if matched_rule.template and matched_rule.template.is_active == 1:
-                    message_body = matched_rule.template.body
-                
-                # DM送信
-                try:
-                    msg_id = send_instagram_dm(
-                        ig_user_id=account.ig_user_id,
-                        recipient_id=sender_id,
-                        message=message_body,
-                        access_token=account.access_token,
-                    )
-                    
-                    now_utc = datetime.now(timezone.utc)
-                    log.replied = 1
-                    log.used_rule_id = matched_rule.id
-                    log.replied_at = now_utc
-                    db.add(log)
-                    
-                    conv.last_bot_message_at = now_utc
-                    db.add(conv)
-                    db.commit()
-                    
-                    log_event(
-                        db,
-                        level="INFO",
-                        source="webhook_dm",
-                        event_type="dm_auto_replied",
-                        message="DM auto-replied successfully",
-                        meta={
-                            "dm_log_id": log.id,
-                            "sender_id": sender_id,
-                            "rule_id": matched_rule.id,
-                            "out_msg_id": msg_id,
-                        },
-                    )
-                except Exception as e:
-                    log_event(
-                        db,
-                        level="ERROR",
-                        source="webhook_dm",
-                        event_type="dm_auto_reply_failed",
-                        message=f"Failed to auto-reply to DM: {e}",
-                        meta={
-                            "dm_log_id": log.id,
-                            "sender_id": sender_id,
-                            "error": str(e),
-                        },
-                    )
-                    db.add(log)
-                    db.commit()
-        
-        return {"status": "ok"}
-    
-    finally:
-        db.close()
+    """Instagram DM Webhook受信（キューに保存して即座に応答）"""
+    started = time.perf_counter()
+    payload = await _read_webhook_payload(request)
+    events = parse_dm_events(payload)
+    await run_in_threadpool(enqueue_webhook_events, events)
+    WEBHOOK_STAGE_SECONDS.observe(
+        time.perf_counter() - started, kind=EVENT_KIND_DM, stage="receive"
+    )
+    return {"status": "ok"}
 
 
+async def _read_webhook_payload(request: Request) -> dict:
+    """Webhookペイロードを読み込み、最低限の構造を検証"""
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    if not isinstance(payload, dict) or not isinstance(payload.get("entry", []), list):
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    return payload
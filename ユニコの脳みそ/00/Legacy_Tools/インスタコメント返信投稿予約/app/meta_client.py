@@ -1,42 +1,109 @@
 """
 Meta Graph API クライアント
 Instagram API呼び出しをラップ
+
+HTTP接続はhttpxのコネクションプール（HTTP/1.1 keep-alive）で再利用し、スレッド間で共有する。
+
+リクエストはアカウント×エンドポイント種別ごとのレート制限（app.rate_limiter）を通して送信し、
+レスポンスの使用率ヘッダーをレート制限に反映する。
+呼び出しごとの応答時間と結果はapp.metricsに記録する。
 """
-import requests
-from typing import Optional
+import threading
+import time
+import httpx
 from app.config import settings
+from app.enums import ApiEndpointClass
+from app.metrics import counter, histogram
+from app.rate_limiter import rate_limiter, RateLimitExceeded
+
+
+# 一時的な失敗を示すGraph APIのエラーコード（レート制限・一時的な障害）
+TRANSIENT_ERROR_CODES = {1, 2, 4, 17, 32, 341, 613, 80001, 80002, 80006}
 
 
 class MetaAPIError(Exception):
     """Meta API関連の例外"""
-    pass
+    
+    def __init__(
+        self,
+        message: str,
+        *,
+        status_code: int | None = None,
+        error_code: int | None = None,
+        transient: bool = False,
+        retry_after: float | None = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_code = error_code
+        self.retry_after = retry_after
+        self.transient = (
+            transient
+            or retry_after is not None
+            or status_code == 429
+            or (status_code is not None and status_code >= 500)
+            or error_code in TRANSIENT_ERROR_CODES
+        )
 
 
-def create_media_for_post(
+class MetaRateLimited(MetaAPIError):
+    """ローカルのレート制限により送信を見送った（APIは呼んでいない）"""
+    
+    def __init__(self, operation: str, retry_after: float):
+        super().__init__(
+            f"{operation} deferred by rate limiter: retry after {retry_after:.1f}s",
+            retry_after=retry_after,
+        )
+
+
+# タイムアウト（秒）
+PUBLISH_TIMEOUT = 30
+MESSAGE_TIMEOUT = 10
+
+GRAPH_API_REQUEST_SECONDS = histogram(
+    "graph_api_request_seconds",
+    "Graph API呼び出しの応答時間",
+    ["operation"],
+)
+GRAPH_API_REQUESTS_TOTAL = counter(
+    "graph_api_requests_total",
+    "Graph API呼び出し数（status: HTTPステータス / transport_error / deferred）",
+    ["operation", "status"],
+)
+
+
+def _record_call(operation: str, started: float | None, status: str | int):
+    """呼び出し1回分の応答時間と結果を記録（startedがNoneなら件数のみ）"""
+    if started is not None:
+        GRAPH_API_REQUEST_SECONDS.observe(time.perf_counter() - started, operation=operation)
+    GRAPH_API_REQUESTS_TOTAL.inc(operation=operation, status=status)
+
+# コンテナのステータスを1リクエストで問い合わせる件数の上限（ids指定）
+CONTAINER_STATUS_BATCH_SIZE = 50
+
+
+def _pool_limits() -> httpx.Limits:
+    """コネクションプールの上限設定"""
+    return httpx.Limits(
+        max_connections=settings.META_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.META_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.META_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+# ==================== リクエスト組み立て ====================
+
+def _build_create_media_request(
     *,
     ig_user_id: str,
     post_type: str,
     media_type: str,
-    image_url: str | None = None,
-    video_url: str | None = None,
-    caption: str | None = None,
+    image_url: str | None,
+    video_url: str | None,
+    caption: str | None,
     access_token: str,
-) -> str:
-    """
-    メディアオブジェクトを作成（Feed/Reel/Story対応）
-    
-    Args:
-        ig_user_id: Instagram Business Account ID
-        post_type: 投稿種別 (feed, reel, story)
-        media_type: メディアタイプ (image, video)
-        image_url: 画像URL（imageの場合必須）
-        video_url: 動画URL（videoの場合必須、reelの場合は常に必須）
-        caption: キャプション
-        access_token: アクセストークン
-        
-    Returns:
-        creation_id（メディア作成ID）
-    """
+) -> tuple[str, dict[str, str]]:
+    """メディア作成リクエストのエンドポイントとペイロードを組み立て"""
     endpoint = f"{settings.GRAPH_API_BASE_URL}/{ig_user_id}/media"
     payload: dict[str, str] = {"access_token": access_token}
     
@@ -77,18 +144,219 @@ def create_media_for_post(
     else:
         raise MetaAPIError(f"Unsupported post_type: {post_type}")
     
-    resp = requests.post(endpoint, data=payload, timeout=30)
+    return endpoint, payload
+
+
+def _build_publish_request(
+    ig_user_id: str,
+    creation_id: str,
+    access_token: str,
+) -> tuple[str, dict[str, str]]:
+    """メディア公開リクエストのエンドポイントとペイロードを組み立て"""
+    endpoint = f"{settings.GRAPH_API_BASE_URL}/{ig_user_id}/media_publish"
+    payload = {
+        "creation_id": creation_id,
+        "access_token": access_token,
+    }
+    return endpoint, payload
+
+
+def _build_reply_request(
+    comment_id: str,
+    message: str,
+    access_token: str,
+) -> tuple[str, dict[str, str]]:
+    """コメント返信リクエストのエンドポイントとペイロードを組み立て"""
+    endpoint = f"{settings.GRAPH_API_BASE_URL}/{comment_id}/replies"
+    payload = {
+        "message": message,
+        "access_token": access_token,
+    }
+    return endpoint, payload
+
+
+def _build_dm_request(
+    ig_user_id: str,
+    recipient_id: str,
+    message: str,
+    access_token: str,
+) -> tuple[str, dict]:
+    """DM送信リクエストのエンドポイントとペイロードを組み立て"""
+    endpoint = f"{settings.GRAPH_API_BASE_URL}/{ig_user_id}/messages"
+    payload = {
+        "recipient": {"id": recipient_id},
+        "message": {"text": message},
+        "access_token": access_token,
+    }
+    return endpoint, payload
+
+
+def _error_from_response(resp: httpx.Response, operation: str) -> MetaAPIError:
+    """エラーレスポンスからMetaAPIErrorを作成"""
+    error_code = None
+    transient = False
+    try:
+        error = resp.json().get("error", {})
+        error_code = error.get("code")
+        transient = bool(error.get("is_transient"))
+    except (ValueError, AttributeError):
+        pass
+    retry_after = None
+    if resp.headers.get("retry-after", "").isdigit():
+        retry_after = float(resp.headers["retry-after"])
+    return MetaAPIError(
+        f"{operation} failed: {resp.status_code} {resp.text}",
+        status_code=resp.status_code,
+        error_code=error_code,
+        transient=transient,
+        retry_after=retry_after,
+    )
+
+
+def _build_container_status_request(
+    container_ids: list[str],
+    access_token: str,
+) -> tuple[str, dict[str, str]]:
+    """コンテナステータス一括取得リクエストのエンドポイントとクエリを組み立て"""
+    endpoint = f"{settings.GRAPH_API_BASE_URL}/"
+    params = {
+        "ids": ",".join(container_ids),
+        "fields": "status_code",
+        "access_token": access_token,
+    }
+    return endpoint, params
+
+
+def _parse_id(resp: httpx.Response, operation: str, *keys: str) -> str:
+    """レスポンスからIDを取り出す（失敗時はMetaAPIError）"""
     if resp.status_code != 200:
-        raise MetaAPIError(
-            f"create_media_for_post failed: {resp.status_code} {resp.text}"
-        )
+        raise _error_from_response(resp, operation)
     
     data = resp.json()
-    creation_id = data.get("id")
-    if not creation_id:
-        raise MetaAPIError(f"create_media_for_post no id: {data}")
+    for key in keys:
+        if data.get(key):
+            return data[key]
+    raise MetaAPIError(f"{operation} no id: {data}")
+
+
+# ==================== 共有クライアント ====================
+
+_sync_client: httpx.Client | None = None
+_sync_client_lock = threading.Lock()
+
+
+def _get_sync_client() -> httpx.Client:
+    """共有の同期HTTPクライアントを取得（スレッド間で共有可能）"""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_client_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(
+                    limits=_pool_limits(),
+                    timeout=PUBLISH_TIMEOUT,
+                )
+    return _sync_client
+
+
+def close_sync_client():
+    """共有の同期HTTPクライアントを閉じる"""
+    global _sync_client
+    with _sync_client_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+
+
+def _request(
+    method: str,
+    operation: str,
+    endpoint_class: str,
+    account_key: str | None,
+    endpoint: str,
+    *,
+    timeout: float,
+    max_wait: float | None = None,
+    **kwargs,
+) -> httpx.Response:
+    """
+    レート制限を通してリクエストを送信
+    
+    account_keyがNoneの場合（アカウント不明）はレート制限をかけない。
+    max_waitはトークンを待つ最大秒数（省略時はRATE_LIMIT_MAX_WAIT_SECONDS、0なら待たない）。
     
-    return creation_id
+    Raises:
+        MetaRateLimited: トークンを確保できなかった場合
+        MetaAPIError: 通信エラー（一時的な失敗として扱う）
+    """
+    if account_key is not None:
+        try:
+            rate_limiter.acquire(account_key, endpoint_class, max_wait=max_wait)
+        except RateLimitExceeded as e:
+            _record_call(operation, None, "deferred")
+            raise MetaRateLimited(operation, e.retry_after) from e
+    started = time.perf_counter()
+    try:
+        resp = _get_sync_client().request(method, endpoint, timeout=timeout, **kwargs)
+    except httpx.TransportError as e:
+        _record_call(operation, started, "transport_error")
+        raise MetaAPIError(f"{operation} transport error: {e}", transient=True) from e
+    _record_call(operation, started, resp.status_code)
+    if account_key is not None:
+        rate_limiter.observe(account_key, endpoint_class, resp.headers)
+        if resp.status_code == 429 or resp.status_code >= 500:
+            error = _error_from_response(resp, operation)
+            rate_limiter.penalize(
+                account_key,
+                endpoint_class,
+                error.retry_after or settings.RETRY_BASE_DELAY_SECONDS,
+            )
+    return resp
+
+
+def create_media_for_post(
+    *,
+    ig_user_id: str,
+    post_type: str,
+    media_type: str,
+    image_url: str | None = None,
+    video_url: str | None = None,
+    caption: str | None = None,
+    access_token: str,
+) -> str:
+    """
+    メディアオブジェクトを作成（Feed/Reel/Story対応）
+    
+    Args:
+        ig_user_id: Instagram Business Account ID
+        post_type: 投稿種別 (feed, reel, story)
+        media_type: メディアタイプ (image, video)
+        image_url: 画像URL（imageの場合必須）
+        video_url: 動画URL（videoの場合必須、reelの場合は常に必須）
+        caption: キャプション
+        access_token: アクセストークン
+        
+    Returns:
+        creation_id（メディア作成ID）
+    """
+    endpoint, payload = _build_create_media_request(
+        ig_user_id=ig_user_id,
+        post_type=post_type,
+        media_type=media_type,
+        image_url=image_url,
+        video_url=video_url,
+        caption=caption,
+        access_token=access_token,
+    )
+    resp = _request(
+        "POST",
+        "create_media_for_post",
+        ApiEndpointClass.PUBLISH,
+        ig_user_id,
+        endpoint,
+        data=payload,
+        timeout=PUBLISH_TIMEOUT,
+    )
+    return _parse_id(resp, "create_media_for_post", "id")
 
 
 def publish_media(
@@ -107,30 +375,25 @@ def publish_media(
     Returns:
         media_id（公開されたメディアID）
     """
-    endpoint = f"{settings.GRAPH_API_BASE_URL}/{ig_user_id}/media_publish"
-    payload = {
-        "creation_id": creation_id,
-        "access_token": access_token,
-    }
-    
-    resp = requests.post(endpoint, data=payload, timeout=30)
-    if resp.status_code != 200:
-        raise MetaAPIError(
-            f"publish_media failed: {resp.status_code} {resp.text}"
-        )
-    
-    data = resp.json()
-    media_id = data.get("id")
-    if not media_id:
-        raise MetaAPIError(f"publish_media no id: {data}")
-    
-    return media_id
+    endpoint, payload = _build_publish_request(ig_user_id, creation_id, access_token)
+    resp = _request(
+        "POST",
+        "publish_media",
+        ApiEndpointClass.PUBLISH,
+        ig_user_id,
+        endpoint,
+        data=payload,
+        timeout=PUBLISH_TIMEOUT,
+    )
+    return _parse_id(resp, "publish_media", "id")
 
 
 def reply_to_comment(
     comment_id: str,
     message: str,
     access_token: str,
+    ig_user_id: str | None = None,
+    max_wait: float | None = None,
 ) -> str:
     """
     コメントに返信
@@ -139,28 +402,24 @@ def reply_to_comment(
         comment_id: コメントID
         message: 返信メッセージ
         access_token: アクセストークン
+        ig_user_id: 返信するアカウントのID（レート制限の単位。省略時は制限なし）
+        max_wait: レート制限のトークンを待つ最大秒数（超える場合はMetaRateLimited）
         
     Returns:
         reply_id（返信ID）
     """
-    endpoint = f"{settings.GRAPH_API_BASE_URL}/{comment_id}/replies"
-    payload = {
-        "message": message,
-        "access_token": access_token,
-    }
-    
-    resp = requests.post(endpoint, data=payload, timeout=10)
-    if resp.status_code != 200:
-        raise MetaAPIError(
-            f"reply_to_comment failed: {resp.status_code} {resp.text}"
-        )
-    
-    data = resp.json()
-    reply_id = data.get("id")
-    if not reply_id:
-        raise MetaAPIError(f"reply_to_comment no id: {data}")
-    
-    return reply_id
+    endpoint, payload = _build_reply_request(comment_id, message, access_token)
+    resp = _request(
+        "POST",
+        "reply_to_comment",
+        ApiEndpointClass.COMMENT_REPLY,
+        ig_user_id,
+        endpoint,
+        data=payload,
+        timeout=MESSAGE_TIMEOUT,
+        max_wait=max_wait,
+    )
+    return _parse_id(resp, "reply_to_comment", "id")
 
 
 def send_instagram_dm(
@@ -169,6 +428,7 @@ def send_instagram_dm(
     recipient_id: str,
     message: str,
     access_token: str,
+    max_wait: float | None = None,
 ) -> str:
     """
     Instagram DMを送信
@@ -178,28 +438,57 @@ def send_instagram_dm(
         recipient_id: 受信者のInstagram User ID
         message: メッセージ本文
         access_token: アクセストークン
+        max_wait: レート制限のトークンを待つ最大秒数（超える場合はMetaRateLimited）
         
     Returns:
         message_id（送信されたメッセージID）
     """
-    endpoint = f"{settings.GRAPH_API_BASE_URL}/{ig_user_id}/messages"
-    payload = {
-        "recipient": {"id": recipient_id},
-        "message": {"text": message},
-        "access_token": access_token,
-    }
-    
-    resp = requests.post(endpoint, json=payload, timeout=10)
-    if resp.status_code != 200:
-        raise MetaAPIError(
-            f"send_instagram_dm failed: {resp.status_code} {resp.text}"
-        )
-    
-    data = resp.json()
-    message_id = data.get("id") or data.get("message_id")
-    if not message_id:
-        raise MetaAPIError(f"send_instagram_dm no id: {data}")
-    
-    return message_id
+    endpoint, payload = _build_dm_request(ig_user_id, recipient_id, message, access_token)
+    resp = _request(
+        "POST",
+        "send_instagram_dm",
+        ApiEndpointClass.DM,
+        ig_user_id,
+        endpoint,
+        json=payload,
+        timeout=MESSAGE_TIMEOUT,
+        max_wait=max_wait,
+    )
+    return _parse_id(resp, "send_instagram_dm", "id", "message_id")
 
 
+def get_container_statuses(
+    container_ids: list[str],
+    access_token: str,
+    ig_user_id: str | None = None,
+) -> dict[str, str]:
+    """
+    メディアコンテナのステータスをまとめて取得
+    
+    Args:
+        container_ids: コンテナ（creation_id）のリスト
+        access_token: アクセストークン
+        ig_user_id: コンテナを作成したアカウントのID（レート制限の単位）
+        
+    Returns:
+        {container_id: status_code}（IN_PROGRESS / FINISHED / ERROR / EXPIRED / PUBLISHED）
+    """
+    statuses: dict[str, str] = {}
+    for start in range(0, len(container_ids), CONTAINER_STATUS_BATCH_SIZE):
+        chunk = container_ids[start:start + CONTAINER_STATUS_BATCH_SIZE]
+        endpoint, params = _build_container_status_request(chunk, access_token)
+        resp = _request(
+            "GET",
+            "get_container_statuses",
+            ApiEndpointClass.CONTAINER_STATUS,
+            ig_user_id,
+            endpoint,
+            params=params,
+            timeout=MESSAGE_TIMEOUT,
+        )
+        if resp.status_code != 200:
+            raise _error_from_response(resp, "get_container_statuses")
+        for container_id, data in resp.json().items():
+            if isinstance(data, dict):
+                statuses[container_id] = data.get("status_code")
+    return statuses
@@ -0,0 +1,96 @@
+"""
+簡易マイグレーション
+create_allは既存テーブルにカラムやインデックスを追加しないため、
+モデルに宣言したカラム・インデックスのうち未作成のものを起動時に作成する
+"""
+import logging
+import time
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DatabaseError
+
+from app.db import Base
+
+logger = logging.getLogger(__name__)
+
+_MIGRATION_ATTEMPTS = 5
+
+
+def ensure_columns(bind: Engine) -> list[str]:
+    """
+    モデルに宣言されたカラムのうち、既存テーブルに存在しないものを追加
+
+    追加できるのはNULL許容か、server_defaultを持つカラムのみ。
+
+    Returns:
+        追加したカラム名（テーブル名.カラム名）のリスト
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}"
+            if column.server_default is not None:
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                # server_defaultはSQLリテラルとして書く（例: "0"）
+                ddl += f" DEFAULT {column.server_default.arg}"
+            with bind.begin() as conn:
+                conn.execute(text(ddl))
+            added.append(f"{table.name}.{column.name}")
+            logger.info(f"Added column {column.name} to {table.name}")
+    return added
+
+
+def ensure_indexes(bind: Engine) -> list[str]:
+    """
+    モデルに宣言されたインデックスのうち、DBに存在しないものを作成
+
+    Returns:
+        新たに作成したインデックス名のリスト
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            index.create(bind=bind)
+            created.append(index.name)
+            logger.info(f"Created index {index.name} on {table.name}")
+
+    # 新しいインデックスをプランナーが選べるよう統計情報を更新
+    if created and bind.dialect.name == "sqlite":
+        with bind.begin() as conn:
+            conn.execute(text("ANALYZE"))
+    return created
+
+
+def run_migrations(bind: Engine):
+    """
+    起動時のマイグレーションを実行
+
+    複数プロセス（uvicorn --workers N）が同時に起動すると、他プロセスが先に作成した
+    テーブル・インデックスの作成で失敗するため、DBの状態を読み直してやり直す。
+    """
+    for attempt in range(1, _MIGRATION_ATTEMPTS + 1):
+        try:
+            Base.metadata.create_all(bind=bind)
+            ensure_columns(bind)
+            ensure_indexes(bind)
+            return
+        except DatabaseError as e:
+            if attempt == _MIGRATION_ATTEMPTS:
+                raise
+            logger.info(f"Migration conflicted with another process, retrying: {e.orig}")
+            time.sleep(0.2 * attempt)
@@ -3,7 +3,8 @@
 """
 from datetime import datetime
 from sqlalchemy import (
-    Column, Integer, String, DateTime, Text, ForeignKey, JSON, Boolean
+    Column, Integer, String, Date, DateTime, Text, ForeignKey, JSON, Boolean, Index, text,
+    UniqueConstraint
 )
 from sqlalchemy.orm import relationship
 from app.db import Base
@@ -27,6 +28,14 @@ class IGAccount(Base):
 class ScheduledPost(Base):
     """予約投稿"""
     __tablename__ = "scheduled_posts"
+    __table_args__ = (
+        # スケジューラーの期限チェック・ダッシュボード集計
+        Index("ix_scheduled_posts_status_scheduled_at", "status", "scheduled_at"),
+        # カレンダー表示（アカウント指定）
+        Index("ix_scheduled_posts_account_scheduled_at", "ig_account_id", "scheduled_at"),
+        # 返信テンプレートの{caption}（コメントされた投稿のキャプション）
+        Index("ix_scheduled_posts_remote_media_id", "remote_media_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     ig_account_id = Column(Integer, ForeignKey("ig_accounts.id"), nullable=False)
@@ -39,6 +48,8 @@ class ScheduledPost(Base):
     status = Column(String, default="pending")  # pending, processing, posted, failed, canceled, paused
     remote_media_id = Column(String, nullable=True)
     error_message = Column(Text, nullable=True)
+    retry_count = Column(Integer, default=0, nullable=False, server_default="0")  # 一時的なエラーで再キューした回数
+    next_attempt_at = Column(DateTime, nullable=True)  # 再キュー後の再実行時刻（scheduled_atはユーザーの予約時刻のまま）
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -84,6 +95,19 @@ class CommentReplyRule(Base):
 class CommentLog(Base):
     """コメントログ"""
     __tablename__ = "comment_logs"
+    __table_args__ = (
+        # インボックス・ログ一覧（アカウント/返信状態で絞り込み、新しい順）
+        Index("ix_comment_logs_account_replied_created", "ig_account_id", "replied", "created_at"),
+        Index("ix_comment_logs_account_created", "ig_account_id", "created_at"),
+        Index("ix_comment_logs_created_at", "created_at"),
+        # 未返信コメントだけの部分インデックス（ダッシュボード集計・未対応一覧）
+        Index(
+            "ix_comment_logs_unreplied_created",
+            "created_at",
+            sqlite_where=text("replied = 0"),
+            postgresql_where=text("replied = 0"),
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     ig_account_id = Column(Integer, ForeignKey("ig_accounts.id"), nullable=False)
@@ -121,6 +145,23 @@ class DMReplyRule(Base):
 class DMLog(Base):
     """DMログ"""
     __tablename__ = "dm_logs"
+    __table_args__ = (
+        # インボックス（受信DM、アカウント/返信状態で絞り込み、新しい順）
+        Index(
+            "ix_dm_logs_account_direction_replied_created",
+            "ig_account_id", "direction", "replied", "created_at",
+        ),
+        Index("ix_dm_logs_direction_replied_created", "direction", "replied", "created_at"),
+        # 保持期間を過ぎたログの削除
+        Index("ix_dm_logs_created_at", "created_at"),
+        # 未返信の受信DMだけの部分インデックス（ダッシュボード集計・未対応一覧）
+        Index(
+            "ix_dm_logs_unhandled_in_created",
+            "created_at",
+            sqlite_where=text("direction = 'in' AND replied = 0"),
+            postgresql_where=text("direction = 'in' AND replied = 0"),
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     ig_account_id = Column(Integer, ForeignKey("ig_accounts.id"), nullable=False)
@@ -158,6 +199,11 @@ class UserConversation(Base):
 class AppEventLog(Base):
     """アプリケーションイベントログ"""
     __tablename__ = "app_event_logs"
+    __table_args__ = (
+        # イベントログ一覧（レベル/発生元で絞り込み、新しい順）
+        Index("ix_app_event_logs_level_created", "level", "created_at"),
+        Index("ix_app_event_logs_source_created", "source", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     level = Column(String, default="INFO")  # DEBUG, INFO, WARN, ERROR
@@ -168,3 +214,85 @@ class AppEventLog(Base):
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
 
+class DashboardCounter(Base):
+    """ダッシュボード集計カウンター（各処理で増減し、定期的に実数と照合）"""
+    __tablename__ = "dashboard_counters"
+    
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    reconciled_at = Column(DateTime, nullable=True)
+
+
+class SyncCursor(Base):
+    """外部への差分エクスポートの送信済み位置（ハイウォーターマーク）"""
+    __tablename__ = "sync_cursors"
+    
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SchedulerLease(Base):
+    """スケジューラーのリーダーリース（複数プロセス構成で1プロセスだけがスケジューラーを動かす）"""
+    __tablename__ = "scheduler_leases"
+    
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)  # ホスト名:PID:ランダム値
+    expires_at = Column(DateTime, nullable=False)  # UTC。これを過ぎたら他プロセスが取得できる
+    acquired_at = Column(DateTime, nullable=True)
+
+
+class LogDailyStat(Base):
+    """
+    コメント/DMログの日次集計（アカウント単位）
+
+    保持期間を過ぎて削除したログを畳み込んだもの。アカウント削除後も履歴として残すため外部キーは張らない。
+    """
+    __tablename__ = "log_daily_stats"
+    __table_args__ = (
+        UniqueConstraint("day", "ig_account_id", "kind", name="uq_log_daily_stats_day_account_kind"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)  # UTC日付
+    ig_account_id = Column(Integer, nullable=False, index=True)
+    kind = Column(String, nullable=False)  # comment, dm
+    received = Column(Integer, nullable=False, default=0)  # 受信数
+    replied = Column(Integer, nullable=False, default=0)  # 自動返信済み数
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RuleDailyHit(Base):
+    """自動返信ルールの日次ヒット数（保持期間を過ぎて削除したログから集計）"""
+    __tablename__ = "rule_daily_hits"
+    __table_args__ = (
+        UniqueConstraint(
+            "day", "ig_account_id", "kind", "rule_id", name="uq_rule_daily_hits_day_account_kind_rule"
+        ),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)  # UTC日付
+    ig_account_id = Column(Integer, nullable=False, index=True)
+    kind = Column(String, nullable=False)  # comment, dm
+    rule_id = Column(Integer, nullable=False)  # comment_reply_rules.id / dm_reply_rules.id
+    hits = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class AppEventDailyCount(Base):
+    """アプリケーションイベントの日次件数（保持期間を過ぎて削除したログから集計）"""
+    __tablename__ = "app_event_daily_counts"
+    __table_args__ = (
+        UniqueConstraint(
+            "day", "level", "source", "event_type", name="uq_app_event_daily_counts_key"
+        ),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)  # UTC日付
+    level = Column(String, nullable=False)
+    source = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
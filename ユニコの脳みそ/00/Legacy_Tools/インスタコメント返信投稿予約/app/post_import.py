@@ -0,0 +1,252 @@
+"""
+予約投稿の一括インポート
+CSV / JSONL を1行ずつ読み、チャンク単位で検証してまとめてINSERTする
+
+- アカウントはインポート開始時に1クエリで読み込んだマップから解決する（ig_account_id または ig_user_id）
+- 1チャンクごとに1回のexecutemany形式のINSERTと1回のコミットで書き込む
+- ファイル全体をメモリに載せず、エラーは行番号付きで返す（件数には上限あり）
+"""
+import csv
+import json
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, TextIO
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.dashboard_counters import bump_counters
+from app.enums import PostStatus, PostType, MediaType
+from app.models import IGAccount, ScheduledPost
+
+BULK_FORMAT_CSV = "csv"
+BULK_FORMAT_JSONL = "jsonl"
+
+_POST_FIELDS = ("post_type", "media_type", "image_url", "video_url", "caption")
+
+
+def validate_post_media(
+    post_type: str,
+    media_type: str,
+    image_url: str | None,
+    video_url: str | None,
+) -> str | None:
+    """
+    投稿種別とメディアURLの組み合わせを検証
+
+    Returns:
+        エラーメッセージ（問題なければNone）
+    """
+    if post_type == PostType.REEL:
+        if not video_url:
+            return "video_url is required for reel posts"
+    elif post_type == PostType.STORY:
+        if media_type == MediaType.IMAGE and not image_url:
+            return "image_url is required for story image"
+        elif media_type == MediaType.VIDEO and not video_url:
+            return "video_url is required for story video"
+    elif post_type == PostType.FEED:
+        if media_type == MediaType.IMAGE and not image_url:
+            return "image_url is required for feed image"
+        elif media_type == MediaType.VIDEO and not video_url:
+            return "video_url is required for feed video"
+    return None
+
+
+def iter_rows(stream: TextIO, fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """
+    CSV / JSONL を1行ずつ辞書に変換
+
+    Yields:
+        (行番号, 行データ, パースエラー)。パースに失敗した行は行データがNone
+    """
+    if fmt == BULK_FORMAT_CSV:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # 行番号はヘッダーを1行目とした物理行番号（複数行のセルがあればその末尾）
+            if None in row:
+                yield reader.line_num, None, "too many columns"
+                continue
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "each line must be a JSON object"
+            continue
+        yield line_number, row, None
+
+
+def _blank_to_none(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _parse_scheduled_at(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("scheduled_at is required")
+    text = value.strip()
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"invalid scheduled_at: {value}") from None
+
+
+class BulkPostImporter:
+    """
+    予約投稿をチャンク単位で検証・INSERTする
+
+    使い方:
+        importer = BulkPostImporter(db, chunk_size=1000, max_errors=100)
+        for row_number, row, error in iter_rows(stream, fmt):
+            importer.add(row_number, row, error)
+        report = importer.finish()
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        *,
+        chunk_size: int,
+        max_errors: int,
+        on_inserted: Callable[[list[tuple[int, datetime]]], None] | None = None,
+    ):
+        self.db = db
+        self.chunk_size = max(1, chunk_size)
+        self.max_errors = max_errors
+        self.on_inserted = on_inserted
+        self.total = 0
+        self.created = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+        self._chunk: list[tuple[int, dict]] = []
+        account_rows = self.db.query(IGAccount.id, IGAccount.ig_user_id).all()
+        self._account_ids = {account_id for account_id, _ in account_rows}
+        self._accounts_by_ig_user_id = {
+            ig_user_id: account_id for account_id, ig_user_id in account_rows
+        }
+
+    def add(self, row_number: int, row: dict | None, parse_error: str | None = None):
+        """1行を追加（チャンクが埋まったら検証してINSERT）"""
+        self.total += 1
+        if row is None:
+            self._record_error(row_number, parse_error or "unreadable row")
+            return
+        self._chunk.append((row_number, row))
+        if len(self._chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """溜まっている行を検証してまとめてINSERT"""
+        chunk, self._chunk = self._chunk, []
+        values = []
+        for row_number, row in chunk:
+            try:
+                values.append(self._validate(row))
+            except ValueError as e:
+                self._record_error(row_number, str(e))
+        if not values:
+            return
+
+        inserted = self.db.execute(
+            insert(ScheduledPost).returning(ScheduledPost.id, ScheduledPost.scheduled_at),
+            values,
+        ).all()
+        bump_counters(self.db, pending_posts=len(inserted))
+        self.db.commit()
+        self.created += len(inserted)
+        if self.on_inserted:
+            self.on_inserted([(post_id, scheduled_at) for post_id, scheduled_at in inserted])
+
+    def finish(self) -> dict:
+        """残りを書き込み、結果レポートを返す"""
+        self.flush()
+        return {
+            "total": self.total,
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+    def _validate(self, row: dict) -> dict:
+        row = {
+            key.strip() if isinstance(key, str) else key: _blank_to_none(value)
+            for key, value in row.items()
+        }
+
+        account_id = self._resolve_account(row)
+        values = {
+            "ig_account_id": account_id,
+            "post_type": row.get("post_type") or PostType.FEED,
+            "media_type": row.get("media_type") or MediaType.IMAGE,
+            "image_url": row.get("image_url"),
+            "video_url": row.get("video_url"),
+            "caption": row.get("caption"),
+            "scheduled_at": _parse_scheduled_at(row.get("scheduled_at")),
+            "status": PostStatus.PENDING,
+        }
+        for field in _POST_FIELDS:
+            if values[field] is not None and not isinstance(values[field], str):
+                raise ValueError(f"{field} must be a string")
+        error = validate_post_media(
+            values["post_type"], values["media_type"], values["image_url"], values["video_url"]
+        )
+        if error:
+            raise ValueError(error)
+        return values
+
+    def _resolve_account(self, row: dict) -> int:
+        account_id = row.get("ig_account_id")
+        if account_id is not None:
+            try:
+                account_id = int(account_id)
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid ig_account_id: {account_id}") from None
+            if account_id not in self._account_ids:
+                raise ValueError(f"IGAccount not found: {account_id}")
+            return account_id
+        ig_user_id = row.get("ig_user_id")
+        if ig_user_id is None:
+            raise ValueError("ig_account_id or ig_user_id is required")
+        account_id = self._accounts_by_ig_user_id.get(str(ig_user_id))
+        if account_id is None:
+            raise ValueError(f"IGAccount not found for ig_user_id: {ig_user_id}")
+        return account_id
+
+    def _record_error(self, row_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row_number, "error": message})
+
+
+def import_posts(
+    db: Session,
+    rows: Iterable[tuple[int, dict | None, str | None]],
+    *,
+    chunk_size: int,
+    max_errors: int,
+    on_inserted: Callable[[list[tuple[int, datetime]]], None] | None = None,
+) -> dict:
+    """iter_rows()の結果をまとめてインポートし、結果レポートを返す"""
+    importer = BulkPostImporter(
+        db,
+        chunk_size=chunk_size,
+        max_errors=max_errors,
+        on_inserted=on_inserted,
+    )
+    for row_number, row, parse_error in rows:
+        importer.add(row_number, row, parse_error)
+    return importer.finish()
@@ -0,0 +1,222 @@
+"""
+Graph APIのレート制限
+アカウント（ig_user_id）×エンドポイント種別ごとのトークンバケットで呼び出し間隔を制御し、
+Metaが返す使用率ヘッダーに合わせて送信レートを自動で絞る
+
+- X-App-Usage: アプリ全体の使用率（%）
+- X-Business-Use-Case-Usage: アカウント単位の使用率（%）と制限解除までの目安時間（分）
+"""
+import json
+import logging
+import random
+import threading
+import time
+from typing import Mapping
+
+from app.config import settings
+from app.enums import ApiEndpointClass
+
+logger = logging.getLogger(__name__)
+
+# 使用率が100%に達したが解除時間が返らなかった場合の待機秒数
+_FULL_USAGE_PAUSE_SECONDS = 60.0
+
+# 絞り込み後のレートの下限（基本レートに対する割合）
+_MIN_RATE_FACTOR = 0.05
+
+
+class RateLimitExceeded(Exception):
+    """許容時間内にトークンを確保できなかった"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """スレッドセーフなトークンバケット"""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.base_rate = rate_per_second
+        self.rate = rate_per_second
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        トークンを1つ取得
+
+        Returns:
+            取得できた場合0、できなかった場合は次に取得できるまでの秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def pause(self, seconds: float):
+        """指定秒数トークンの払い出しを止める"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def set_rate_factor(self, factor: float):
+        """基本レートに対する倍率を設定（1.0で元に戻す）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = self.base_rate * min(1.0, max(_MIN_RATE_FACTOR, factor))
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+
+def _per_minute(endpoint_class: str) -> float:
+    """エンドポイント種別ごとの基本レート（回/分）"""
+    return {
+        ApiEndpointClass.PUBLISH: settings.RATE_LIMIT_PUBLISH_PER_MINUTE,
+        ApiEndpointClass.COMMENT_REPLY: settings.RATE_LIMIT_COMMENT_REPLY_PER_MINUTE,
+        ApiEndpointClass.DM: settings.RATE_LIMIT_DM_PER_MINUTE,
+        ApiEndpointClass.CONTAINER_STATUS: settings.RATE_LIMIT_CONTAINER_STATUS_PER_MINUTE,
+    }[endpoint_class]
+
+
+def parse_usage_headers(headers: Mapping[str, str]) -> tuple[float, float]:
+    """
+    使用率ヘッダーを解析
+
+    Returns:
+        (使用率の最大値[%], 制限解除までの秒数)
+    """
+    usage = 0.0
+    regain_seconds = 0.0
+
+    def take(stats: dict):
+        nonlocal usage, regain_seconds
+        for key in ("call_count", "total_cputime", "total_time", "acc_id_util_pct"):
+            value = stats.get(key)
+            if isinstance(value, (int, float)):
+                usage = max(usage, float(value))
+        regain = stats.get("estimated_time_to_regain_access")
+        if isinstance(regain, (int, float)):
+            regain_seconds = max(regain_seconds, float(regain) * 60)
+
+    for name in ("x-app-usage", "x-business-use-case-usage"):
+        raw = headers.get(name)
+        if not raw:
+            continue
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            logger.warning(f"Unparseable {name} header: {raw[:200]}")
+            continue
+        if name == "x-app-usage":
+            take(data)
+            continue
+        # {"<business_id>": [{"type": ..., "call_count": ..., ...}]}
+        for entries in data.values():
+            for stats in entries if isinstance(entries, list) else [entries]:
+                if isinstance(stats, dict):
+                    take(stats)
+    return usage, regain_seconds
+
+
+class RateLimiter:
+    """アカウント×エンドポイント種別ごとのトークンバケットを管理"""
+
+    def __init__(self):
+        self._buckets: dict[tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, account_key: str, endpoint_class: str) -> TokenBucket:
+        """バケットを取得（初回は設定値から作成）"""
+        key = (account_key, endpoint_class)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = TokenBucket(
+                        _per_minute(endpoint_class) / 60,
+                        settings.RATE_LIMIT_BURST,
+                    )
+                    self._buckets[key] = bucket
+        return bucket
+
+    def acquire(self, account_key: str, endpoint_class: str, max_wait: float | None = None):
+        """
+        トークンを取得（必要なら待つ）
+
+        Raises:
+            RateLimitExceeded: max_wait秒以内に取得できない場合
+        """
+        if max_wait is None:
+            max_wait = settings.RATE_LIMIT_MAX_WAIT_SECONDS
+        bucket = self.bucket(account_key, endpoint_class)
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = bucket.reserve()
+            if wait <= 0:
+                return
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                raise RateLimitExceeded(wait)
+            time.sleep(wait)
+
+    def observe(self, account_key: str, endpoint_class: str, headers: Mapping[str, str]):
+        """
+        レスポンスの使用率ヘッダーをバケットに反映
+
+        使用率がRATE_LIMIT_USAGE_SOFT_THRESHOLDを超えたら残り枠に比例してレートを下げ、
+        100%に達したら制限解除まで止める。
+        """
+        usage, regain_seconds = parse_usage_headers(headers)
+        bucket = self.bucket(account_key, endpoint_class)
+        if regain_seconds > 0 or usage >= 100:
+            pause = regain_seconds or _FULL_USAGE_PAUSE_SECONDS
+            bucket.pause(pause)
+            logger.warning(
+                f"Graph API usage limit reached: account={account_key} "
+                f"endpoint={endpoint_class} usage={usage:.0f}% pause={pause:.0f}s"
+            )
+            return
+        soft = settings.RATE_LIMIT_USAGE_SOFT_THRESHOLD
+        if usage > soft:
+            bucket.set_rate_factor((100 - usage) / (100 - soft))
+        else:
+            bucket.set_rate_factor(1.0)
+
+    def penalize(self, account_key: str, endpoint_class: str, seconds: float):
+        """スロットリングエラーを受けたバケットを一時停止"""
+        self.bucket(account_key, endpoint_class).pause(seconds)
+
+    def reset(self):
+        """全バケットを破棄（設定変更時・テスト用）"""
+        with self._lock:
+            self._buckets.clear()
+
+
+rate_limiter = RateLimiter()
+
+
+def backoff_delay(attempt: int, base: float | None = None, cap: float | None = None) -> float:
+    """
+    ジッター付き指数バックオフの待機秒数
+
+    Args:
+        attempt: 何回目のリトライか（1始まり）
+    """
+    if base is None:
+        base = settings.RETRY_BASE_DELAY_SECONDS
+    if cap is None:
+        cap = settings.RETRY_MAX_DELAY_SECONDS
+    ceiling = min(cap, base * (2 ** max(0, attempt - 1)))
+    return random.uniform(base / 2, max(base / 2, ceiling))
@@ -0,0 +1,364 @@
+"""
+ログの保持期間管理
+保持期間を過ぎたコメント/DM/アプリケーションイベントのログを、
+日次集計に畳み込み、gzip JSONLにアーカイブしてからバッチ単位で削除する
+
+- テーブルごとに保持日数を設定する（RETENTION_*_DAYS、0で無期限）
+- 1バッチ = アーカイブ追記 → 集計の加算・カウンター調整・削除を1トランザクションでコミット
+  （アーカイブは削除のコミット前に書くため、途中で落ちた場合は同じ行が重複して残ることがある。
+  読み出し時はiter_archived_rowsがIDで重複を除く）
+- アーカイブは {RETENTION_ARCHIVE_DIR}/{テーブル名}/{UTC日付}.jsonl.gz に日付ごとに追記する
+- 削除後はSQLiteのincremental_vacuumで空きページを少しずつファイルから解放する
+
+既存DBをincremental auto_vacuumに変換する（1回だけ、全体をVACUUMするため停止中に実行）:
+    python -m app.retention --enable-incremental-vacuum
+保持処理を手動で実行:
+    python -m app.retention
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterator, NamedTuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.dashboard_counters import bump_counters
+from app.models import (
+    AppEventLog, CommentLog, DMLog, SyncCursor,
+    LogDailyStat, RuleDailyHit, AppEventDailyCount
+)
+from app.sheets_sync import EVENT_LOG_CURSOR, get_sheets_sync_service
+from app.utils_logging import log_event
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KIND_COMMENT = "comment"
+ROLLUP_KIND_DM = "dm"
+
+
+class RetentionPolicy(NamedTuple):
+    """テーブルごとの保持ルール"""
+    model: type
+    retention_days: int
+    # 削除するバッチの行を日次集計に加算する
+    rollup: Callable[[Session, list[dict]], None]
+    # 削除するバッチの行に応じたダッシュボードカウンターの増減
+    counter_deltas: Callable[[list[dict]], dict[str, int]] | None = None
+    # これより大きいIDの行は削除しない（未エクスポートのログを残すため）
+    max_id: Callable[[Session], int | None] | None = None
+
+
+# ==================== 日次集計 ====================
+
+def _day(value: datetime) -> date:
+    return value.date()
+
+
+def _add_counts(db: Session, model, key_fields: tuple[str, ...], counts: dict[tuple, dict[str, int]]):
+    """集計テーブルの行に件数を加算（行がなければ作成）"""
+    for key, values in counts.items():
+        filters = [getattr(model, field) == value for field, value in zip(key_fields, key)]
+        row = db.query(model).filter(*filters).one_or_none()
+        if row is None:
+            row = model(**dict(zip(key_fields, key)), **{field: 0 for field in values})
+            db.add(row)
+        for field, value in values.items():
+            setattr(row, field, (getattr(row, field) or 0) + value)
+    db.flush()
+
+
+def _rollup_messages(db: Session, rows: list[dict], kind: str):
+    """コメント/DMの受信数・返信数・ルールヒット数を日次×アカウントで集計"""
+    stats: dict[tuple, dict[str, int]] = defaultdict(lambda: {"received": 0, "replied": 0})
+    hits: dict[tuple, dict[str, int]] = defaultdict(lambda: {"hits": 0})
+    for row in rows:
+        if kind == ROLLUP_KIND_DM and row.get("direction") != "in":
+            continue
+        key = (_day(row["created_at"]), row["ig_account_id"], kind)
+        stats[key]["received"] += 1
+        if row["replied"] == 1:
+            stats[key]["replied"] += 1
+        if row["used_rule_id"] is not None:
+            hits[key + (row["used_rule_id"],)]["hits"] += 1
+    _add_counts(db, LogDailyStat, ("day", "ig_account_id", "kind"), stats)
+    _add_counts(db, RuleDailyHit, ("day", "ig_account_id", "kind", "rule_id"), hits)
+
+
+def _rollup_app_events(db: Session, rows: list[dict]):
+    """アプリケーションイベントの件数を日次×レベル×発生元×種別で集計"""
+    counts: dict[tuple, dict[str, int]] = defaultdict(lambda: {"count": 0})
+    for row in rows:
+        key = (_day(row["created_at"]), row["level"] or "", row["source"], row["event_type"])
+        counts[key]["count"] += 1
+    _add_counts(db, AppEventDailyCount, ("day", "level", "source", "event_type"), counts)
+
+
+def _comment_counter_deltas(rows: list[dict]) -> dict[str, int]:
+    return {"unhandled_comments": -sum(1 for row in rows if row["replied"] == 0)}
+
+
+def _dm_counter_deltas(rows: list[dict]) -> dict[str, int]:
+    return {
+        "unhandled_dms": -sum(
+            1 for row in rows if row.get("direction") == "in" and row["replied"] == 0
+        )
+    }
+
+
+def _app_event_export_bound(db: Session) -> int | None:
+    """Sheetsへのエクスポートが有効なら、送信済みのログIDを上限にする"""
+    if get_sheets_sync_service() is None:
+        return None
+    cursor = db.get(SyncCursor, EVENT_LOG_CURSOR)
+    return cursor.last_id if cursor else 0
+
+
+def default_policies() -> list[RetentionPolicy]:
+    """設定値から各テーブルの保持ルールを作成"""
+    return [
+        RetentionPolicy(
+            CommentLog,
+            settings.RETENTION_COMMENT_LOG_DAYS,
+            lambda db, rows: _rollup_messages(db, rows, ROLLUP_KIND_COMMENT),
+            _comment_counter_deltas,
+        ),
+        RetentionPolicy(
+            DMLog,
+            settings.RETENTION_DM_LOG_DAYS,
+            lambda db, rows: _rollup_messages(db, rows, ROLLUP_KIND_DM),
+            _dm_counter_deltas,
+        ),
+        RetentionPolicy(
+            AppEventLog,
+            settings.RETENTION_APP_EVENT_LOG_DAYS,
+            _rollup_app_events,
+            max_id=_app_event_export_bound,
+        ),
+    ]
+
+
+# ==================== アーカイブ ====================
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Unserializable value: {value!r}")
+
+
+def archive_rows(archive_dir: str, table_name: str, rows: list[dict]) -> list[str]:
+    """
+    行をUTC日付ごとのgzip JSONLファイルに追記
+
+    追記ごとにgzipのメンバーが増えるが、gzip.openでまとめて読める。
+    削除のコミット前にディスクへ書き切る（fsync）。
+
+    Returns:
+        書き込んだファイルのパス
+    """
+    by_day: dict[date, list[dict]] = defaultdict(list)
+    for row in rows:
+        by_day[_day(row["created_at"])].append(row)
+
+    directory = os.path.join(archive_dir, table_name)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for day, day_rows in sorted(by_day.items()):
+        path = os.path.join(directory, f"{day.isoformat()}.jsonl.gz")
+        payload = "".join(
+            json.dumps(row, ensure_ascii=False, default=_json_default) + "\n" for row in day_rows
+        ).encode("utf-8")
+        with open(path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                gz.write(payload)
+            raw.flush()
+            os.fsync(raw.fileno())
+        paths.append(path)
+    return paths
+
+
+def iter_archived_rows(
+    table_name: str,
+    start: date,
+    end: date,
+    archive_dir: str | None = None,
+) -> Iterator[dict]:
+    """
+    アーカイブ済みの行を日付範囲（両端を含む）で読み出す
+
+    削除前に落ちて二重に書かれた行はIDで除く。
+    """
+    directory = os.path.join(archive_dir or settings.RETENTION_ARCHIVE_DIR, table_name)
+    day = start
+    while day <= end:
+        path = os.path.join(directory, f"{day.isoformat()}.jsonl.gz")
+        if os.path.exists(path):
+            seen: set = set()
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    if row.get("id") in seen:
+                        continue
+                    seen.add(row.get("id"))
+                    yield row
+        day += timedelta(days=1)
+
+
+# ==================== 削除 ====================
+
+def apply_retention_policy(
+    db: Session,
+    policy: RetentionPolicy,
+    *,
+    now: datetime | None = None,
+    batch_size: int | None = None,
+    archive_dir: str | None = None,
+) -> int:
+    """
+    保持期間を過ぎた行を集計・アーカイブしてから削除
+
+    Returns:
+        削除した行数
+    """
+    if policy.retention_days <= 0:
+        return 0
+    now = now or datetime.utcnow()
+    batch_size = max(1, batch_size or settings.RETENTION_BATCH_SIZE)
+    if archive_dir is None:
+        archive_dir = settings.RETENTION_ARCHIVE_DIR
+    table = policy.model.__table__
+    cutoff = now - timedelta(days=policy.retention_days)
+    max_id = policy.max_id(db) if policy.max_id else None
+
+    deleted = 0
+    last_id = 0
+    while True:
+        stmt = (
+            select(table)
+            .where(table.c.created_at < cutoff, table.c.id > last_id)
+            .order_by(table.c.id.asc())
+            .limit(batch_size)
+        )
+        if max_id is not None:
+            stmt = stmt.where(table.c.id <= max_id)
+        rows = [dict(row._mapping) for row in db.execute(stmt)]
+        if not rows:
+            break
+
+        if archive_dir:
+            archive_rows(archive_dir, table.name, rows)
+        try:
+            policy.rollup(db, rows)
+            if policy.counter_deltas:
+                bump_counters(db, **policy.counter_deltas(rows))
+            db.execute(delete(table).where(table.c.id.in_([row["id"] for row in rows])))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        deleted += len(rows)
+        last_id = rows[-1]["id"]
+        if len(rows) < batch_size:
+            break
+    return deleted
+
+
+def incremental_vacuum(bind: Engine, pages: int | None = None) -> int:
+    """
+    空きページをファイルから解放（SQLiteかつauto_vacuum=INCREMENTALのDBのみ）
+
+    Returns:
+        解放したページ数
+    """
+    if pages is None:
+        pages = settings.RETENTION_VACUUM_PAGES
+    if pages <= 0 or bind.dialect.name != "sqlite":
+        return 0
+    with bind.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            logger.info(
+                "auto_vacuum is not INCREMENTAL; run "
+                "`python -m app.retention --enable-incremental-vacuum` to reclaim space"
+            )
+            return 0
+        before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        conn.commit()
+        # incremental_vacuumは1ステップで1ページずつ解放する。sqlite3のexecuteは
+        # 1ステップしか進めないため、最後まで実行するexecutescriptを使う
+        dbapi_connection = conn.connection.driver_connection
+        dbapi_connection.executescript(
+            f"PRAGMA incremental_vacuum({int(pages)}); PRAGMA wal_checkpoint(TRUNCATE);"
+        )
+        after = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        conn.commit()
+    return before - after
+
+
+def enable_incremental_vacuum(bind: Engine):
+    """既存のSQLite DBをauto_vacuum=INCREMENTALに変換（全体をVACUUMするので時間がかかる）"""
+    if bind.dialect.name != "sqlite":
+        raise ValueError("incremental vacuum is only supported for SQLite")
+    with bind.connect() as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        conn.commit()
+
+
+def run_retention() -> dict[str, int]:
+    """全テーブルの保持処理と空き領域の解放を実行（スケジューラーから実行）"""
+    from app.db import SessionLocal, engine
+
+    results: dict[str, int] = {}
+    db = SessionLocal()
+    try:
+        for policy in default_policies():
+            table_name = policy.model.__tablename__
+            try:
+                results[table_name] = apply_retention_policy(db, policy)
+            except Exception as e:
+                logger.error(f"Retention failed for {table_name}: {e}")
+                results[table_name] = 0
+        freed_pages = incremental_vacuum(engine)
+        if any(results.values()) or freed_pages:
+            log_event(
+                db,
+                level="INFO",
+                source="retention",
+                event_type="retention_completed",
+                message=f"Archived and deleted {sum(results.values())} log rows",
+                meta={"deleted": results, "freed_pages": freed_pages},
+            )
+        return results
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ログの保持期間管理")
+    parser.add_argument(
+        "--enable-incremental-vacuum",
+        action="store_true",
+        help="既存DBをauto_vacuum=INCREMENTALに変換する（アプリ停止中に1回だけ実行）",
+    )
+    args = parser.parse_args()
+
+    from app.db import engine
+    from app.migrations import run_migrations
+
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum(engine)
+        print("auto_vacuum=INCREMENTAL enabled")
+        return
+    run_migrations(engine)
+    print(run_retention())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+自動返信ルールのマッチング
+アカウントごとのルールをAho-Corasickオートマトンにコンパイルし、
+テキストを1回走査するだけで最も優先度の高いルールを見つける
+
+返信テキスト（テンプレート本文またはreply_text）もapp.templatingでコンパイルしておき、
+返信時は変数の差し込みだけを行う。
+コンパイル結果はメモリにキャッシュし、ルール・テンプレートの作成・変更・削除時に無効化する。
+"""
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+from sqlalchemy.orm import Session, joinedload
+
+from app.config import settings
+from app.models import CommentReplyRule, DMReplyRule
+from app.templating import CompiledTemplate, compile_template_or_literal
+
+
+def normalize_text(text: str | None) -> str:
+    """マッチング用にテキストを正規化"""
+    return (text or "").lower()
+
+
+class KeywordAutomaton:
+    """
+    複数キーワードを同時に検索するAho-Corasickオートマトン
+
+    キーワードのインデックスを優先順位として扱い、
+    テキスト中に現れるキーワードのうち最小のインデックスを返す。
+    """
+
+    _NO_MATCH = float("inf")
+
+    def __init__(self, keywords: list[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # 各状態で確定する（失敗リンク先を含む）最小インデックス
+        self._best: list[float] = [self._NO_MATCH]
+
+        for index, keyword in enumerate(keywords):
+            state = 0
+            for ch in keyword:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(self._NO_MATCH)
+                    self._goto[state][ch] = next_state
+                state = next_state
+            self._best[state] = min(self._best[state], index)
+
+        # 幅優先で失敗リンクを構築
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail_target = self._goto[fail].get(ch, 0)
+                self._fail[next_state] = fail_target if fail_target != next_state else 0
+                self._best[next_state] = min(
+                    self._best[next_state], self._best[self._fail[next_state]]
+                )
+
+    def search(self, text: str) -> int | None:
+        """テキスト中に現れる最小インデックスのキーワードを返す（なければNone）"""
+        goto = self._goto
+        fail = self._fail
+        best_at = self._best
+        best = best_at[0]
+        state = 0
+        for ch in text:
+            if best == 0:
+                break
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if best_at[state] < best:
+                best = best_at[state]
+        return None if best == self._NO_MATCH else int(best)
+
+
+class MatchedRule(NamedTuple):
+    """マッチしたルールのスナップショット"""
+    id: int
+    keyword: str
+    reply_text: str
+    template: CompiledTemplate
+
+
+class CompiledRuleSet:
+    """1アカウント分のコンパイル済みルール"""
+
+    def __init__(self, rules: list):
+        # rulesは優先度順に並んでいること
+        self.rules = []
+        for rule in rules:
+            reply_text = _resolve_reply_text(rule)
+            self.rules.append(MatchedRule(
+                id=rule.id,
+                keyword=rule.keyword,
+                reply_text=reply_text,
+                template=compile_template_or_literal(reply_text),
+            ))
+        self._automaton = KeywordAutomaton(
+            [normalize_text(rule.keyword) for rule in rules]
+        )
+        self.compiled_at = time.monotonic()
+
+    def match(self, text: str | None) -> MatchedRule | None:
+        """最も優先度の高いマッチしたルールを返す"""
+        index = self._automaton.search(normalize_text(text))
+        return None if index is None else self.rules[index]
+
+
+def _resolve_reply_text(rule) -> str:
+    """返信テキスト決定（有効なテンプレートがあればそちらを使う）"""
+    if rule.template and rule.template.is_active == 1:
+        return rule.template.body
+    return rule.reply_text
+
+
+class RuleMatcherCache:
+    """アカウントごとのコンパイル済みルールのキャッシュ"""
+
+    def __init__(self, rule_model):
+        self.rule_model = rule_model
+        self._cache: dict[int, CompiledRuleSet] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, account_id: int) -> CompiledRuleSet:
+        """コンパイル済みルールを取得（なければDBから読み込んでコンパイル）"""
+        with self._lock:
+            compiled = self._cache.get(account_id)
+        if compiled and time.monotonic() - compiled.compiled_at < settings.RULE_CACHE_TTL_SECONDS:
+            return compiled
+
+        model = self.rule_model
+        rules = (
+            db.query(model)
+            .options(joinedload(model.template))
+            .filter(
+                model.ig_account_id == account_id,
+                model.is_active == 1,
+            )
+            .order_by(model.priority.asc(), model.id.asc())
+            .all()
+        )
+        compiled = CompiledRuleSet(rules)
+        with self._lock:
+            self._cache[account_id] = compiled
+        return compiled
+
+    def invalidate(self, account_id: int | None = None):
+        """キャッシュを無効化（account_id省略時は全アカウント）"""
+        with self._lock:
+            if account_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(account_id, None)
+
+
+comment_rule_cache = RuleMatcherCache(CommentReplyRule)
+dm_rule_cache = RuleMatcherCache(DMReplyRule)
+
+
+def invalidate_rule_caches(account_id: int | None = None):
+    """コメント・DM両方のルールキャッシュを無効化"""
+    comment_rule_cache.invalidate(account_id)
+    dm_rule_cache.invalidate(account_id)
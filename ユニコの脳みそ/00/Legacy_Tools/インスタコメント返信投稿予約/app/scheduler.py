@@ -1,194 +1,742 @@
 """
 予約投稿のスケジューラー
-APSchedulerを使用して定期的に投稿を処理
+期限キュー（app.due_queue）で次の予約時刻まで待ち、期限ちょうどに投稿を処理する。
+APSchedulerは低頻度の安全スイープ（期限キューへの取り込み）とカウンター照合にだけ使う。
+
+期限が来た投稿はバッチ単位で pending -> processing に原子的に更新（クレーム）し、
+ワーカープールで並列に公開する。クレーム済みの投稿は他のティックや
+他プロセスから再取得されないため、二重投稿は発生しない。
+
+公開は2段階で行う。コンテナ作成後、画像はそのまま公開し、動画・リールは
+PUBLISHINGにしてcontainer_pollerがステータスをまとめて確認し、FINISHEDになり次第公開する。
+
+レート制限や一時的なAPIエラーで公開できなかった投稿はFAILEDにせず、
+ジッター付き指数バックオフでやり直す。
+
+バッチの処理時間・予約時刻からの遅れ・公開結果はapp.metricsに記録する。
+
+複数プロセス構成ではSCHEDULER_MODE=leaderにすると、app.leaderのリースを取得した
+1プロセスだけがスケジューラーを動かし、リーダーが落ちたら他プロセスが引き継ぐ。
+他プロセスで作成された投稿はSCHEDULER_LEADER_SWEEP_SECONDSごとのスイープで取り込む。
 """
-from datetime import datetime, timezone
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
 from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import func, select, update
 from sqlalchemy.orm import Session
 
+from app.config import settings
 from app.db import SessionLocal
 from app.models import ScheduledPost, IGAccount
-from app.meta_client import create_media_for_post, publish_media, MetaAPIError
+from app.meta_client import (
+    create_media_for_post, publish_media, get_container_statuses, MetaAPIError, MetaRateLimited
+)
+from app.rate_limiter import backoff_delay
 from app.utils_logging import log_event
-from app.enums import PostStatus
+from app.dashboard_counters import bump_counters, reconcile_dashboard_counters
+from app.due_queue import due_queue
+from app.container_poller import ContainerPoller
+from app.metrics import counter, gauge, histogram, LAG_BUCKETS
+from app.sheets_sync import get_sheets_sync_service, sync_event_logs_to_sheets
+from app.retention import run_retention
+from app.leader import LeaderElector, LeaderLease, SCHEDULER_LEASE_NAME, default_holder_id
+from app.enums import PostStatus, PostType, MediaType, ContainerStatus, SchedulerMode
+
+logger = logging.getLogger(__name__)
 
 scheduler = BackgroundScheduler()
 
+_dispatcher_thread: threading.Thread | None = None
+_elector: LeaderElector | None = None
 
-def process_due_posts():
-    """期限が来た予約投稿を処理"""
+SCHEDULER_BATCH_SECONDS = histogram(
+    "scheduler_batch_seconds",
+    "予約投稿1バッチ（クレームから全ジョブ完了まで）の処理時間",
+    buckets=LAG_BUCKETS,
+)
+SCHEDULER_DUE_LAG_SECONDS = histogram(
+    "scheduler_due_lag_seconds",
+    "予約時刻から投稿をクレームするまでの遅れ",
+    buckets=LAG_BUCKETS,
+)
+SCHEDULER_POSTS_TOTAL = counter(
+    "scheduler_posts_total",
+    "予約投稿の処理結果（result: posted / failed / requeued）",
+    ["result"],
+)
+gauge("scheduler_due_queue_length", "期限キューに登録されているpendingの投稿数", lambda: len(due_queue))
+
+
+def claim_due_posts(db: Session, limit: int) -> list[int]:
+    """
+    期限が来た投稿をpending -> processingに原子的に更新して確保
+
+    再キューされた投稿はnext_attempt_at、それ以外はscheduled_atを期限とする。
+
+    Args:
+        db: データベースセッション
+        limit: 1回で確保する最大件数
+
+    Returns:
+        確保した投稿IDのリスト
+    """
+    now = datetime.now(timezone.utc)
+    due_at = _due_at_column()
+    due_ids = (
+        select(ScheduledPost.id)
+        .where(
+            ScheduledPost.status == PostStatus.PENDING,
+            due_at <= now,
+        )
+        .order_by(due_at.asc())
+        .limit(limit)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(ScheduledPost)
+        .where(
+            ScheduledPost.id.in_(due_ids),
+            # 他のディスパッチャーが先に確保した行は更新されない
+            ScheduledPost.status == PostStatus.PENDING,
+        )
+        .values(status=PostStatus.PROCESSING, updated_at=datetime.utcnow())
+        .returning(ScheduledPost.id, ScheduledPost.scheduled_at)
+        .execution_options(synchronize_session=False)
+    )
+    claimed = db.execute(stmt).all()
+    bump_counters(db, pending_posts=-len(claimed))
+    db.commit()
+    for _, scheduled_at in claimed:
+        SCHEDULER_DUE_LAG_SECONDS.observe(max(0.0, (now - _as_utc(scheduled_at)).total_seconds()))
+    return [post_id for post_id, _ in claimed]
+
+
+def _due_at_column():
+    """投稿を処理する期限（再キュー後はnext_attempt_at）"""
+    return func.coalesce(ScheduledPost.next_attempt_at, ScheduledPost.scheduled_at)
+
+
+def _as_utc(value: datetime) -> datetime:
+    """DBから読んだ日時をUTCのaware datetimeにする（SQLiteはtzなしで返す）"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _build_jobs(db: Session, post_ids: list[int]) -> list[dict]:
+    """
+    確保した投稿とアカウントを一括で読み込み、ワーカーに渡すジョブを作成
+
+    アカウントが存在しない/無効な投稿はここでまとめてFAILEDにする。
+    """
+    posts = db.query(ScheduledPost).filter(ScheduledPost.id.in_(post_ids)).all()
+    account_ids = {post.ig_account_id for post in posts}
+    accounts = {
+        account.id: account
+        for account in db.query(IGAccount).filter(IGAccount.id.in_(account_ids)).all()
+    }
+
+    jobs = []
+    failed = []
+    for post in posts:
+        account = accounts.get(post.ig_account_id)
+        if not account:
+            post.status = PostStatus.FAILED
+            post.error_message = "IGAccount not found"
+            failed.append((post, "ERROR", "Account not found for post"))
+            continue
+        if account.is_active != 1:
+            post.status = PostStatus.FAILED
+            post.error_message = "IGAccount is inactive"
+            failed.append((post, "WARN", "Account is inactive"))
+            continue
+        jobs.append({
+            "post_id": post.id,
+            "account_id": account.id,
+            "ig_user_id": account.ig_user_id,
+            "access_token": account.access_token,
+            "post_type": post.post_type,
+            "media_type": post.media_type,
+            "image_url": post.image_url,
+            "video_url": post.video_url,
+            "caption": post.caption or "",
+            "retry_count": post.retry_count or 0,
+            "creation_id": post.remote_media_id,
+        })
+
+    if failed:
+        db.commit()
+        SCHEDULER_POSTS_TOTAL.inc(len(failed), result="failed")
+        for post, level, message in failed:
+            log_event(
+                db,
+                level=level,
+                source="scheduler",
+                event_type="post_failed",
+                message=message,
+                meta={"post_id": post.id, "account_id": post.ig_account_id},
+            )
+
+    return jobs
+
+
+def _needs_processing(job: dict) -> bool:
+    """公開前にコンテナの処理完了を待つ必要があるか（動画・リール）"""
+    return job["post_type"] == PostType.REEL or job["media_type"] == MediaType.VIDEO
+
+
+def _publish_post(job: dict):
+    """
+    1件の投稿を公開（ワーカースレッドで実行）
+
+    コンテナを作成し、画像はそのまま公開する。動画・リールはコンテナIDを記録して
+    PUBLISHINGにし、処理完了の確認はcontainer_pollerに任せる（トランスコードを待たない）。
+    ワーカーごとに独自のセッションを使用する。
+    """
+    db: Session = SessionLocal()
+    try:
+        try:
+            creation_id = create_media_for_post(
+                ig_user_id=job["ig_user_id"],
+                post_type=job["post_type"],
+                media_type=job["media_type"],
+                image_url=job["image_url"],
+                video_url=job["video_url"],
+                caption=job["caption"],
+                access_token=job["access_token"],
+            )
+        except Exception as e:
+            _handle_publish_error(db, job, e, creation_id=None)
+            return
+
+        if _needs_processing(job):
+            _await_container(db, job, creation_id)
+            return
+        _publish_container(db, job, creation_id)
+    finally:
+        db.close()
+
+
+def _publish_container(db: Session, job: dict, creation_id: str):
+    """作成済みのコンテナを公開"""
+    try:
+        media_id = publish_media(
+            ig_user_id=job["ig_user_id"],
+            creation_id=creation_id,
+            access_token=job["access_token"],
+        )
+    except Exception as e:
+        _handle_publish_error(db, job, e, creation_id=creation_id)
+        return
+    _mark_posted(db, job, creation_id, media_id)
+
+
+def _await_container(
+    db: Session,
+    job: dict,
+    creation_id: str,
+    delay: float | None = None,
+    error_message: str | None = None,
+):
+    """コンテナIDを記録してPUBLISHINGにし、ステータス確認を予約"""
+    db.rollback()
+    db.query(ScheduledPost).filter(ScheduledPost.id == job["post_id"]).update(
+        {
+            ScheduledPost.status: PostStatus.PUBLISHING,
+            ScheduledPost.remote_media_id: creation_id,
+            ScheduledPost.error_message: error_message,
+            ScheduledPost.retry_count: job["retry_count"],
+            ScheduledPost.updated_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    container_poller.add(job, creation_id, delay)
+
+
+def _on_container_resolved(job: dict, creation_id: str, status: str):
+    """
+    ステータスが確定したコンテナを処理（container_pollerのワーカーで実行）
+
+    PUBLISHING -> PROCESSING に更新できた場合だけ処理するため、
+    その間にキャンセルされた投稿や他プロセスが処理した投稿は公開しない。
+    """
     db: Session = SessionLocal()
     try:
-        now = datetime.now(timezone.utc)
-        posts = (
+        claimed = (
             db.query(ScheduledPost)
             .filter(
-                ScheduledPost.status == PostStatus.PENDING,
-                ScheduledPost.scheduled_at <= now,
+                ScheduledPost.id == job["post_id"],
+                ScheduledPost.status == PostStatus.PUBLISHING,
+            )
+            .update(
+                {
+                    ScheduledPost.status: PostStatus.PROCESSING,
+                    ScheduledPost.updated_at: datetime.utcnow(),
+                },
+                synchronize_session=False,
             )
-            .all()
         )
-        
-        if not posts:
+        db.commit()
+        if not claimed:
             return
-        
-        log_event(
-            db,
-            level="INFO",
-            source="scheduler",
-            event_type="post_batch_start",
-            message=f"Processing {len(posts)} due posts",
-            meta={"count": len(posts)},
-        )
-        
-        for post in posts:
-            account: IGAccount = (
-                db.query(IGAccount)
-                .filter(IGAccount.id == post.ig_account_id)
-                .first()
+
+        if status == ContainerStatus.FINISHED:
+            _publish_container(db, job, creation_id)
+        elif status == ContainerStatus.PUBLISHED:
+            # 公開後に結果を書き込む前に停止していた場合
+            _mark_posted(db, job, creation_id, None)
+        else:
+            message = f"Media container {status}"
+            _mark_failed(db, job["post_id"], message, creation_id)
+            log_event(
+                db,
+                level="ERROR",
+                source="scheduler",
+                event_type="post_failed",
+                message=message,
+                meta={"post_id": job["post_id"], "creation_id": creation_id},
             )
-            
-            if not account:
-                post.status = PostStatus.FAILED
-                post.error_message = "IGAccount not found"
-                db.add(post)
-                db.commit()
-                log_event(
-                    db,
-                    level="ERROR",
-                    source="scheduler",
-                    event_type="post_failed",
-                    message="Account not found for post",
-                    meta={"post_id": post.id},
-                )
-                continue
-            
-            if account.is_active != 1:
-                post.status = PostStatus.FAILED
-                post.error_message = "IGAccount is inactive"
-                db.add(post)
-                db.commit()
-                log_event(
-                    db,
-                    level="WARN",
-                    source="scheduler",
-                    event_type="post_failed",
-                    message="Account is inactive",
-                    meta={"post_id": post.id, "account_id": account.id},
-                )
-                continue
-            
-            try:
-                post.status = PostStatus.PROCESSING
-                db.add(post)
-                db.commit()
-                
-                log_event(
-                    db,
-                    level="INFO",
-                    source="scheduler",
-                    event_type="post_processing",
-                    message="Starting post processing",
-                    meta={
-                        "post_id": post.id,
-                        "post_type": post.post_type,
-                        "media_type": post.media_type,
-                    },
-                )
-                
-                # 1. メディアオブジェクト作成
-                creation_id = create_media_for_post(
-                    ig_user_id=account.ig_user_id,
-                    post_type=post.post_type,
-                    media_type=post.media_type,
-                    image_url=post.image_url,
-                    video_url=post.video_url,
-                    caption=post.caption or "",
-                    access_token=account.access_token,
-                )
-                
-                post.remote_media_id = creation_id
-                db.add(post)
-                db.commit()
-                
-                log_event(
-                    db,
-                    level="INFO",
-                    source="scheduler",
-                    event_type="media_created",
-                    message="Media object created",
-                    meta={"post_id": post.id, "creation_id": creation_id},
-                )
-                
-                # 2. メディア公開
-                media_id = publish_media(
-                    ig_user_id=account.ig_user_id,
-                    creation_id=creation_id,
-                    access_token=account.access_token,
-                )
-                
-                post.status = PostStatus.POSTED
-                post.updated_at = datetime.utcnow()
-                db.add(post)
-                db.commit()
-                
+    finally:
+        db.close()
+
+
+def _check_container_statuses(
+    container_ids: list[str],
+    access_token: str,
+    ig_user_id: str,
+) -> dict[str, str]:
+    return get_container_statuses(container_ids, access_token, ig_user_id=ig_user_id)
+
+
+container_poller = ContainerPoller(
+    _check_container_statuses,
+    _on_container_resolved,
+    initial_delay=settings.CONTAINER_POLL_INITIAL_SECONDS,
+    max_delay=settings.CONTAINER_POLL_MAX_SECONDS,
+    max_wait=settings.CONTAINER_MAX_WAIT_MINUTES * 60,
+    workers=settings.SCHEDULER_MAX_WORKERS,
+)
+gauge(
+    "scheduler_containers_pending",
+    "処理完了待ちでステータスを確認中の動画コンテナ数",
+    container_poller.pending_count,
+)
+
+
+def _handle_publish_error(
+    db: Session,
+    job: dict,
+    error: Exception,
+    creation_id: str | None,
+):
+    """
+    公開処理のエラーを処理
+
+    一時的なエラーはバックオフ後にやり直す。コンテナ作成前なら投稿ごとpendingに戻し、
+    作成済みならコンテナを作り直さず公開だけやり直す。それ以外はFAILEDにする。
+    """
+    if isinstance(error, MetaRateLimited):
+        # APIを呼んでいないのでリトライ回数には数えない
+        if creation_id is None:
+            _requeue_post(db, job, str(error), error.retry_after, count_attempt=False)
+        else:
+            _await_container(db, job, creation_id, error.retry_after, str(error))
+        return
+
+    if isinstance(error, MetaAPIError):
+        attempt = job["retry_count"] + 1
+        if error.transient and attempt < settings.RETRY_MAX_ATTEMPTS:
+            delay = max(backoff_delay(attempt), error.retry_after or 0)
+            if creation_id is None:
+                _requeue_post(db, job, str(error), delay)
+            else:
+                job["retry_count"] = attempt
+                _await_container(db, job, creation_id, delay, str(error))
+            return
+        error_message = str(error)
+        message = f"Meta API error: {error}"
+    else:
+        error_message = f"Unexpected error: {error}"
+        message = error_message
+
+    _mark_failed(db, job["post_id"], error_message, creation_id)
+    log_event(
+        db,
+        level="ERROR",
+        source="scheduler",
+        event_type="post_failed",
+        message=message,
+        meta={"post_id": job["post_id"], "error": str(error)},
+    )
+
+
+def _mark_posted(db: Session, job: dict, creation_id: str, media_id: str | None):
+    """投稿をPOSTEDに更新"""
+    db.query(ScheduledPost).filter(ScheduledPost.id == job["post_id"]).update(
+        {
+            ScheduledPost.status: PostStatus.POSTED,
+            ScheduledPost.remote_media_id: creation_id,
+            ScheduledPost.error_message: None,
+            ScheduledPost.updated_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    SCHEDULER_POSTS_TOTAL.inc(result="posted")
+
+    log_event(
+        db,
+        level="INFO",
+        source="scheduler",
+        event_type="post_posted",
+        message="Post published successfully",
+        meta={
+            "post_id": job["post_id"],
+            "creation_id": creation_id,
+            "media_id": media_id,
+        },
+    )
+
+
+def _mark_failed(db: Session, post_id: int, error_message: str, creation_id: str | None):
+    """投稿をFAILEDに更新"""
+    db.rollback()
+    db.query(ScheduledPost).filter(ScheduledPost.id == post_id).update(
+        {
+            ScheduledPost.status: PostStatus.FAILED,
+            ScheduledPost.error_message: error_message,
+            ScheduledPost.remote_media_id: creation_id,
+            ScheduledPost.updated_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    SCHEDULER_POSTS_TOTAL.inc(result="failed")
+
+
+def _requeue_post(
+    db: Session,
+    job: dict,
+    error_message: str,
+    delay: float,
+    count_attempt: bool = True,
+):
+    """投稿をdelay秒後に再実行するようpendingに戻す"""
+    db.rollback()
+    retry_count = job["retry_count"] + 1 if count_attempt else job["retry_count"]
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+    db.query(ScheduledPost).filter(ScheduledPost.id == job["post_id"]).update(
+        {
+            ScheduledPost.status: PostStatus.PENDING,
+            ScheduledPost.next_attempt_at: retry_at,
+            ScheduledPost.error_message: error_message,
+            ScheduledPost.retry_count: retry_count,
+            ScheduledPost.updated_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    bump_counters(db, pending_posts=1)
+    db.commit()
+    SCHEDULER_POSTS_TOTAL.inc(result="requeued")
+    due_queue.schedule(job["post_id"], retry_at)
+
+    log_event(
+        db,
+        level="WARN",
+        source="scheduler",
+        event_type="post_requeued",
+        message=f"Post requeued after transient error: {error_message}",
+        meta={
+            "post_id": job["post_id"],
+            "retry_count": retry_count,
+            "delay_seconds": round(delay, 1),
+        },
+    )
+
+
+def _dispatch_jobs(executor: ThreadPoolExecutor, jobs: list[dict]):
+    """
+    ジョブをワーカープールに投入
+
+    アカウントごとの同時実行数をSCHEDULER_PER_ACCOUNT_CONCURRENCYまでに制限する。
+    上限に達したアカウントのジョブはキューで待たせ、ワーカーは他アカウントの処理に回す。
+    """
+    per_account_limit = max(1, settings.SCHEDULER_PER_ACCOUNT_CONCURRENCY)
+    queues: dict[int, deque] = defaultdict(deque)
+    for job in jobs:
+        queues[job["account_id"]].append(job)
+    in_flight: dict[int, int] = defaultdict(int)
+    futures = {}
+
+    def submit_ready(account_id: int):
+        queue = queues[account_id]
+        while queue and in_flight[account_id] < per_account_limit:
+            job = queue.popleft()
+            in_flight[account_id] += 1
+            futures[executor.submit(_publish_post, job)] = (account_id, job["post_id"])
+
+    for account_id in list(queues):
+        submit_ready(account_id)
+
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            account_id, post_id = futures.pop(future)
+            in_flight[account_id] -= 1
+            exc = future.exception()
+            if exc:
+                logger.error(f"Post worker crashed: post_id={post_id} error={exc}")
+            submit_ready(account_id)
+
+
+def process_due_posts():
+    """期限が来た予約投稿を処理"""
+    batch_size = max(1, settings.SCHEDULER_BATCH_SIZE)
+    db: Session = SessionLocal()
+    try:
+        with ThreadPoolExecutor(
+            max_workers=max(1, settings.SCHEDULER_MAX_WORKERS),
+            thread_name_prefix="post-worker",
+        ) as executor:
+            while True:
+                started = time.perf_counter()
+                post_ids = claim_due_posts(db, batch_size)
+                if not post_ids:
+                    return
+
                 log_event(
                     db,
                     level="INFO",
                     source="scheduler",
-                    event_type="post_posted",
-                    message="Post published successfully",
-                    meta={"post_id": post.id, "media_id": media_id},
-                )
-                
-            except MetaAPIError as e:
-                post.status = PostStatus.FAILED
-                post.error_message = str(e)
-                db.add(post)
-                db.commit()
-                log_event(
-                    db,
-                    level="ERROR",
-                    source="scheduler",
-                    event_type="post_failed",
-                    message=f"Meta API error: {e}",
-                    meta={"post_id": post.id, "error": str(e)},
-                )
-                
-            except Exception as e:
-                post.status = PostStatus.FAILED
-                post.error_message = f"Unexpected error: {e}"
-                db.add(post)
-                db.commit()
-                log_event(
-                    db,
-                    level="ERROR",
-                    source="scheduler",
-                    event_type="post_failed",
-                    message=f"Unexpected error: {e}",
-                    meta={"post_id": post.id, "error": str(e)},
+                    event_type="post_batch_start",
+                    message=f"Processing {len(post_ids)} due posts",
+                    meta={"count": len(post_ids)},
                 )
+
+                jobs = _build_jobs(db, post_ids)
+                db.expunge_all()
+                _dispatch_jobs(executor, jobs)
+                SCHEDULER_BATCH_SECONDS.observe(time.perf_counter() - started)
+
+                if len(post_ids) < batch_size:
+                    return
+
+    finally:
+        db.close()
+
+
+def _due_queue_is_consumed() -> bool:
+    """
+    このプロセスの期限キューをディスパッチャーが読んでいるか
+
+    leader/disabledモードでスケジューラーを動かしていないプロセスは登録しない
+    （リーダーがスイープで取り込む）。
+    """
+    return settings.SCHEDULER_MODE == SchedulerMode.EMBEDDED or _dispatcher_thread is not None
+
+
+def notify_post_scheduled(post_id: int, scheduled_at: datetime):
+    """投稿の作成・リスケジュールを期限キューに反映（コミット後に呼ぶ）"""
+    if _due_queue_is_consumed():
+        due_queue.schedule(post_id, scheduled_at)
+
+
+def notify_posts_scheduled(entries: list[tuple[int, datetime]]):
+    """一括作成した投稿を期限キューに反映（コミット後に呼ぶ）"""
+    if _due_queue_is_consumed():
+        due_queue.schedule_many(entries)
+
+
+def notify_post_canceled(post_id: int):
+    """投稿のキャンセルを期限キューに反映"""
+    due_queue.cancel(post_id)
+
+
+def recover_publishing_posts():
+    """前回の停止時に処理完了待ちだったコンテナをcontainer_pollerに戻す（起動時）"""
+    db: Session = SessionLocal()
+    try:
+        post_ids = [
+            post_id
+            for (post_id,) in db.query(ScheduledPost.id).filter(
+                ScheduledPost.status == PostStatus.PUBLISHING
+            )
+        ]
+        if not post_ids:
+            return
+        for job in _build_jobs(db, post_ids):
+            if job["creation_id"]:
+                container_poller.add(job, job["creation_id"], delay=0)
+    finally:
+        db.close()
+
+
+def sweep_due_posts():
+    """
+    安全スイープ
     
+    近い将来（スイープ間隔の2倍先まで）のpending投稿を期限キューに取り込む。
+    他プロセスで作成・変更された投稿や、期限キューの更新漏れを拾うためのもの。
+    """
+    horizon = datetime.now(timezone.utc) + timedelta(
+        minutes=2 * settings.SCHEDULER_SWEEP_MINUTES
+    )
+    db: Session = SessionLocal()
+    try:
+        due_at = _due_at_column()
+        rows = (
+            db.query(ScheduledPost.id, due_at)
+            .filter(
+                ScheduledPost.status == PostStatus.PENDING,
+                due_at <= horizon,
+            )
+            .all()
+        )
+    finally:
+        db.close()
+    due_queue.schedule_many([(post_id, scheduled_at) for post_id, scheduled_at in rows])
+
+
+def _dispatch_loop():
+    """期限キューの次の期限まで待って投稿を処理（専用スレッドで実行）"""
+    while True:
+        if not due_queue.wait_for_due():
+            return
+        try:
+            process_due_posts()
+        except Exception as e:
+            logger.error(f"Due post dispatch failed: {e}")
+
+
+def reconcile_counters():
+    """ダッシュボード集計カウンターを実数と照合"""
+    db: Session = SessionLocal()
+    try:
+        reconcile_dashboard_counters(db)
     finally:
         db.close()
 
 
+def _sweep_interval() -> dict:
+    """安全スイープの間隔（leaderモードでは他プロセスの投稿を拾うため短くする）"""
+    if settings.SCHEDULER_MODE == SchedulerMode.LEADER:
+        return {"seconds": settings.SCHEDULER_LEADER_SWEEP_SECONDS}
+    return {"minutes": settings.SCHEDULER_SWEEP_MINUTES}
+
+
 def start_scheduler():
     """スケジューラーを開始"""
+    global _dispatcher_thread, scheduler
+    # 停止したBackgroundSchedulerはエグゼキューターを閉じているため、開始のたびに作り直す
+    scheduler = BackgroundScheduler()
+    due_queue.reset()
+    _dispatcher_thread = threading.Thread(
+        target=_dispatch_loop,
+        name="post-dispatcher",
+        daemon=True,
+    )
+    _dispatcher_thread.start()
+    container_poller.start()
+    recover_publishing_posts()
+
     scheduler.add_job(
-        process_due_posts,
+        reconcile_counters,
         "interval",
-        seconds=60,  # 1分ごとにチェック
-        id="process_due_posts",
+        minutes=settings.DASHBOARD_RECONCILE_MINUTES,
+        id="reconcile_dashboard_counters",
         replace_existing=True,
+        next_run_time=datetime.now(timezone.utc),  # 起動直後に1回実行
+        max_instances=1,
+        coalesce=True,
     )
+    scheduler.add_job(
+        sweep_due_posts,
+        "interval",
+        **_sweep_interval(),
+        id="sweep_due_posts",
+        replace_existing=True,
+        next_run_time=datetime.now(timezone.utc),  # 起動直後に期限キューを読み込む
+        max_instances=1,
+        coalesce=True,
+    )
+    if settings.RETENTION_INTERVAL_HOURS > 0:
+        scheduler.add_job(
+            run_retention,
+            "interval",
+            hours=settings.RETENTION_INTERVAL_HOURS,
+            id="run_retention",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+    if get_sheets_sync_service() is not None:
+        scheduler.add_job(
+            sync_event_logs_to_sheets,
+            "interval",
+            minutes=settings.SHEETS_SYNC_MINUTES,
+            id="sync_event_logs_to_sheets",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
     scheduler.start()
     print("Scheduler started")
 
 
 def stop_scheduler():
     """スケジューラーを停止"""
-    scheduler.shutdown()
+    global _dispatcher_thread
+    if scheduler.running:
+        scheduler.shutdown()
+    due_queue.close()
+    if _dispatcher_thread is not None:
+        _dispatcher_thread.join(timeout=30)
+        _dispatcher_thread = None
+    container_poller.stop()
     print("Scheduler stopped")
 
 
+def start_scheduler_service():
+    """
+    SCHEDULER_MODEに応じてスケジューラーを開始（アプリ起動時）
+
+    - embedded: このプロセスで開始
+    - leader: リーダー選出を開始し、リースを取得したらスケジューラーを開始
+    - disabled: 開始しない
+    """
+    global _elector
+    mode = settings.SCHEDULER_MODE
+    if mode == SchedulerMode.EMBEDDED:
+        start_scheduler()
+    elif mode == SchedulerMode.LEADER:
+        lease = LeaderLease(
+            SessionLocal,
+            SCHEDULER_LEASE_NAME,
+            default_holder_id(),
+            settings.SCHEDULER_LEASE_SECONDS,
+        )
+        _elector = LeaderElector(
+            lease,
+            on_elected=start_scheduler,
+            on_demoted=stop_scheduler,
+            renew_interval=settings.SCHEDULER_LEASE_RENEW_SECONDS,
+        )
+        _elector.start()
+        print("Scheduler leader election started")
+    elif mode != SchedulerMode.DISABLED:
+        raise ValueError(f"Unknown SCHEDULER_MODE: {mode}")
+
+
+def stop_scheduler_service():
+    """start_scheduler_serviceで開始したスケジューラーを停止（アプリ終了時）"""
+    global _elector
+    if _elector is not None:
+        _elector.stop()
+        _elector = None
+    elif settings.SCHEDULER_MODE == SchedulerMode.EMBEDDED:
+        stop_scheduler()
@@ -0,0 +1,201 @@
+"""
+Google Sheets同期サービス
+認証済みクライアント・スプレッドシート・ワークシートのハンドルを使い回し、
+書き込みはまとめて1回のAPI呼び出しで行う
+
+- ステータス更新: batch_updateで複数セル範囲を1リクエストで更新
+- AppEventLogのエクスポート: 前回送信したログIDを保存しておき、それより新しい分だけ追記する
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import AppEventLog, SyncCursor
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_HEADERS = ["日時", "レベル", "ソース", "イベントタイプ", "メッセージ", "メタデータ"]
+
+# AppEventLogエクスポートの送信済み位置を保存するカーソル名
+EVENT_LOG_CURSOR = "sheets_event_log_export"
+
+
+def _default_client_factory(service_account_json_path: str):
+    from app.google_sheets_client import get_sheets_client
+
+    return get_sheets_client(service_account_json_path)
+
+
+class SheetsSyncService:
+    """
+    1つのスプレッドシートへの同期処理
+
+    クライアントの認証とスプレッドシート/ワークシートのオープンは初回だけ行う。
+    """
+
+    def __init__(
+        self,
+        spreadsheet_id: str,
+        service_account_json_path: str,
+        client_factory: Callable[[str], object] | None = None,
+    ):
+        self.spreadsheet_id = spreadsheet_id
+        self.service_account_json_path = service_account_json_path
+        self._client_factory = client_factory or _default_client_factory
+        self._spreadsheet = None
+        self._worksheets: dict[str, object] = {}
+        self._header_checked: set[str] = set()
+        self._lock = threading.Lock()
+
+    def worksheet(self, sheet_name: str):
+        """ワークシートのハンドルを取得（キャッシュ）"""
+        worksheet = self._worksheets.get(sheet_name)
+        if worksheet is not None:
+            return worksheet
+        with self._lock:
+            if self._spreadsheet is None:
+                client = self._client_factory(self.service_account_json_path)
+                self._spreadsheet = client.open_by_key(self.spreadsheet_id)
+            worksheet = self._worksheets.get(sheet_name)
+            if worksheet is None:
+                worksheet = self._spreadsheet.worksheet(sheet_name)
+                self._worksheets[sheet_name] = worksheet
+        return worksheet
+
+    def invalidate(self):
+        """キャッシュしたハンドルを破棄（認証エラー・シート削除時など）"""
+        with self._lock:
+            self._spreadsheet = None
+            self._worksheets = {}
+            self._header_checked = set()
+
+    def append_rows(self, sheet_name: str, rows: list[list[str]]):
+        """行をまとめて追記（1回のAPI呼び出し）"""
+        if not rows:
+            return
+        self.worksheet(sheet_name).append_rows(rows, value_input_option="RAW")
+
+    def batch_update_cells(self, sheet_name: str, updates: list[tuple[str, list[list]]]):
+        """
+        複数のセル範囲をまとめて更新（1回のAPI呼び出し）
+
+        Args:
+            updates: (A1形式の範囲, 値の2次元リスト) のリスト
+        """
+        if not updates:
+            return
+        self.worksheet(sheet_name).batch_update(
+            [{"range": cell_range, "values": values} for cell_range, values in updates],
+            value_input_option="RAW",
+        )
+
+    def export_event_logs(
+        self,
+        db: Session,
+        sheet_name: str,
+        batch_size: int = 1000,
+    ) -> int:
+        """
+        前回のエクスポート以降に追加されたAppEventLogをシートに追記
+
+        送信済み位置（ログID）はsync_cursorsテーブルに保存し、
+        追記が成功したバッチの分だけ進める。
+
+        Returns:
+            追記した行数
+        """
+        self._ensure_header(sheet_name, EVENT_LOG_HEADERS)
+        cursor = db.get(SyncCursor, EVENT_LOG_CURSOR)
+        if cursor is None:
+            cursor = SyncCursor(name=EVENT_LOG_CURSOR, last_id=0)
+            db.add(cursor)
+            db.commit()
+
+        exported = 0
+        while True:
+            logs = (
+                db.query(AppEventLog)
+                .filter(AppEventLog.id > cursor.last_id)
+                .order_by(AppEventLog.id.asc())
+                .limit(batch_size)
+                .all()
+            )
+            if not logs:
+                break
+            self.append_rows(sheet_name, [_event_log_row(log) for log in logs])
+            cursor.last_id = logs[-1].id
+            cursor.updated_at = datetime.utcnow()
+            db.commit()
+            exported += len(logs)
+            if len(logs) < batch_size:
+                break
+        return exported
+
+    def _ensure_header(self, sheet_name: str, headers: list[str]):
+        """シートが空ならヘッダー行を書く（確認はシートごとに1回）"""
+        if sheet_name in self._header_checked:
+            return
+        worksheet = self.worksheet(sheet_name)
+        if not worksheet.row_values(1):
+            worksheet.append_rows([headers], value_input_option="RAW")
+        self._header_checked.add(sheet_name)
+
+
+def _event_log_row(log: AppEventLog) -> list[str]:
+    return [
+        log.created_at.isoformat() if log.created_at else "",
+        log.level or "",
+        log.source or "",
+        log.event_type or "",
+        log.message or "",
+        log.meta or "",
+    ]
+
+
+_service: SheetsSyncService | None = None
+_service_lock = threading.Lock()
+
+
+def get_sheets_sync_service() -> SheetsSyncService | None:
+    """設定済みなら共有の同期サービスを取得（未設定ならNone）"""
+    global _service
+    if not settings.GOOGLE_SHEETS_SERVICE_ACCOUNT_JSON or not settings.GOOGLE_SHEETS_SPREADSHEET_ID:
+        return None
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = SheetsSyncService(
+                    settings.GOOGLE_SHEETS_SPREADSHEET_ID,
+                    settings.GOOGLE_SHEETS_SERVICE_ACCOUNT_JSON,
+                )
+    return _service
+
+
+def sync_event_logs_to_sheets() -> int:
+    """AppEventLogをシートへ差分エクスポート（スケジューラーから実行）"""
+    from app.db import SessionLocal
+    from app.utils_logging import flush_event_logs
+
+    service = get_sheets_sync_service()
+    if service is None:
+        return 0
+    # バッファ中のログも含めて送る
+    flush_event_logs()
+    db = SessionLocal()
+    try:
+        return service.export_event_logs(
+            db,
+            settings.GOOGLE_SHEETS_LOG_SHEET_NAME,
+            batch_size=settings.SHEETS_SYNC_BATCH_SIZE,
+        )
+    except Exception as e:
+        db.rollback()
+        service.invalidate()
+        logger.error(f"Sheets event log sync failed: {e}")
+        return 0
+    finally:
+        db.close()
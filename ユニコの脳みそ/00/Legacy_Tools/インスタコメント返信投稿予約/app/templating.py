@@ -0,0 +1,217 @@
+"""
+返信テンプレートのコンパイルと描画
+テンプレート本文（ルールのreply_textも同じ書式）を1回だけ解析して描画関数のリストにし、
+返信のたびには変数の差し込みとランダムな言い回しの選択だけを行う
+
+書式:
+- {username}: コメントしたユーザーの@ユーザー名（不明なら空）
+- {caption}: コメントされた投稿のキャプション（このツールで投稿したものだけ。不明なら空）
+- {greeting}: 時間帯のあいさつ（おはようございます / こんにちは / こんばんは）
+- {time_of_day}: 時間帯（朝 / 昼 / 夜）
+- {A|B|C}: A・B・Cのどれかをランダムに使う（中に変数や別の候補を入れられる）
+- {{ / }}: 波かっこそのもの
+
+未知の変数名（{foo}）はそのまま出力するため、既存の文面はこれまでどおり送られる。
+時間帯はTEMPLATE_TIMEZONEの現地時刻で判定する。
+"""
+import random
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Callable, NamedTuple
+from zoneinfo import ZoneInfo
+
+from app.config import settings
+
+
+class TemplateSyntaxError(ValueError):
+    """テンプレートの書式エラー（閉じていない候補グループなど）"""
+
+
+class TemplateContext(NamedTuple):
+    """描画時に差し込む値"""
+    username: str | None = None
+    caption: str | None = None
+    now: datetime | None = None
+
+
+def _local_hour(context: TemplateContext) -> int:
+    now = context.now or datetime.now(timezone.utc)
+    if now.tzinfo is None:
+        now = now.replace(tzinfo=timezone.utc)
+    return now.astimezone(ZoneInfo(settings.TEMPLATE_TIMEZONE)).hour
+
+
+def _greeting(context: TemplateContext) -> str:
+    hour = _local_hour(context)
+    if 4 <= hour < 11:
+        return "おはようございます"
+    if 11 <= hour < 18:
+        return "こんにちは"
+    return "こんばんは"
+
+
+def _time_of_day(context: TemplateContext) -> str:
+    hour = _local_hour(context)
+    if 4 <= hour < 11:
+        return "朝"
+    if 11 <= hour < 18:
+        return "昼"
+    return "夜"
+
+
+VARIABLES: dict[str, Callable[[TemplateContext], str]] = {
+    "username": lambda context: context.username or "",
+    "caption": lambda context: context.caption or "",
+    "greeting": _greeting,
+    "time_of_day": _time_of_day,
+}
+
+# 描画の部品: 固定文字列 / 変数 / 候補グループ
+_Part = str | tuple
+
+
+class CompiledTemplate:
+    """コンパイル済みテンプレート"""
+
+    def __init__(self, source: str, parts: list[_Part]):
+        self.source = source
+        self._parts = parts
+        self.variables = frozenset(_collect_variables(parts))
+        # 変数も候補もなければ描画せずに固定文字列を返す
+        self._static = parts[0] if len(parts) == 1 and isinstance(parts[0], str) else None
+        if not parts:
+            self._static = ""
+
+    @property
+    def is_static(self) -> bool:
+        return self._static is not None
+
+    def render(self, context: TemplateContext | None = None, rng: random.Random | None = None) -> str:
+        """値を差し込んで返信テキストを作成"""
+        if self._static is not None:
+            return self._static
+        return _render_parts(self._parts, context or TemplateContext(), rng or random)
+
+
+def _render_parts(parts: list[_Part], context: TemplateContext, rng) -> str:
+    out = []
+    for part in parts:
+        if isinstance(part, str):
+            out.append(part)
+        elif part[0] == "var":
+            out.append(part[1](context))
+        else:
+            out.append(_render_parts(rng.choice(part[1]), context, rng))
+    return "".join(out)
+
+
+def _collect_variables(parts: list[_Part]) -> set[str]:
+    names = set()
+    for part in parts:
+        if isinstance(part, str):
+            continue
+        if part[0] == "var":
+            names.add(part[2])
+        else:
+            for variant in part[1]:
+                names |= _collect_variables(variant)
+    return names
+
+
+class _Parser:
+    """波かっこの入れ子を再帰的に解析"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.pos = 0
+
+    def parse(self) -> list[_Part]:
+        parts, _ = self._sequence(top_level=True)
+        return parts
+
+    def _sequence(self, top_level: bool) -> tuple[list[_Part], str | None]:
+        """
+        終端（トップレベルでは文字列の終わり、グループ内では | か }）まで読む
+
+        Returns:
+            (部品のリスト, 読んだ終端文字)
+        """
+        source = self.source
+        parts: list[_Part] = []
+        literal: list[str] = []
+
+        def flush():
+            if literal:
+                parts.append("".join(literal))
+                literal.clear()
+
+        while self.pos < len(source):
+            ch = source[self.pos]
+            if ch == "{" and source.startswith("{{", self.pos):
+                literal.append("{")
+                self.pos += 2
+            elif ch == "}" and source.startswith("}}", self.pos) and top_level:
+                literal.append("}")
+                self.pos += 2
+            elif ch == "{":
+                part = self._group()
+                if isinstance(part, str):
+                    literal.append(part)
+                else:
+                    flush()
+                    parts.append(part)
+            elif not top_level and ch in "|}":
+                self.pos += 1
+                flush()
+                return parts, ch
+            else:
+                literal.append(ch)
+                self.pos += 1
+        flush()
+        return parts, None
+
+    def _group(self) -> _Part:
+        """{ から対応する } までを変数か候補グループとして読む"""
+        start = self.pos
+        end = self.source.find("}", start)
+        name = self.source[start + 1:end] if end != -1 else None
+        if name is not None and name.isidentifier():
+            self.pos = end + 1
+            resolver = VARIABLES.get(name)
+            if resolver is None:
+                # 未知の変数名は文字列として残す
+                return self.source[start:end + 1]
+            return ("var", resolver, name)
+
+        self.pos = start + 1
+        variants = []
+        while True:
+            parts, terminator = self._sequence(top_level=False)
+            variants.append(parts)
+            if terminator == "}":
+                break
+            if terminator is None:
+                raise TemplateSyntaxError(f"Unclosed '{{' at position {start}")
+        if len(variants) == 1:
+            # 候補が1つだけの {...} は波かっこごと出力する（中の変数は差し込む）
+            return ("choice", [["{", *variants[0], "}"]])
+        return ("choice", variants)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(source: str) -> CompiledTemplate:
+    """
+    テンプレートをコンパイル（同じ本文は1回だけ解析する）
+
+    Raises:
+        TemplateSyntaxError: 候補グループが閉じていない場合
+    """
+    return CompiledTemplate(source, _Parser(source or "").parse())
+
+
+def compile_template_or_literal(source: str) -> CompiledTemplate:
+    """コンパイルできない本文は書式を解釈せずにそのまま送る（保存済みの既存データ用）"""
+    try:
+        return compile_template(source)
+    except TemplateSyntaxError:
+        return CompiledTemplate(source, [source] if source else [])
@@ -1,17 +1,147 @@
 """
 アプリケーションイベントログユーティリティ
 PythonロガーとDBのAppEventLogの両方に記録
+
+DBへの書き込みはメモリ上のバッファに積み、バックグラウンドのライターが
+件数または時間のしきい値でまとめてINSERTする。呼び出し側はコミットを待たない。
 """
+import atexit
 import json
 import logging
+import threading
+from collections import deque
+from datetime import datetime
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from app.config import settings
+from app.db import SessionLocal
+from app.metrics import gauge
 from app.models import AppEventLog
 
 logger = logging.getLogger(__name__)
 
 
+class EventLogSink:
+    """AppEventLogの非同期書き込みバッファ"""
+    
+    def __init__(self, max_buffer: int, batch_size: int, flush_interval: float):
+        self.max_buffer = max(1, max_buffer)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._buffer: deque[dict] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._dropped = 0
+    
+    def put(self, row: dict):
+        """行をバッファに追加（バッファが満杯なら最も古い行を破棄）"""
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self._buffer.popleft()
+                self._dropped += 1
+            self._buffer.append(row)
+            size = len(self._buffer)
+        self._ensure_started()
+        if size >= self.batch_size:
+            self._wakeup.set()
+    
+    def pending(self) -> int:
+        """未書き込みの行数"""
+        with self._lock:
+            return len(self._buffer)
+    
+    def flush(self) -> int:
+        """バッファの内容をすべて書き込む（書き込んだ件数を返す）"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._buffer:
+                        dropped, self._dropped = self._dropped, 0
+                        break
+                    count = min(self.batch_size, len(self._buffer))
+                    rows = [self._buffer.popleft() for _ in range(count)]
+                written += self._write(rows)
+        if dropped:
+            logger.warning(f"Event log buffer overflow: {dropped} events dropped")
+        return written
+    
+    def start(self):
+        """ライタースレッドを開始"""
+        self._ensure_started()
+    
+    def stop(self):
+        """ライタースレッドを停止し、残りを書き込む"""
+        self._stop.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+        self._stop.clear()
+    
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run,
+                name="event-log-writer",
+                daemon=True,
+            )
+            self._thread.start()
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Event log writer error: {e}")
+    
+    def _write(self, rows: list[dict]) -> int:
+        """1回のバルクINSERTで書き込む"""
+        db = SessionLocal()
+        try:
+            db.execute(insert(AppEventLog), rows)
+            db.commit()
+            return len(rows)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to write {len(rows)} event logs: {e}")
+            return 0
+        finally:
+            db.close()
+
+
+event_log_sink = EventLogSink(
+    max_buffer=settings.EVENT_LOG_BUFFER_SIZE,
+    batch_size=settings.EVENT_LOG_FLUSH_BATCH_SIZE,
+    flush_interval=settings.EVENT_LOG_FLUSH_INTERVAL,
+)
+atexit.register(event_log_sink.stop)
+gauge("event_log_buffer_size", "書き込み待ちのAppEventLogの行数", event_log_sink.pending)
+
+
+def flush_event_logs() -> int:
+    """バッファ中のイベントログを即座に書き込む"""
+    return event_log_sink.flush()
+
+
+def stop_event_log_writer():
+    """ライターを停止し、残りのイベントログを書き込む（アプリ終了時）"""
+    event_log_sink.stop()
+
+
 def log_event(
-    db: Session,
+    db: Session | None,
     *,
     level: str = "INFO",
     source: str,
@@ -23,7 +153,7 @@ def log_event(
     アプリケーションイベントをログに記録
     
     Args:
-        db: データベースセッション
+        db: データベースセッション（互換性のため残している。書き込みには使わない）
         level: ログレベル (DEBUG, INFO, WARN, ERROR)
         source: イベントの発生元 (scheduler, webhook_comment, etc.)
         event_type: イベントタイプ (post_posted, comment_received, etc.)
@@ -33,16 +163,15 @@ def log_event(
     level_upper = level.upper()
     meta_str = json.dumps(meta, ensure_ascii=False) if meta else None
     
-    # DBに保存
-    log = AppEventLog(
-        level=level_upper,
-        source=source,
-        event_type=event_type,
-        message=message,
-        meta=meta_str,
-    )
-    db.add(log)
-    db.commit()
+    # DBへはバッファ経由で書き込む
+    event_log_sink.put({
+        "level": level_upper,
+        "source": source,
+        "event_type": event_type,
+        "message": message,
+        "meta": meta_str,
+        "created_at": datetime.utcnow(),
+    })
     
     # Pythonロガーにも出力
     log_msg = f"[{source}] {event_type} - {message or ''}"
@@ -57,5 +186,3 @@ def log_event(
         logger.debug(log_msg)
     else:
         logger.info(log_msg)
-
-
@@ -0,0 +1,596 @@
+"""
+Webhookイベント処理
+キューから取り出したコメント/DMイベントを処理し、自動返信を行う
+"""
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.models import IGAccount, CommentLog, DMLog, ScheduledPost
+from app.meta_client import MetaAPIError, MetaRateLimited, reply_to_comment, send_instagram_dm
+from app.dm_utils import conversation_cache, can_auto_reply, flush_conversation_updates
+from app.dashboard_counters import bump_counters
+from app.rate_limiter import backoff_delay
+from app.rule_matcher import comment_rule_cache, dm_rule_cache, MatchedRule
+from app.templating import TemplateContext
+from app.utils_logging import log_event
+from app.webhook_queue import WEBHOOK_STAGE_SECONDS, WEBHOOK_EVENTS_TOTAL, EventRetry
+
+logger = logging.getLogger(__name__)
+
+EVENT_KIND_COMMENT = "comment"
+EVENT_KIND_DM = "dm"
+
+
+# ==================== ペイロード分解 ====================
+
+def _iter_changes(payload: dict):
+    """entry[].changes[] を (entry, change) で順に返す（辞書でない要素は読み飛ばす）"""
+    entries = payload.get("entry")
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        changes = entry.get("changes")
+        for change in changes if isinstance(changes, list) else []:
+            if isinstance(change, dict) and isinstance(change.get("value", {}), dict):
+                yield entry, change
+
+
+def parse_comment_events(payload: dict) -> list[dict]:
+    """
+    コメントWebhookのペイロードをキュー投入用のイベントに分解
+
+    Returns:
+        {"kind", "dedup_key", "data"} の辞書のリスト
+    """
+    events = []
+    for entry, change in _iter_changes(payload):
+        if change.get("field") != "comments":
+            continue
+        value = change.get("value", {})
+        comment_id = value.get("id")
+        events.append({
+            "kind": EVENT_KIND_COMMENT,
+            "dedup_key": f"{EVENT_KIND_COMMENT}:{comment_id}" if comment_id else None,
+            # ig_user_idを取得（アカウント特定用）
+            # 実際のWebhookペイロード構造に応じて調整
+            "data": {"entry_id": entry.get("id"), "value": value},
+        })
+    return events
+
+
+def parse_dm_events(payload: dict) -> list[dict]:
+    """
+    DM Webhookのペイロードをキュー投入用のイベントに分解
+
+    Returns:
+        {"kind", "dedup_key", "data"} の辞書のリスト
+    """
+    events = []
+    for entry, change in _iter_changes(payload):
+        if change.get("field") not in ("messages", "instagram_messages"):
+            continue
+        value = change.get("value", {})
+        message = value.get("message")
+        message_id = message.get("mid") if isinstance(message, dict) else None
+        events.append({
+            "kind": EVENT_KIND_DM,
+            "dedup_key": f"{EVENT_KIND_DM}:{message_id}" if message_id else None,
+            "data": {"entry_id": entry.get("id"), "value": value},
+        })
+    return events
+
+
+# ==================== バッチ処理 ====================
+
+def handle_event_batch(events: list[dict]) -> dict[int, EventRetry]:
+    """
+    キューから取り出したイベントをまとめて処理
+
+    自動返信がレート制限や一時的なエラーで送れなかったイベントは、
+    待ち時間を付けてキューに戻す（ログは保存済みなので、再処理では返信だけやり直す）。
+
+    Args:
+        events: {"id", "kind", "data", "attempts"} の辞書のリスト
+
+    Returns:
+        処理に失敗した（リトライすべき）イベントの {イベントID: EventRetry}
+    """
+    db: Session = SessionLocal()
+    failures: dict[int, EventRetry] = {}
+    try:
+        accounts = _load_accounts(db, events)
+        for event in events:
+            started = time.perf_counter()
+            try:
+                if event["kind"] == EVENT_KIND_COMMENT:
+                    process_comment_event(db, event["data"], accounts)
+                elif event["kind"] == EVENT_KIND_DM:
+                    process_dm_event(db, event["data"], accounts)
+                else:
+                    logger.warning(f"Unknown webhook event kind: {event['kind']}")
+                result = "processed"
+            except MetaAPIError as e:
+                # 返信処理で再送すべきエラーだけがここまで来る
+                db.rollback()
+                failures[event["id"]] = _reply_retry(e, event.get("attempts", 0))
+                result = "deferred"
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Webhook event {event['id']} failed: {e}")
+                failures[event["id"]] = EventRetry()
+                result = "failed"
+            WEBHOOK_STAGE_SECONDS.observe(
+                time.perf_counter() - started, kind=event["kind"], stage="process"
+            )
+            WEBHOOK_EVENTS_TOTAL.inc(kind=event["kind"], result=result)
+        # バッチ内の会話状態の更新をまとめて反映
+        try:
+            flush_conversation_updates(db)
+        except Exception as e:
+            logger.error(f"Failed to flush conversation updates: {e}")
+        return failures
+    finally:
+        db.close()
+
+
+def _reply_retry(error: MetaAPIError, attempts: int) -> EventRetry:
+    """返信できなかったイベントをいつ再処理するか"""
+    if isinstance(error, MetaRateLimited):
+        # APIは呼んでいないので試行回数に数えない。同じバケット待ちのイベントが一斉に戻らないようずらす
+        return EventRetry(
+            delay=error.retry_after + random.uniform(0, error.retry_after),
+            count_attempt=False,
+        )
+    return EventRetry(delay=max(backoff_delay(attempts + 1), error.retry_after or 0))
+
+
+def _load_accounts(db: Session, events: list[dict]) -> dict[str, IGAccount]:
+    """バッチ内のイベントに関係するアカウントを1クエリで取得"""
+    ig_user_ids = set()
+    for event in events:
+        ig_user_id = _event_ig_user_id(event["kind"], event["data"])
+        if ig_user_id:
+            ig_user_ids.add(ig_user_id)
+    if not ig_user_ids:
+        return {}
+    accounts = db.query(IGAccount).filter(IGAccount.ig_user_id.in_(ig_user_ids)).all()
+    # コミットのたびに再読み込みされないようセッションから切り離す
+    for account in accounts:
+        db.expunge(account)
+    return {account.ig_user_id: account for account in accounts}
+
+
+def _event_ig_user_id(kind: str, data: dict) -> str | None:
+    """イベントから対象アカウントのig_user_idを取り出す"""
+    if kind == EVENT_KIND_COMMENT:
+        return data.get("entry_id")  # または適切なフィールド
+    to_list = data.get("value", {}).get("to", [])
+    return to_list[0].get("id") if to_list else None
+
+
+# ==================== 返信テキスト ====================
+
+def _media_caption(db: Session, account_id: int, media_id: str | None) -> str | None:
+    """このツールで投稿したメディアのキャプション（他の方法で投稿したものはNone）"""
+    if not media_id:
+        return None
+    row = (
+        db.query(ScheduledPost.caption)
+        .filter(
+            ScheduledPost.remote_media_id == media_id,
+            ScheduledPost.ig_account_id == account_id,
+        )
+        .first()
+    )
+    return row[0] if row else None
+
+
+def render_reply(
+    db: Session,
+    matched_rule: MatchedRule,
+    *,
+    account_id: int,
+    username: str | None = None,
+    media_id: str | None = None,
+) -> str:
+    """
+    マッチしたルールの返信テキストを作成
+
+    テンプレートはコンパイル済みなので解析は行わない。
+    キャプションはテンプレートが使う場合だけDBから読む。
+    """
+    template = matched_rule.template
+    if template.is_static:
+        return template.render()
+    caption = None
+    if "caption" in template.variables:
+        caption = _media_caption(db, account_id, media_id)
+    return template.render(TemplateContext(
+        username=username,
+        caption=caption,
+        now=datetime.now(timezone.utc),
+    ))
+
+
+# ==================== コメント ====================
+
+def process_comment_event(db: Session, data: dict, accounts: dict[str, IGAccount]):
+    """コメントイベント1件を処理"""
+    value = data.get("value", {})
+
+    # Webhookペイロードの構造は実際のMeta APIに合わせて調整が必要
+    # 以下は一般的な構造の例
+    comment_id = value.get("id")
+    text = value.get("text")
+    from_user = value.get("from", {})
+    instagram_user_id = from_user.get("id")
+    media_id = value.get("media", {}).get("id")
+    ig_user_id = _event_ig_user_id(EVENT_KIND_COMMENT, data)
+
+    if not comment_id or not ig_user_id:
+        log_event(
+            db,
+            level="WARN",
+            source="webhook_comment",
+            event_type="comment_parse_failed",
+            message="Missing comment_id or ig_user_id in webhook",
+            meta={"payload_snippet": str(data)[:200]},
+        )
+        return
+
+    account = accounts.get(ig_user_id)
+
+    if not account:
+        log_event(
+            db,
+            level="WARN",
+            source="webhook_comment",
+            event_type="comment_account_not_found",
+            message=f"IGAccount not found for ig_user_id: {ig_user_id}",
+            meta={"comment_id": comment_id},
+        )
+        return
+
+    # 重複チェック（キューの重複排除期間を過ぎた再送や、返信を後回しにしたイベントの再処理）
+    log = db.query(CommentLog).filter(
+        CommentLog.instagram_comment_id == comment_id
+    ).first()
+
+    if log and log.replied:
+        log_event(
+            db,
+            level="DEBUG",
+            source="webhook_comment",
+            event_type="comment_duplicate",
+            message="Duplicate comment webhook ignored",
+            meta={"comment_id": comment_id},
+        )
+        return
+
+    if not log:
+        # コメントログ保存
+        log = CommentLog(
+            ig_account_id=account.id,
+            instagram_comment_id=comment_id,
+            instagram_user_id=instagram_user_id,
+            media_id=media_id,
+            text=text,
+        )
+        db.add(log)
+        bump_counters(db, unhandled_comments=1)
+        db.commit()
+        db.refresh(log)
+
+        log_event(
+            db,
+            level="INFO",
+            source="webhook_comment",
+            event_type="comment_received",
+            message="Comment received and logged",
+            meta={
+                "comment_log_id": log.id,
+                "comment_id": comment_id,
+                "text_preview": (text or "")[:50],
+            },
+        )
+
+    # 自動返信ルール適用
+    with WEBHOOK_STAGE_SECONDS.time(kind=EVENT_KIND_COMMENT, stage="rule_match"):
+        matched_rule = comment_rule_cache.get(db, account.id).match(text)
+
+    if not matched_rule:
+        log_event(
+            db,
+            level="DEBUG",
+            source="webhook_comment",
+            event_type="comment_no_rule_match",
+            message="No comment reply rule matched",
+            meta={"comment_log_id": log.id},
+        )
+        return
+
+    # 返信テキスト決定（テンプレートはルールのキャッシュ作成時にコンパイル済み）
+    reply_text = render_reply(
+        db,
+        matched_rule,
+        account_id=account.id,
+        username=from_user.get("username"),
+        media_id=media_id,
+    )
+
+    # コメント返信
+    try:
+        reply_id = reply_to_comment(
+            comment_id=comment_id,
+            message=reply_text,
+            access_token=account.access_token,
+            ig_user_id=account.ig_user_id,
+            max_wait=0,  # ワーカーを止めずにイベントごとキューへ戻す
+        )
+
+        now_utc = datetime.now(timezone.utc)
+        log.replied = 1
+        log.used_rule_id = matched_rule.id
+        log.replied_at = now_utc
+        db.add(log)
+        bump_counters(db, unhandled_comments=-1)
+        db.commit()
+
+        log_event(
+            db,
+            level="INFO",
+            source="webhook_comment",
+            event_type="comment_auto_replied",
+            message="Comment auto-replied successfully",
+            meta={
+                "comment_log_id": log.id,
+                "rule_id": matched_rule.id,
+                "reply_id": reply_id,
+            },
+        )
+    except MetaAPIError as e:
+        db.rollback()
+        if not e.transient:
+            _log_comment_reply_failed(db, log.id, e)
+            return
+        log_event(
+            db,
+            level="WARN",
+            source="webhook_comment",
+            event_type="comment_auto_reply_deferred",
+            message=f"Comment auto-reply deferred: {e}",
+            meta={
+                "comment_log_id": log.id,
+                "retry_after": e.retry_after,
+                "error": str(e),
+            },
+        )
+        raise
+    except Exception as e:
+        db.rollback()
+        _log_comment_reply_failed(db, log.id, e)
+
+
+def _log_comment_reply_failed(db: Session, comment_log_id: int, error: Exception):
+    log_event(
+        db,
+        level="ERROR",
+        source="webhook_comment",
+        event_type="comment_auto_reply_failed",
+        message=f"Failed to auto-reply to comment: {error}",
+        meta={
+            "comment_log_id": comment_log_id,
+            "error": str(error),
+        },
+    )
+
+
+# ==================== DM ====================
+
+def process_dm_event(db: Session, data: dict, accounts: dict[str, IGAccount]):
+    """DMイベント1件を処理"""
+    value = data.get("value", {})
+
+    # Webhookペイロードの構造は実際のMeta APIに合わせて調整が必要
+    ig_user_id = _event_ig_user_id(EVENT_KIND_DM, data)
+    from_user = value.get("from", {})
+    sender_id = from_user.get("id")
+    message_obj = value.get("message")
+    if not isinstance(message_obj, dict):
+        message_obj = {}
+    text = message_obj.get("text")
+    message_id = message_obj.get("mid")
+
+    if not ig_user_id or not sender_id:
+        log_event(
+            db,
+            level="WARN",
+            source="webhook_dm",
+            event_type="dm_parse_failed",
+            message="Missing ig_user_id or sender_id in DM webhook",
+            meta={"payload_snippet": str(data)[:200]},
+        )
+        return
+
+    account = accounts.get(ig_user_id)
+
+    if not account:
+        log_event(
+            db,
+            level="WARN",
+            source="webhook_dm",
+            event_type="dm_account_not_found",
+            message=f"IGAccount not found for ig_user_id: {ig_user_id}",
+            meta={"sender_id": sender_id},
+        )
+        return
+
+    # 重複チェック（キューの重複排除期間を過ぎた再送や、返信を後回しにしたイベントの再処理）
+    log = None
+    if message_id:
+        log = db.query(DMLog).filter(
+            DMLog.message_id == message_id,
+            DMLog.direction == "in",
+        ).first()
+
+    if log and log.replied:
+        log_event(
+            db,
+            level="DEBUG",
+            source="webhook_dm",
+            event_type="dm_duplicate",
+            message="Duplicate DM webhook ignored",
+            meta={"message_id": message_id},
+        )
+        return
+
+    if not log:
+        # 会話状態更新（DBへはバッチの最後にまとめて反映）
+        now_utc = datetime.now(timezone.utc)
+        conversation_cache.record_user_message(account.id, sender_id, now_utc)
+
+        log_event(
+            db,
+            level="DEBUG",
+            source="webhook_dm",
+            event_type="conversation_updated",
+            message="User conversation updated",
+            meta={"account_id": account.id, "sender_id": sender_id},
+        )
+
+        # DMログ保存
+        log = DMLog(
+            ig_account_id=account.id,
+            instagram_user_id=sender_id,
+            thread_id=None,  # 必要に応じて取得
+            message_id=message_id,
+            direction="in",
+            text=text,
+        )
+        db.add(log)
+        bump_counters(db, unhandled_dms=1)
+        db.commit()
+        db.refresh(log)
+
+        log_event(
+            db,
+            level="INFO",
+            source="webhook_dm",
+            event_type="dm_received",
+            message="DM received and logged",
+            meta={
+                "dm_log_id": log.id,
+                "sender_id": sender_id,
+                "text_preview": (text or "")[:50],
+            },
+        )
+
+    # 自動返信ルール適用
+    with WEBHOOK_STAGE_SECONDS.time(kind=EVENT_KIND_DM, stage="rule_match"):
+        matched_rule = dm_rule_cache.get(db, account.id).match(text)
+
+    if not matched_rule:
+        log_event(
+            db,
+            level="DEBUG",
+            source="webhook_dm",
+            event_type="dm_no_rule_match",
+            message="No DM reply rule matched",
+            meta={"dm_log_id": log.id},
+        )
+        return
+
+    # 24時間ルールチェック
+    if not can_auto_reply(db, account.id, sender_id):
+        log_event(
+            db,
+            level="WARN",
+            source="webhook_dm",
+            event_type="dm_auto_reply_blocked_24h",
+            message="DM auto-reply blocked by 24-hour rule",
+            meta={"dm_log_id": log.id, "sender_id": sender_id},
+        )
+        return
+
+    # 返信テキスト決定（テンプレートはルールのキャッシュ作成時にコンパイル済み）
+    message_body = render_reply(
+        db,
+        matched_rule,
+        account_id=account.id,
+        username=from_user.get("username"),
+    )
+
+    # DM送信
+    try:
+        msg_id = send_instagram_dm(
+            ig_user_id=account.ig_user_id,
+            recipient_id=sender_id,
+            message=message_body,
+            access_token=account.access_token,
+            max_wait=0,  # ワーカーを止めずにイベントごとキューへ戻す
+        )
+
+        now_utc = datetime.now(timezone.utc)
+        log.replied = 1
+        log.used_rule_id = matched_rule.id
+        log.replied_at = now_utc
+        db.add(log)
+
+        conversation_cache.record_bot_message(account.id, sender_id, now_utc)
+        bump_counters(db, unhandled_dms=-1)
+        db.commit()
+
+        log_event(
+            db,
+            level="INFO",
+            source="webhook_dm",
+            event_type="dm_auto_replied",
+            message="DM auto-replied successfully",
+            meta={
+                "dm_log_id": log.id,
+                "sender_id": sender_id,
+                "rule_id": matched_rule.id,
+                "out_msg_id": msg_id,
+            },
+        )
+    except MetaAPIError as e:
+        db.rollback()
+        if not e.transient:
+            _log_dm_reply_failed(db, log.id, sender_id, e)
+            return
+        log_event(
+            db,
+            level="WARN",
+            source="webhook_dm",
+            event_type="dm_auto_reply_deferred",
+            message=f"DM auto-reply deferred: {e}",
+            meta={
+                "dm_log_id": log.id,
+                "sender_id": sender_id,
+                "retry_after": e.retry_after,
+                "error": str(e),
+            },
+        )
+        raise
+    except Exception as e:
+        db.rollback()
+        _log_dm_reply_failed(db, log.id, sender_id, e)
+
+
+def _log_dm_reply_failed(db: Session, dm_log_id: int, sender_id: str, error: Exception):
+    log_event(
+        db,
+        level="ERROR",
+        source="webhook_dm",
+        event_type="dm_auto_reply_failed",
+        message=f"Failed to auto-reply to DM: {error}",
+        meta={
+            "dm_log_id": dm_log_id,
+            "sender_id": sender_id,
+            "error": str(error),
+        },
+    )
@@ -0,0 +1,413 @@
+"""
+Webhook受信キュー
+Metaからのイベントをローカルの永続キュー（SQLite）に保存し、
+バックグラウンドのワーカーがバッチ単位で処理する
+
+- Webhookエンドポイントはキューへの書き込みだけ行い、即座に200を返す
+- 再送されたイベントは dedup_key（コメントID / メッセージID）で重複排除する
+- 処理中にプロセスが落ちたイベントは、processingのままWEBHOOK_QUEUE_STALE_SECONDSを過ぎたら
+  pendingへ戻す（複数プロセスで同じキューを処理しても、他プロセスの処理中のイベントは戻さない）
+- レート制限などで後回しにしたイベントは、available_atを過ぎるまで取り出さない
+
+受信・キュー待ち・処理の各段階の所要時間はWEBHOOK_STAGE_SECONDSに記録する。
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple
+
+from app.config import settings
+from app.enums import WebhookEventStatus
+from app.metrics import counter, gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+# 受信（HTTP応答まで）はミリ秒単位、キュー待ちは詰まると分単位になる
+_STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+WEBHOOK_STAGE_SECONDS = histogram(
+    "webhook_stage_seconds",
+    "Webhookイベントの段階ごとの所要時間（stage: receive / queue_wait / rule_match / process）",
+    ["kind", "stage"],
+    buckets=_STAGE_BUCKETS,
+)
+WEBHOOK_EVENTS_TOTAL = counter(
+    "webhook_events_total",
+    "Webhookイベント数（result: enqueued / duplicate / processed / deferred / failed）",
+    ["kind", "result"],
+)
+
+
+class EventRetry(NamedTuple):
+    """処理に失敗したイベントの再試行方法"""
+    delay: float = 0.0  # この秒数が過ぎるまで取り出さない
+    count_attempt: bool = True  # Falseならリトライ上限の回数に数えない（APIを呼ばずに後回しにした場合）
+
+
+class WebhookQueue:
+    """SQLiteファイルを使った永続キュー"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_schema()
+
+    def _conn(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS webhook_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                dedup_key TEXT UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(webhook_events)")}
+        if "available_at" not in columns:
+            # available_at追加前に作成したキューファイル
+            conn.execute("ALTER TABLE webhook_events ADD COLUMN available_at TEXT")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_webhook_events_status_id "
+            "ON webhook_events (status, id)"
+        )
+
+    def enqueue(self, events: list[dict]) -> int:
+        """
+        イベントをキューに追加
+
+        Args:
+            events: {"kind", "dedup_key", "data"} の辞書のリスト
+
+        Returns:
+            新規に追加された件数（重複は除外）
+        """
+        if not events:
+            return 0
+        now = datetime.utcnow().isoformat()
+        conn = self._conn()
+        before = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO webhook_events "
+                "(kind, dedup_key, payload, status, attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?)",
+                [
+                    (
+                        event["kind"],
+                        event.get("dedup_key"),
+                        json.dumps(event["data"], ensure_ascii=False),
+                        WebhookEventStatus.PENDING,
+                        now,
+                        now,
+                    )
+                    for event in events
+                ],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return conn.total_changes - before
+
+    def claim(self, limit: int) -> list[dict]:
+        """
+        pendingのイベントをprocessingに原子的に更新して取り出す（available_at前のものは除く）
+
+        Returns:
+            {"id", "kind", "data", "attempts", "created_at"} の辞書のリスト（古い順）
+        """
+        now = datetime.utcnow().isoformat()
+        rows = self._conn().execute(
+            "UPDATE webhook_events SET status = ?, updated_at = ? "
+            "WHERE id IN ("
+            "  SELECT id FROM webhook_events WHERE status = ? "
+            "  AND (available_at IS NULL OR available_at <= ?) ORDER BY id LIMIT ?"
+            ") RETURNING id, kind, payload, attempts, created_at",
+            (WebhookEventStatus.PROCESSING, now, WebhookEventStatus.PENDING, now, limit),
+        ).fetchall()
+        events = [
+            {
+                "id": row[0],
+                "kind": row[1],
+                "data": json.loads(row[2]),
+                "attempts": row[3],
+                "created_at": row[4],
+            }
+            for row in rows
+        ]
+        events.sort(key=lambda event: event["id"])
+        return events
+
+    def ack(self, ids: list[int]):
+        """処理済みにする（dedup_keyは保持期間中残る）"""
+        self._set_status(ids, WebhookEventStatus.DONE)
+
+    def retry(self, ids: list[int], max_attempts: int):
+        """処理失敗したイベントをすぐにpendingに戻す（上限を超えたらdead）"""
+        self.retry_events({event_id: EventRetry() for event_id in ids}, max_attempts)
+
+    def retry_events(self, failures: dict[int, EventRetry], max_attempts: int):
+        """
+        処理失敗したイベントをイベントごとの待ち時間を付けてpendingに戻す
+
+        Args:
+            failures: {イベントID: EventRetry}
+            max_attempts: 試行回数がこの値に達したらdeadにする
+        """
+        if not failures:
+            return
+        now = datetime.utcnow()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE webhook_events SET attempts = attempts + ?, updated_at = ?, available_at = ?, "
+                "status = CASE WHEN attempts + ? >= ? THEN ? ELSE ? END "
+                "WHERE id = ?",
+                [
+                    (
+                        int(retry.count_attempt),
+                        now.isoformat(),
+                        (now + timedelta(seconds=retry.delay)).isoformat() if retry.delay > 0 else None,
+                        int(retry.count_attempt),
+                        max_attempts,
+                        WebhookEventStatus.DEAD,
+                        WebhookEventStatus.PENDING,
+                        event_id,
+                    )
+                    for event_id, retry in failures.items()
+                ],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def requeue_stale(self, older_than: datetime) -> int:
+        """older_thanより前からprocessingのまま残ったイベントをpendingに戻す"""
+        cur = self._conn().execute(
+            "UPDATE webhook_events SET status = ? WHERE status = ? AND updated_at < ?",
+            (WebhookEventStatus.PENDING, WebhookEventStatus.PROCESSING, older_than.isoformat()),
+        )
+        return cur.rowcount
+
+    def purge_done(self, older_than: datetime) -> int:
+        """保持期間を過ぎた処理済みイベントを削除"""
+        cur = self._conn().execute(
+            "DELETE FROM webhook_events WHERE status = ? AND updated_at < ?",
+            (WebhookEventStatus.DONE, older_than.isoformat()),
+        )
+        return cur.rowcount
+
+    def depth(self) -> int:
+        """未処理イベント数"""
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM webhook_events WHERE status IN (?, ?)",
+            (WebhookEventStatus.PENDING, WebhookEventStatus.PROCESSING),
+        ).fetchone()
+        return row[0]
+
+    def _set_status(self, ids: list[int], status: str):
+        if not ids:
+            return
+        now = datetime.utcnow().isoformat()
+        placeholders = ",".join("?" * len(ids))
+        self._conn().execute(
+            f"UPDATE webhook_events SET status = ?, updated_at = ? "
+            f"WHERE id IN ({placeholders})",
+            (status, now, *ids),
+        )
+
+
+class WebhookConsumerPool:
+    """
+    キューを処理するバックグラウンドワーカー群
+
+    handlerはイベントのリストを受け取り、処理に失敗したイベントIDのリスト
+    （待ち時間を指定する場合は {イベントID: EventRetry}）を返す。
+    """
+
+    def __init__(
+        self,
+        queue: WebhookQueue,
+        handler: Callable[[list[dict]], list[int] | dict[int, EventRetry]],
+        *,
+        workers: int,
+        batch_size: int,
+        poll_interval: float,
+        max_attempts: int,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._last_purge = 0.0
+        self._purge_lock = threading.Lock()
+
+    def start(self):
+        """ワーカーを起動"""
+        self._requeue_stale()
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run,
+                name=f"webhook-consumer-{i}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        """ワーカーを停止（処理中のバッチは完了を待つ）"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def notify(self):
+        """新しいイベントの到着をワーカーに知らせる"""
+        self._wakeup.set()
+
+    def run_once(self) -> int:
+        """1バッチだけ処理（処理した件数を返す）"""
+        events = self.queue.claim(self.batch_size)
+        if not events:
+            return 0
+        _observe_queue_wait(events)
+        try:
+            failures = self.handler(events)
+        except Exception as e:
+            logger.error(f"Webhook batch failed: {e}")
+            failures = [event["id"] for event in events]
+        if not isinstance(failures, dict):
+            failures = {event_id: EventRetry() for event_id in failures}
+        self.queue.ack([event["id"] for event in events if event["id"] not in failures])
+        self.queue.retry_events(failures, self.max_attempts)
+        return len(events)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+                self._purge_if_due()
+            except Exception as e:
+                logger.error(f"Webhook consumer error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _purge_if_due(self):
+        """処理済みイベントの削除と、落ちたワーカーのイベントの回収を1分に1回程度行う"""
+        with self._purge_lock:
+            if time.monotonic() - self._last_purge < 60:
+                return
+            self._last_purge = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(hours=settings.WEBHOOK_DEDUP_RETENTION_HOURS)
+        self.queue.purge_done(cutoff)
+        self._requeue_stale()
+
+    def _requeue_stale(self):
+        older_than = datetime.utcnow() - timedelta(seconds=settings.WEBHOOK_QUEUE_STALE_SECONDS)
+        requeued = self.queue.requeue_stale(older_than)
+        if requeued:
+            logger.info(f"Requeued {requeued} stale webhook events")
+
+
+def _observe_queue_wait(events: list[dict]):
+    """受信してから取り出されるまでの時間を記録（リトライ分は待ち時間に含まれる）"""
+    now = datetime.utcnow()
+    for event in events:
+        try:
+            waited = (now - datetime.fromisoformat(event["created_at"])).total_seconds()
+        except (KeyError, TypeError, ValueError):
+            continue
+        WEBHOOK_STAGE_SECONDS.observe(max(0.0, waited), kind=event["kind"], stage="queue_wait")
+
+
+_queue: WebhookQueue | None = None
+_consumers: WebhookConsumerPool | None = None
+
+gauge(
+    "webhook_queue_depth",
+    "未処理（pending / processing）のWebhookイベント数",
+    lambda: _queue.depth() if _queue is not None else None,
+)
+
+
+def get_webhook_queue() -> WebhookQueue:
+    """共有のWebhookキューを取得（初回呼び出し時に作成）"""
+    global _queue
+    if _queue is None:
+        _queue = WebhookQueue(settings.WEBHOOK_QUEUE_PATH)
+    return _queue
+
+
+def enqueue_webhook_events(events: list[dict]) -> int:
+    """イベントをキューに追加し、ワーカーを起こす"""
+    added = get_webhook_queue().enqueue(events)
+    if events:
+        # 1回の呼び出しは1つのWebhook（同じ種類のイベント）
+        kind = events[0]["kind"]
+        WEBHOOK_EVENTS_TOTAL.inc(added, kind=kind, result="enqueued")
+        if len(events) > added:
+            WEBHOOK_EVENTS_TOTAL.inc(len(events) - added, kind=kind, result="duplicate")
+    if added and _consumers is not None:
+        _consumers.notify()
+    return added
+
+
+def start_webhook_consumers():
+    """キュー処理ワーカーを開始"""
+    global _consumers
+    from app.webhook_processor import handle_event_batch
+
+    _consumers = WebhookConsumerPool(
+        get_webhook_queue(),
+        handle_event_batch,
+        workers=settings.WEBHOOK_CONSUMER_WORKERS,
+        batch_size=settings.WEBHOOK_QUEUE_BATCH_SIZE,
+        poll_interval=settings.WEBHOOK_QUEUE_POLL_INTERVAL,
+        max_attempts=settings.WEBHOOK_QUEUE_MAX_ATTEMPTS,
+    )
+    _consumers.start()
+    print("Webhook consumers started")
+
+
+def stop_webhook_consumers():
+    """キュー処理ワーカーを停止"""
+    global _consumers
+    if _consumers is not None:
+        _consumers.stop()
+        _consumers = None
+        print("Webhook consumers stopped")
+    # 書き込み待ちの会話状態を反映
+    from app.dm_utils import flush_conversation_updates
+
+    flush_conversation_updates()
@@ -0,0 +1 @@
+# 負荷試験ツール（ローカルのGraph API代替サーバーと負荷生成）
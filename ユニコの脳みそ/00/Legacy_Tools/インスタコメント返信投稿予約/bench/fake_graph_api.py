@@ -0,0 +1,232 @@
+"""
+ローカル用のMeta Graph API代替サーバー
+負荷試験で本物のAPIを叩かずに、app.meta_clientが呼ぶエンドポイントを再現する
+
+- POST /{ig_user_id}/media          メディアコンテナ作成
+- POST /{ig_user_id}/media_publish  コンテナ公開
+- POST /{comment_id}/replies        コメント返信
+- POST /{ig_user_id}/messages       DM送信
+- GET  /?ids=...&fields=status_code コンテナステータス一括取得
+
+レイテンシ・エラー率・レート制限応答の割合はFakeGraphConfigで設定する。
+動画コンテナはvideo_processing_seconds経過後にFINISHEDになる。
+
+単体での起動:
+    python -m bench.fake_graph_api --port 9000 --latency-ms 80 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from urllib.parse import parse_qsl
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.enums import ContainerStatus
+
+
+@dataclass
+class FakeGraphConfig:
+    """代替サーバーの挙動設定"""
+
+    latency_ms: float = 50.0  # 1リクエストあたりの平均応答時間
+    jitter_ms: float = 20.0  # 応答時間のばらつき（±）
+    error_rate: float = 0.0  # 一時的な500エラーを返す割合
+    rate_limit_rate: float = 0.0  # レート制限エラー（code 4）を返す割合
+    usage_percent: float = 10.0  # X-App-Usageヘッダーで返す使用率
+    video_processing_seconds: float = 5.0  # 動画コンテナがFINISHEDになるまでの秒数
+
+
+class FakeGraphState:
+    """作成済みコンテナとリクエスト数の記録"""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.containers: dict[str, dict] = {}
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    def next_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}_{next(self._ids)}"
+
+    def create_container(self, media_type: str | None, ready_at: float) -> str:
+        container_id = self.next_id("container")
+        with self._lock:
+            self.containers[container_id] = {
+                "status": ContainerStatus.IN_PROGRESS,
+                "media_type": media_type,
+                "ready_at": ready_at,
+            }
+        return container_id
+
+    def container_status(self, container_id: str) -> str | None:
+        with self._lock:
+            container = self.containers.get(container_id)
+            if container is None:
+                return None
+            if (
+                container["status"] == ContainerStatus.IN_PROGRESS
+                and time.time() >= container["ready_at"]
+            ):
+                container["status"] = ContainerStatus.FINISHED
+            return container["status"]
+
+    def publish_container(self, container_id: str) -> str | None:
+        """FINISHEDのコンテナを公開済みにする（公開できなければNone）"""
+        if self.container_status(container_id) != ContainerStatus.FINISHED:
+            return None
+        with self._lock:
+            self.containers[container_id]["status"] = ContainerStatus.PUBLISHED
+        return self.next_id("media")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": dict(self.errors)}
+
+
+def _graph_error(status_code: int, message: str, code: int, *, transient: bool, headers=None):
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": "OAuthException", "code": code,
+                           "is_transient": transient}},
+        headers=headers,
+    )
+
+
+def create_fake_graph_app(
+    config: FakeGraphConfig | None = None,
+    state: FakeGraphState | None = None,
+) -> FastAPI:
+    """代替サーバーのFastAPIアプリを作成"""
+    config = config or FakeGraphConfig()
+    state = state or FakeGraphState()
+    fake = FastAPI(title="Fake Graph API")
+    fake.state.config = config
+    fake.state.graph = state
+
+    def usage_headers() -> dict[str, str]:
+        usage = int(config.usage_percent)
+        return {"x-app-usage": json.dumps({"call_count": usage, "total_cputime": usage,
+                                           "total_time": usage})}
+
+    async def simulate(operation: str):
+        """遅延を入れ、設定された割合でエラー応答を返す（正常ならNone）"""
+        state.requests[operation] += 1
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            state.errors[f"{operation}:rate_limited"] += 1
+            headers = {"x-app-usage": json.dumps({"call_count": 100, "total_cputime": 100,
+                                                  "total_time": 100})}
+            return _graph_error(400, "Application request limit reached", 4,
+                                transient=True, headers=headers)
+        if roll < config.rate_limit_rate + config.error_rate:
+            state.errors[f"{operation}:server_error"] += 1
+            return _graph_error(500, "An unexpected error has occurred", 2, transient=True)
+        return None
+
+    async def read_form(request: Request) -> dict[str, str]:
+        # python-multipartに依存しないよう、urlencodedの本文を自前で解析
+        return dict(parse_qsl((await request.body()).decode()))
+
+    def ok(body: dict) -> JSONResponse:
+        return JSONResponse(content=body, headers=usage_headers())
+
+    @fake.get("/")
+    async def container_statuses(request: Request):
+        error = await simulate("container_status")
+        if error:
+            return error
+        ids = [i for i in request.query_params.get("ids", "").split(",") if i]
+        body = {}
+        for container_id in ids:
+            status = state.container_status(container_id)
+            if status is not None:
+                body[container_id] = {"status_code": status, "id": container_id}
+        return ok(body)
+
+    @fake.post("/{ig_user_id}/media")
+    async def create_media(ig_user_id: str, request: Request):
+        error = await simulate("media")
+        if error:
+            return error
+        form = await read_form(request)
+        media_type = form.get("media_type")
+        is_video = bool(form.get("video_url"))
+        ready_at = time.time() + (config.video_processing_seconds if is_video else 0)
+        return ok({"id": state.create_container(media_type, ready_at)})
+
+    @fake.post("/{ig_user_id}/media_publish")
+    async def media_publish(ig_user_id: str, request: Request):
+        error = await simulate("media_publish")
+        if error:
+            return error
+        form = await read_form(request)
+        media_id = state.publish_container(str(form.get("creation_id")))
+        if media_id is None:
+            # 処理中・未知のコンテナ（Graph APIの9007相当）
+            return _graph_error(400, "Media ID is not available", 9007, transient=False)
+        return ok({"id": media_id})
+
+    @fake.post("/{comment_id}/replies")
+    async def reply(comment_id: str):
+        error = await simulate("replies")
+        if error:
+            return error
+        return ok({"id": state.next_id("reply")})
+
+    @fake.post("/{ig_user_id}/messages")
+    async def messages(ig_user_id: str, request: Request):
+        error = await simulate("messages")
+        if error:
+            return error
+        payload = await request.json()
+        return ok({
+            "recipient_id": (payload.get("recipient") or {}).get("id"),
+            "message_id": state.next_id("mid"),
+        })
+
+    @fake.get("/_stats")
+    async def stats():
+        return state.snapshot()
+
+    return fake
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカル用のMeta Graph API代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--usage-percent", type=float, default=10.0)
+    parser.add_argument("--video-processing-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = FakeGraphConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        usage_percent=args.usage_percent,
+        video_processing_seconds=args.video_processing_seconds,
+    )
+    uvicorn.run(create_fake_graph_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
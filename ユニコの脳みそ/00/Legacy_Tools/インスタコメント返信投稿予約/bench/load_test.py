@@ -0,0 +1,572 @@
+"""
+負荷試験
+ローカルのGraph API代替サーバー（bench.fake_graph_api）に向けてapp.main:appを起動し、
+コメント/DMのWebhookバーストと予約投稿の一斉期限を流して性能を測る
+
+計測項目:
+- Webhook受信のHTTPレイテンシ（p50/p95/p99）とスループット
+- Webhook送信から自動返信完了（replied_at）までのレイテンシ
+- 予約時刻から公開完了までの遅れと公開スループット
+- DB書き込み文の実行時間（SQLiteのロック待ちを含む）
+
+DBとWebhookキューは一時ディレクトリに作るので、既存のデータには触れない。
+通常はローカルのレート制限を実質無効にして測る。--default-rate-limitsでは既定の制限のまま流し、
+自動返信が1件でも送られずに終わったら終了コード1で失敗する（制限で後回しにした返信の取りこぼし検出）。
+
+使い方:
+    python -m bench.load_test --accounts 5 --comments 2000 --dms 1000 --posts 500
+    python -m bench.load_test --error-rate 0.02 --rate-limit-rate 0.01 --json result.json
+    python -m bench.load_test --env SQLITE_PROFILE=default --env WEBHOOK_CONSUMER_WORKERS=8
+    python -m bench.load_test --default-rate-limits --comments 100 --dms 100 --posts 0
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# 負荷試験用の設定（app.*のimport前に環境変数で与える。--envと既存の環境変数が優先）
+_BENCH_ENV_DEFAULTS = {
+    "META_APP_ID": "bench_app_id",
+    "META_APP_SECRET": "bench_app_secret",
+    "LOG_TO_FILE": "false",
+    "LOG_LEVEL": "WARNING",
+    # 代替サーバーの応答を測るため、ローカルのレート制限は実質無効にする（--default-rate-limitsでは使わない）
+    "RATE_LIMIT_PUBLISH_PER_MINUTE": "600000",
+    "RATE_LIMIT_COMMENT_REPLY_PER_MINUTE": "600000",
+    "RATE_LIMIT_DM_PER_MINUTE": "600000",
+    "RATE_LIMIT_CONTAINER_STATUS_PER_MINUTE": "600000",
+    "RATE_LIMIT_BURST": "1000",
+    "RETRY_BASE_DELAY_SECONDS": "1",
+    "RETRY_MAX_DELAY_SECONDS": "10",
+    "CONTAINER_POLL_INITIAL_SECONDS": "1",
+    "CONTAINER_POLL_MAX_SECONDS": "5",
+    "WEBHOOK_QUEUE_POLL_INTERVAL": "0.1",
+}
+
+
+# 書き込みとみなすSQL（ロック待ちが発生しうる文）
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def bench_env_defaults(default_rate_limits: bool = False) -> dict[str, str]:
+    """負荷試験で与える設定（default_rate_limitsならレート制限はアプリの既定値のまま）"""
+    if not default_rate_limits:
+        return dict(_BENCH_ENV_DEFAULTS)
+    return {
+        key: value for key, value in _BENCH_ENV_DEFAULTS.items()
+        if not key.startswith("RATE_LIMIT_")
+    }
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """ソート済みリストのパーセンタイル（nearest-rank）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(values: list[float]) -> dict:
+    """秒単位の計測値をミリ秒の統計にまとめる"""
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def _utcnow_naive() -> datetime:
+    # SQLiteはタイムゾーンを落として保存するため、比較用にnaiveなUTCにそろえる
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class DBWriteTimer:
+    """
+    engineの書き込み文の実行時間を記録する
+
+    SQLiteはbusy_timeoutの範囲でロック解放を待ってから書き込むため、
+    この時間にはロック待ちが含まれる（待ちだけを分離はできない）。
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.durations: list[float] = []
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bench_started_at", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info["bench_started_at"].pop()
+        if statement.lstrip().upper().startswith(_WRITE_PREFIXES):
+            with self._lock:
+                self.durations.append(time.perf_counter() - started_at)
+
+    def report(self) -> dict:
+        with self._lock:
+            durations = list(self.durations)
+        report = summarize(durations)
+        report["total_s"] = round(sum(durations), 3)
+        report["over_100ms"] = sum(1 for d in durations if d > 0.1)
+        return report
+
+
+class ServerThread:
+    """uvicornをバックグラウンドスレッドで起動する"""
+
+    def __init__(self, asgi_app, host: str, port: int):
+        import uvicorn
+
+        config = uvicorn.Config(asgi_app, host=host, port=port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self, timeout: float = 30.0):
+        self.thread.start()
+        deadline = time.time() + timeout
+        while not self.server.started:
+            if not self.thread.is_alive() or time.time() > deadline:
+                raise RuntimeError("server failed to start")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+# ==================== ペイロード ====================
+
+def comment_payload(ig_user_id: str, comment_id: str, sender_id: str) -> dict:
+    return {
+        "object": "instagram",
+        "entry": [{
+            "id": ig_user_id,
+            "time": int(time.time()),
+            "changes": [{
+                "field": "comments",
+                "value": {
+                    "id": comment_id,
+                    "text": "bench 価格を教えてください",
+                    "from": {"id": sender_id},
+                    "media": {"id": f"bench_media_{ig_user_id}"},
+                },
+            }],
+        }],
+    }
+
+
+def dm_payload(ig_user_id: str, mid: str, sender_id: str) -> dict:
+    return {
+        "object": "instagram",
+        "entry": [{
+            "id": ig_user_id,
+            "time": int(time.time()),
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "from": {"id": sender_id},
+                    "to": [{"id": ig_user_id}],
+                    "message": {"mid": mid, "text": "bench 資料がほしいです"},
+                },
+            }],
+        }],
+    }
+
+
+def post_rows(ig_user_ids: list[str], count: int, scheduled_at: datetime, video_ratio: float):
+    """予約投稿の一括インポート用JSONL行"""
+    for i in range(count):
+        row = {
+            "ig_user_id": ig_user_ids[i % len(ig_user_ids)],
+            "scheduled_at": scheduled_at.isoformat(),
+            "caption": f"bench post {i}",
+        }
+        if random.random() < video_ratio:
+            row.update(post_type="reel", media_type="video",
+                       video_url=f"https://example.com/bench/{i}.mp4")
+        else:
+            row.update(post_type="feed", media_type="image",
+                       image_url=f"https://example.com/bench/{i}.jpg")
+        yield json.dumps(row, ensure_ascii=False)
+
+
+# ==================== 負荷生成 ====================
+
+async def _send_burst(client, path: str, payloads: list[tuple[str, dict]], concurrency: int):
+    """
+    Webhookを並列に送信
+
+    Returns:
+        (HTTPレイテンシのリスト, {イベントID: 送信時刻}, 失敗数)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    sent_at: dict[str, datetime] = {}
+    failures = 0
+
+    async def send(event_id: str, payload: dict):
+        nonlocal failures
+        async with semaphore:
+            sent_at[event_id] = _utcnow_naive()
+            started = time.perf_counter()
+            try:
+                resp = await client.post(path, json=payload)
+                ok = resp.status_code == 200
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                failures += 1
+
+    await asyncio.gather(*(send(event_id, payload) for event_id, payload in payloads))
+    return latencies, sent_at, failures
+
+
+async def _setup_accounts(client, count: int) -> list[str]:
+    """ベンチ用のアカウントと返信ルールを作成"""
+    ig_user_ids = []
+    for i in range(count):
+        ig_user_id = f"bench_ig_{i}"
+        resp = await client.post("/accounts", json={
+            "name": f"bench account {i}",
+            "ig_user_id": ig_user_id,
+            "access_token": f"bench_token_{i}",
+        })
+        resp.raise_for_status()
+        account_id = resp.json()["id"]
+        for path in ("/comment-rules", "/dm-rules"):
+            resp = await client.post(path, json={
+                "ig_account_id": account_id,
+                "keyword": "bench",
+                "reply_text": "ありがとうございます！詳細をお送りします",
+            })
+            resp.raise_for_status()
+        ig_user_ids.append(ig_user_id)
+    return ig_user_ids
+
+
+async def _run_webhook_phase(client, args, ig_user_ids: list[str], kind: str) -> dict:
+    """コメントまたはDMのWebhookをバースト単位で送信"""
+    total = args.comments if kind == "comment" else args.dms
+    path = "/webhook/instagram" if kind == "comment" else "/webhook/instagram-messages"
+    build = comment_payload if kind == "comment" else dm_payload
+    latencies: list[float] = []
+    sent_at: dict[str, datetime] = {}
+    failures = 0
+    started = time.perf_counter()
+    sent = 0
+    while sent < total:
+        size = min(args.burst_size, total - sent)
+        payloads = []
+        for i in range(sent, sent + size):
+            event_id = f"bench_{kind}_{i}"
+            ig_user_id = ig_user_ids[i % len(ig_user_ids)]
+            payloads.append((event_id, build(ig_user_id, event_id, f"bench_user_{i % 5000}")))
+        burst_latencies, burst_sent_at, burst_failures = await _send_burst(
+            client, path, payloads, args.concurrency
+        )
+        latencies += burst_latencies
+        sent_at.update(burst_sent_at)
+        failures += burst_failures
+        sent += size
+        if sent < total and args.burst_interval > 0:
+            await asyncio.sleep(args.burst_interval)
+    elapsed = time.perf_counter() - started
+    return {
+        "sent": total,
+        "http_failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+        "http_latency": summarize(latencies),
+        "_sent_at": sent_at,
+    }
+
+
+async def _run_post_wave(client, args, ig_user_ids: list[str]) -> dict:
+    """予約投稿を一括インポートし、同じ予約時刻に一斉に期限を迎えさせる"""
+    scheduled_at = _utcnow_naive() + timedelta(seconds=args.post_lead_seconds)
+    body = "\n".join(post_rows(ig_user_ids, args.posts, scheduled_at, args.video_ratio))
+    started = time.perf_counter()
+    resp = await client.post(
+        "/posts/bulk",
+        content=body.encode("utf-8"),
+        headers={"content-type": "application/x-ndjson"},
+        timeout=300,
+    )
+    elapsed = time.perf_counter() - started
+    resp.raise_for_status()
+    result = resp.json()
+    return {
+        "imported": result["created"],
+        "import_failed": result["failed"],
+        "import_s": round(elapsed, 3),
+        "scheduled_at": scheduled_at,
+    }
+
+
+async def _generate_load(base_url: str, args) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        ig_user_ids = await _setup_accounts(client, args.accounts)
+        results = {}
+        if args.posts:
+            results["posts"] = await _run_post_wave(client, args, ig_user_ids)
+        # 投稿の期限とWebhookバーストを重ねて流す
+        phases = []
+        if args.comments:
+            phases.append(("comments", _run_webhook_phase(client, args, ig_user_ids, "comment")))
+        if args.dms:
+            phases.append(("dms", _run_webhook_phase(client, args, ig_user_ids, "dm")))
+        for (name, _), result in zip(phases, await asyncio.gather(*(p for _, p in phases))):
+            results[name] = result
+        return results
+
+
+# ==================== 集計 ====================
+
+def _wait_for_drain(results: dict, timeout: float) -> bool:
+    """自動返信と予約投稿の処理が終わるまで待つ"""
+    from sqlalchemy import func
+
+    from app.db import SessionLocal
+    from app.enums import PostStatus
+    from app.models import CommentLog, DMLog, ScheduledPost
+    from app.webhook_queue import get_webhook_queue
+
+    expected_posts = results.get("posts", {}).get("imported", 0)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        db = SessionLocal()
+        try:
+            comments = db.query(func.count(CommentLog.id)).scalar()
+            dms = db.query(func.count(DMLog.id)).filter(DMLog.direction == "in").scalar()
+            unfinished_posts = db.query(func.count(ScheduledPost.id)).filter(
+                ScheduledPost.status.notin_([PostStatus.POSTED, PostStatus.FAILED])
+            ).scalar()
+        finally:
+            db.close()
+        received = (
+            comments >= results.get("comments", {}).get("sent", 0)
+            and dms >= results.get("dms", {}).get("sent", 0)
+        )
+        if received and get_webhook_queue().depth() == 0 and (
+            not expected_posts or unfinished_posts == 0
+        ):
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def _reply_latencies(model, id_column, sent_at: dict[str, datetime]) -> dict:
+    from app.db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        # ベンチ用の一時DBなので全件を読む
+        rows = db.query(id_column, model.replied_at).all()
+    finally:
+        db.close()
+    latencies = [
+        (replied_at - sent_at[event_id]).total_seconds()
+        for event_id, replied_at in rows
+        if replied_at is not None and event_id in sent_at
+    ]
+    report = summarize(latencies)
+    report["replied"] = len(latencies)
+    report["not_replied"] = len(sent_at) - len(latencies)
+    return report
+
+
+def dropped_replies(report: dict) -> int:
+    """自動返信されないまま終わったコメント/DMの件数"""
+    return sum(
+        report[kind]["reply_latency"]["not_replied"]
+        for kind in ("comments", "dms")
+        if kind in report
+    )
+
+
+def _post_report(wave: dict) -> dict:
+    from sqlalchemy import func
+
+    from app.db import SessionLocal
+    from app.enums import PostStatus
+    from app.models import ScheduledPost
+
+    db = SessionLocal()
+    try:
+        statuses = dict(
+            db.query(ScheduledPost.status, func.count(ScheduledPost.id))
+            .group_by(ScheduledPost.status)
+            .all()
+        )
+        posted = db.query(ScheduledPost.scheduled_at, ScheduledPost.updated_at).filter(
+            ScheduledPost.status == PostStatus.POSTED
+        ).all()
+        retries = db.query(func.sum(ScheduledPost.retry_count)).scalar() or 0
+    finally:
+        db.close()
+    lags = [(updated_at - scheduled_at).total_seconds() for scheduled_at, updated_at in posted]
+    first_due = wave["scheduled_at"]
+    last_done = max((updated_at for _, updated_at in posted), default=None)
+    span = (last_done - first_due).total_seconds() if last_done else 0.0
+    report = {key: value for key, value in wave.items() if key != "scheduled_at"}
+    report.update(
+        statuses=statuses,
+        retries=int(retries),
+        publish_lag=summarize(lags),
+        publish_throughput_per_s=round(len(posted) / span, 1) if span > 0 else 0.0,
+    )
+    return report
+
+
+def _print_report(report: dict):
+    def line(label: str, stats: dict):
+        if not stats.get("count"):
+            print(f"  {label:<28} (no samples)")
+            return
+        print(
+            f"  {label:<28} n={stats['count']:<6} p50={stats['p50_ms']:>9.1f}ms "
+            f"p95={stats['p95_ms']:>9.1f}ms p99={stats['p99_ms']:>9.1f}ms max={stats['max_ms']:>9.1f}ms"
+        )
+
+    for kind in ("comments", "dms"):
+        phase = report.get(kind)
+        if not phase:
+            continue
+        print(f"[{kind}] sent={phase['sent']} http_failures={phase['http_failures']} "
+              f"throughput={phase['throughput_rps']} req/s")
+        line("webhook HTTP latency", phase["http_latency"])
+        line("end-to-end reply latency", phase["reply_latency"])
+        print(f"  not replied: {phase['reply_latency']['not_replied']}")
+    posts = report.get("posts")
+    if posts:
+        print(f"[posts] imported={posts['imported']} in {posts['import_s']}s "
+              f"statuses={posts['statuses']} retries={posts['retries']} "
+              f"throughput={posts['publish_throughput_per_s']} posts/s")
+        line("publish lag (due→posted)", posts["publish_lag"])
+    db = report["db_writes"]
+    print(f"[db] write statements total={db.get('total_s', 0)}s over_100ms={db.get('over_100ms', 0)}")
+    line("write time (incl. lock wait)", db)
+    print(f"[graph api] {report['graph_api']}")
+    if not report["drained"]:
+        print("WARNING: drain timeout reached; results are partial")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Webhook・予約投稿の負荷試験")
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--comments", type=int, default=2000, help="送信するコメントWebhook数")
+    parser.add_argument("--dms", type=int, default=1000, help="送信するDM Webhook数")
+    parser.add_argument("--posts", type=int, default=500, help="同時刻に期限を迎える予約投稿数")
+    parser.add_argument("--video-ratio", type=float, default=0.2, help="リール（動画）投稿の割合")
+    parser.add_argument("--post-lead-seconds", type=float, default=5.0,
+                        help="インポートから予約時刻までの秒数")
+    parser.add_argument("--burst-size", type=int, default=500)
+    parser.add_argument("--burst-interval", type=float, default=1.0, help="バースト間の秒数")
+    parser.add_argument("--concurrency", type=int, default=100, help="同時接続数")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--usage-percent", type=float, default=10.0)
+    parser.add_argument("--video-processing-seconds", type=float, default=3.0)
+    parser.add_argument("--drain-timeout", type=float, default=300.0)
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--graph-port", type=int, default=8766)
+    parser.add_argument("--default-rate-limits", action="store_true",
+                        help="ローカルのレート制限を既定値のまま流し、返信の取りこぼしがあれば失敗にする")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="アプリの設定を上書き（複数指定可）")
+    parser.add_argument("--json", dest="json_path", help="結果をJSONで保存するパス")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    host = "127.0.0.1"
+    workdir = tempfile.mkdtemp(prefix="insta_tool_bench_")
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["WEBHOOK_QUEUE_PATH"] = os.path.join(workdir, "webhook_queue.db")
+    os.environ["GRAPH_API_BASE_URL"] = f"http://{host}:{args.graph_port}"
+    for key, value in bench_env_defaults(args.default_rate_limits).items():
+        os.environ.setdefault(key, value)
+    for item in args.env:
+        key, sep, value = item.partition("=")
+        if not sep:
+            sys.exit(f"--env expects KEY=VALUE: {item}")
+        os.environ[key] = value
+
+    from bench.fake_graph_api import FakeGraphConfig, FakeGraphState, create_fake_graph_app
+    from app.db import engine
+    from app.main import app
+
+    graph_state = FakeGraphState()
+    graph_config = FakeGraphConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        usage_percent=args.usage_percent,
+        video_processing_seconds=args.video_processing_seconds,
+    )
+    graph_server = ServerThread(create_fake_graph_app(graph_config, graph_state), host, args.graph_port)
+    app_server = ServerThread(app, host, args.app_port)
+    db_timer = DBWriteTimer(engine)
+
+    graph_server.start()
+    app_server.start()
+    try:
+        results = asyncio.run(_generate_load(f"http://{host}:{args.app_port}", args))
+        drained = _wait_for_drain(results, args.drain_timeout)
+
+        from app.models import CommentLog, DMLog
+
+        report = {"workdir": workdir, "drained": drained}
+        for kind, model, id_column in (
+            ("comments", CommentLog, CommentLog.instagram_comment_id),
+            ("dms", DMLog, DMLog.message_id),
+        ):
+            if kind in results:
+                phase = results[kind]
+                sent_at = phase.pop("_sent_at")
+                phase["reply_latency"] = _reply_latencies(model, id_column, sent_at)
+                report[kind] = phase
+        if "posts" in results:
+            report["posts"] = _post_report(results["posts"])
+        report["db_writes"] = db_timer.report()
+        report["graph_api"] = graph_state.snapshot()
+    finally:
+        app_server.stop()
+        graph_server.stop()
+
+    _print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    if args.default_rate_limits:
+        dropped = dropped_replies(report)
+        if dropped or not report["drained"]:
+            sys.exit(f"FAILED: {dropped} replies were not sent under the default rate limits")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,15 +12,31 @@ SCOPES = [
 
 SERVICE_ACCOUNT_FILE = 'service_account.json'
 
+# Authorized client and opened worksheets are reused across calls
+_client = None
+_worksheets = {}
+
+def get_client():
+    """
+    Returns the authorized gspread client (authorizes only once)
+    """
+    global _client
+    if _client is None:
+        if not os.path.exists(SERVICE_ACCOUNT_FILE):
+            raise FileNotFoundError(f"Service account file not found: {SERVICE_ACCOUNT_FILE}")
+        creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+        _client = gspread.authorize(creds)
+    return _client
+
 def connect_to_sheet(sheet_url_or_name):
     """
     Connects to Google Sheet using service account
+    (the worksheet handle is cached per URL / name)
     """
-    if not os.path.exists(SERVICE_ACCOUNT_FILE):
-        raise FileNotFoundError(f"Service account file not found: {SERVICE_ACCOUNT_FILE}")
+    if sheet_url_or_name in _worksheets:
+        return _worksheets[sheet_url_or_name]
 
-    creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-    gc = gspread.authorize(creds)
+    gc = get_client()
 
     try:
         # Try opening by URL first (safer)
@@ -28,10 +44,12 @@ def connect_to_sheet(sheet_url_or_name):
             sheet = gc.open_by_url(sheet_url_or_name)
         else:
             sheet = gc.open(sheet_url_or_name)
-        return sheet.sheet1 # Assuming data is in first sheet
+        worksheet = sheet.sheet1 # Assuming data is in first sheet
     except Exception as e:
         print(f"Error connecting to sheet: {e}")
         return None
+    _worksheets[sheet_url_or_name] = worksheet
+    return worksheet
 
 def fetch_pending_posts(sheet_url):
     """
@@ -96,12 +114,24 @@ def update_post_status(sheet_url, row_index, new_status="Scheduled"):
     """
     Updates the status of a specific row (e.g., to 'Posted' or 'Scheduled')
     """
+    update_post_statuses(sheet_url, [row_index], new_status)
+
+def update_post_statuses(sheet_url, row_indices, new_status="Scheduled"):
+    """
+    Updates the status of many rows with a single batch_update request
+    (instead of one update_cell call per row)
+    """
+    if not row_indices:
+        return
     worksheet = connect_to_sheet(sheet_url)
     if worksheet:
         # Status is in column F (6th column) usually
         # But let's find it dynamically or assume standard v3.2 format
-        worksheet.update_cell(row_index, 6, new_status)
-        print(f"Row {row_index} status updated to {new_status}")
+        worksheet.batch_update([
+            {"range": f"F{row_index}", "values": [[new_status]]}
+            for row_index in row_indices
+        ])
+        print(f"{len(row_indices)} rows status updated to {new_status}")
 
 if __name__ == "__main__":
     # Test execution
@@ -0,0 +1,36 @@
+"""
+テスト共通設定
+一時ファイルのSQLite DBを使い、テストセッション開始時にテーブルを作成する
+"""
+import os
+import tempfile
+
+import pytest
+
+_TEST_DB_DIR = tempfile.mkdtemp(prefix="insta_tool_test_")
+os.environ.setdefault("META_APP_ID", "test_app_id")
+os.environ.setdefault("META_APP_SECRET", "test_app_secret")
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite:///{os.path.join(_TEST_DB_DIR, 'test.db')}",
+)
+os.environ.setdefault(
+    "WEBHOOK_QUEUE_PATH",
+    os.path.join(_TEST_DB_DIR, "webhook_queue.db"),
+)
+os.environ.setdefault("LOG_TO_FILE", "false")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _create_tables():
+    """テスト用DBのテーブルを作成"""
+    from app.db import Base, engine
+    import app.models  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    yield
+    from app.utils_logging import stop_event_log_writer
+
+    stop_event_log_writer()
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
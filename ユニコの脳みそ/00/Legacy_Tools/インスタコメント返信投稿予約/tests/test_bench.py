@@ -0,0 +1,69 @@
+"""
+負荷試験ツール（Graph API代替サーバー・集計）のテスト
+"""
+from fastapi.testclient import TestClient
+
+from bench.fake_graph_api import FakeGraphConfig, FakeGraphState, create_fake_graph_app
+from bench.load_test import bench_env_defaults, dropped_replies, percentile, summarize
+
+
+def test_fake_graph_api_video_container_lifecycle():
+    """動画コンテナは処理完了まで公開できず、完了後はFINISHED→PUBLISHEDになるテスト"""
+    state = FakeGraphState()
+    config = FakeGraphConfig(latency_ms=0, jitter_ms=0, video_processing_seconds=3600)
+    client = TestClient(create_fake_graph_app(config, state))
+
+    resp = client.post("/ig_1/media", data={"video_url": "https://example.com/a.mp4",
+                                             "media_type": "REELS"})
+    container_id = resp.json()["id"]
+    assert client.get("/", params={"ids": container_id, "fields": "status_code"}).json() == {
+        container_id: {"status_code": "IN_PROGRESS", "id": container_id}
+    }
+    resp = client.post("/ig_1/media_publish", data={"creation_id": container_id})
+    assert resp.status_code == 400
+    assert resp.json()["error"]["code"] == 9007
+
+    state.containers[container_id]["ready_at"] = 0
+    resp = client.post("/ig_1/media_publish", data={"creation_id": container_id})
+    assert resp.status_code == 200
+    assert "x-app-usage" in resp.headers
+    assert state.container_status(container_id) == "PUBLISHED"
+
+
+def test_fake_graph_api_returns_rate_limit_errors():
+    """rate_limit_rate=1ならすべてcode 4の一時的エラーになるテスト"""
+    config = FakeGraphConfig(latency_ms=0, jitter_ms=0, rate_limit_rate=1.0)
+    client = TestClient(create_fake_graph_app(config))
+
+    resp = client.post("/comment_1/replies", data={"message": "hi"})
+    assert resp.status_code == 400
+    assert resp.json()["error"]["code"] == 4
+    assert resp.json()["error"]["is_transient"] is True
+
+
+def test_summarize_uses_nearest_rank_percentiles():
+    """パーセンタイルをnearest-rankでミリ秒に変換するテスト"""
+    values = [i / 1000 for i in range(1, 101)]  # 1ms〜100ms
+
+    assert percentile(sorted(values), 95) == 0.095
+    stats = summarize(values)
+    assert stats["count"] == 100
+    assert stats["p50_ms"] == 50.0
+    assert stats["p99_ms"] == 99.0
+    assert stats["max_ms"] == 100.0
+    assert summarize([]) == {"count": 0}
+
+
+def test_default_rate_limit_scenario_keeps_limits_and_counts_dropped_replies():
+    """既定のレート制限で流すシナリオでは制限を上書きせず、未返信数を合計するテスト"""
+    assert bench_env_defaults()["RATE_LIMIT_BURST"] == "1000"
+    env = bench_env_defaults(default_rate_limits=True)
+    assert not [key for key in env if key.startswith("RATE_LIMIT_")]
+    assert env["WEBHOOK_QUEUE_POLL_INTERVAL"] == "0.1"
+
+    report = {
+        "comments": {"reply_latency": {"not_replied": 2}},
+        "dms": {"reply_latency": {"not_replied": 1}},
+    }
+    assert dropped_replies(report) == 3
+    assert dropped_replies({}) == 0
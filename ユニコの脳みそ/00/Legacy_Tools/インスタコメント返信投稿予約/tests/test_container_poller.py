@@ -0,0 +1,66 @@
+"""
+メディアコンテナのステータスポーリングのテスト
+"""
+from app.container_poller import ContainerPoller
+from app.enums import ContainerStatus
+
+
+def _job(post_id: int, ig_user_id: str) -> dict:
+    return {"post_id": post_id, "ig_user_id": ig_user_id, "access_token": f"token_{ig_user_id}"}
+
+
+def test_poller_checks_statuses_per_account_in_one_call_and_backs_off():
+    """アカウントごとに1回の問い合わせでまとめて確認し、処理中のものは間隔を延ばすテスト"""
+    calls = []
+    resolved = []
+    statuses = {
+        "c1": ContainerStatus.FINISHED,
+        "c2": ContainerStatus.IN_PROGRESS,
+        "c3": ContainerStatus.ERROR,
+        "c4": ContainerStatus.FINISHED,
+    }
+
+    def check(container_ids, access_token, ig_user_id):
+        calls.append((ig_user_id, sorted(container_ids)))
+        return {container_id: statuses[container_id] for container_id in container_ids}
+
+    poller = ContainerPoller(
+        check,
+        lambda job, creation_id, status: resolved.append((creation_id, status)),
+        initial_delay=10,
+        max_delay=60,
+        max_wait=600,
+        workers=1,
+    )
+    poller.add(_job(1, "a"), "c1", delay=0)
+    poller.add(_job(2, "a"), "c2", delay=0)
+    poller.add(_job(3, "a"), "c3", delay=0)
+    poller.add(_job(4, "b"), "c4", delay=0)
+
+    assert poller.poll_once() == 4
+    assert sorted(calls) == [("a", ["c1", "c2", "c3"]), ("b", ["c4"])]
+    assert sorted(resolved) == [
+        ("c1", ContainerStatus.FINISHED),
+        ("c3", ContainerStatus.ERROR),
+        ("c4", ContainerStatus.FINISHED),
+    ]
+    # 処理中のコンテナは次回の確認まで待つ
+    assert poller.pending_count() == 1
+    assert poller.poll_once() == 0
+
+
+def test_poller_times_out_containers_that_never_finish():
+    """待機上限を超えたコンテナがTIMEOUTになるテスト"""
+    resolved = []
+    poller = ContainerPoller(
+        lambda ids, token, ig_user_id: {cid: ContainerStatus.IN_PROGRESS for cid in ids},
+        lambda job, creation_id, status: resolved.append(status),
+        initial_delay=0,
+        max_delay=0,
+        max_wait=0,
+        workers=1,
+    )
+    poller.add(_job(1, "a"), "c1")
+    poller.poll_once()
+    assert resolved == [ContainerStatus.TIMEOUT]
+    assert poller.pending_count() == 0
@@ -0,0 +1,74 @@
+"""
+ダッシュボード集計カウンターのテスト
+"""
+from datetime import datetime, timedelta, timezone
+
+from app.db import SessionLocal
+from app.models import IGAccount, ScheduledPost, CommentLog, DMLog
+from app.enums import PostStatus
+from app.dashboard_counters import (
+    bump_counters, reconcile_dashboard_counters, read_dashboard_counters
+)
+
+
+def _actual_counts(db):
+    now = datetime.now(timezone.utc)
+    today_start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+    return {
+        "total_accounts": db.query(IGAccount).count(),
+        "active_accounts": db.query(IGAccount).filter(IGAccount.is_active == 1).count(),
+        "pending_posts": db.query(ScheduledPost).filter(
+            ScheduledPost.status == PostStatus.PENDING
+        ).count(),
+        "today_posts": db.query(ScheduledPost).filter(
+            ScheduledPost.status == PostStatus.PENDING,
+            ScheduledPost.scheduled_at >= today_start,
+        ).count(),
+        "unhandled_comments": db.query(CommentLog).filter(CommentLog.replied == 0).count(),
+        "unhandled_dms": db.query(DMLog).filter(
+            DMLog.direction == "in", DMLog.replied == 0
+        ).count(),
+    }
+
+
+def test_counters_follow_incremental_updates_and_reconcile_drift():
+    """カウンターが増減に追従し、ずれが照合で解消されるテスト"""
+    db = SessionLocal()
+    try:
+        reconcile_dashboard_counters(db)
+        assert read_dashboard_counters(db) == _actual_counts(db)
+
+        account = IGAccount(name="counter", ig_user_id="counter_1", access_token="t")
+        db.add(account)
+        db.flush()
+        bump_counters(db, total_accounts=1, active_accounts=1)
+        now = datetime.now(timezone.utc)
+        db.add_all([
+            ScheduledPost(
+                ig_account_id=account.id,
+                image_url="https://example.com/a.jpg",
+                scheduled_at=now + timedelta(days=1),
+                status=PostStatus.PENDING,
+            ),
+            ScheduledPost(
+                ig_account_id=account.id,
+                image_url="https://example.com/b.jpg",
+                scheduled_at=now - timedelta(days=3),
+                status=PostStatus.PENDING,
+            ),
+        ])
+        bump_counters(db, pending_posts=2)
+        db.add(CommentLog(ig_account_id=account.id, instagram_comment_id="counter_c"))
+        bump_counters(db, unhandled_comments=1)
+        db.commit()
+
+        assert read_dashboard_counters(db) == _actual_counts(db)
+
+        # カウンターを経由しない変更でずれても照合で戻る
+        db.add(DMLog(ig_account_id=account.id, message_id="counter_m", direction="in"))
+        db.commit()
+        assert read_dashboard_counters(db) != _actual_counts(db)
+        reconcile_dashboard_counters(db)
+        assert read_dashboard_counters(db) == _actual_counts(db)
+    finally:
+        db.close()
@@ -0,0 +1,98 @@
+"""
+DB接続設定のテスト
+"""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.db import engine, read_engine
+
+
+def test_sqlite_production_pragmas_applied():
+    """productionプロファイルでWAL等のPRAGMAが設定されるテスト"""
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() > 0
+
+
+def test_read_engine_is_read_only():
+    """読み取り専用engineでは書き込みができないテスト"""
+    assert read_engine is not engine
+    with read_engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM ig_accounts")).scalar() >= 0
+        with pytest.raises(OperationalError):
+            conn.execute(text("DELETE FROM ig_accounts"))
+
+
+def test_ensure_indexes_creates_missing_indexes():
+    """既存DBに不足しているインデックスが起動時に作成されるテスト"""
+    from app.migrations import ensure_indexes
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_comment_logs_account_replied_created"))
+
+    assert "ix_comment_logs_account_replied_created" in ensure_indexes(engine)
+    assert ensure_indexes(engine) == []
+
+    with engine.connect() as conn:
+        plan = conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM comment_logs "
+            "WHERE ig_account_id = 1 AND replied = 0 ORDER BY created_at DESC LIMIT 100"
+        )).fetchall()
+    assert "ix_comment_logs_account_replied_created" in " ".join(row[-1] for row in plan)
+
+
+def test_dashboard_summary_and_keyset_pagination():
+    """ダッシュボード集計と、キーセットページングが重複・欠落なく全件を返すテスト"""
+    from datetime import datetime, timedelta
+    from app.db import SessionLocal
+    from app.models import IGAccount, CommentLog, DMLog
+    from app.main import get_dashboard_summary, list_comment_logs
+    from app.dashboard_counters import reconcile_dashboard_counters
+
+    db = SessionLocal()
+    try:
+        account = IGAccount(name="keyset", ig_user_id="keyset_1", access_token="t")
+        db.add(account)
+        db.commit()
+        base = datetime(2026, 1, 1)
+        db.add_all([
+            CommentLog(
+                ig_account_id=account.id,
+                instagram_comment_id=f"keyset_c_{i}",
+                replied=i % 2,
+                # 同じcreated_atの行を含める
+                created_at=base + timedelta(minutes=i // 3),
+            )
+            for i in range(10)
+        ])
+        db.add(DMLog(ig_account_id=account.id, message_id="keyset_m", direction="in", replied=0))
+        db.commit()
+
+        # テストデータはカウンターを経由せず直接追加しているため、先に照合する
+        reconcile_dashboard_counters(db)
+        summary = get_dashboard_summary(db)
+        assert summary.total_accounts == db.query(IGAccount).count()
+        assert summary.unhandled_comments == db.query(CommentLog).filter(CommentLog.replied == 0).count()
+        assert summary.unhandled_dms == db.query(DMLog).filter(
+            DMLog.direction == "in", DMLog.replied == 0
+        ).count()
+
+        seen = []
+        cursor = {}
+        while True:
+            page = list_comment_logs(account_id=account.id, limit=4, db=db, **cursor)
+            if not page:
+                break
+            seen.extend(log.id for log in page)
+            cursor = {"before_created_at": page[-1].created_at, "before_id": page[-1].id}
+        all_ids = [
+            log.id for log in db.query(CommentLog)
+            .filter(CommentLog.ig_account_id == account.id)
+            .order_by(CommentLog.created_at.desc(), CommentLog.id.desc())
+        ]
+        assert seen == all_ids
+        assert len(seen) == 10
+    finally:
+        db.close()
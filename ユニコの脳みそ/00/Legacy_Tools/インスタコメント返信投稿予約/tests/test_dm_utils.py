@@ -0,0 +1,66 @@
+"""
+DMユーティリティ（24時間ルール判定）のテスト
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+from app.db import SessionLocal, engine
+from app.models import IGAccount, UserConversation
+from app.dm_utils import ConversationWindowCache, conversation_cache, can_auto_reply, flush_conversation_updates
+
+
+def test_window_answered_from_memory_and_flushed_in_batch():
+    """24時間ルールの判定がメモリで完結し、会話の更新がまとめて反映されるテスト"""
+    db = SessionLocal()
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    try:
+        account = IGAccount(name="window", ig_user_id="window_1", access_token="t")
+        db.add(account)
+        db.commit()
+
+        now = datetime.now(timezone.utc)
+        conversation_cache.record_user_message(account.id, "recent_user", now)
+        conversation_cache.record_user_message(account.id, "old_user", now - timedelta(hours=25))
+        conversation_cache.record_bot_message(account.id, "recent_user", now)
+
+        event.listen(engine, "before_cursor_execute", count_statement)
+        try:
+            assert can_auto_reply(db, account.id, "recent_user") is True
+            assert can_auto_reply(db, account.id, "old_user") is False
+        finally:
+            event.remove(engine, "before_cursor_execute", count_statement)
+        assert statements == []
+
+        assert flush_conversation_updates(db) == 2
+        rows = {
+            conv.instagram_user_id: conv
+            for conv in db.query(UserConversation).filter(UserConversation.ig_account_id == account.id)
+        }
+        assert set(rows) == {"recent_user", "old_user"}
+        assert rows["recent_user"].last_bot_message_at is not None
+
+        # 新しいキャッシュ（別プロセス相当）はDBから読み込んで同じ判定をする
+        conversation_cache.clear()
+        assert can_auto_reply(db, account.id, "recent_user") is True
+        assert can_auto_reply(db, account.id, "old_user") is False
+        assert can_auto_reply(db, account.id, "unknown_user") is False
+    finally:
+        db.close()
+
+
+def test_cache_evicts_least_recently_used_but_keeps_pending():
+    """容量超過時に古いエントリから破棄し、書き込み待ちは残すテスト"""
+    cache = ConversationWindowCache(max_size=2, ttl_seconds=60)
+    now = datetime.now(timezone.utc)
+    cache.record_user_message(1, "pending_user", now)
+    cache.put((1, "a"), now)
+    cache.put((1, "b"), now)
+
+    assert cache.get((1, "pending_user")) == now
+    assert cache.get((1, "b")) == now
+    assert cache.get((1, "a")) is not now
@@ -0,0 +1,54 @@
+"""
+予約投稿の期限キューのテスト
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.due_queue import DueQueue
+
+
+def test_due_queue_returns_posts_in_due_order_and_skips_canceled():
+    """期限順に取り出し、キャンセル・リスケジュール前のエントリを読み飛ばすテスト"""
+    queue = DueQueue()
+    now = datetime.now(timezone.utc)
+    queue.schedule(1, now - timedelta(seconds=3))
+    queue.schedule(2, now - timedelta(seconds=2))
+    queue.schedule(3, now - timedelta(seconds=1))
+    queue.schedule(4, now + timedelta(hours=1))
+    queue.cancel(2)
+    queue.schedule(3, now + timedelta(hours=2))  # リスケジュール
+
+    assert queue.wait_for_due() == [1]
+    assert len(queue) == 2
+    assert queue.next_due() == (now + timedelta(hours=1)).timestamp()
+
+
+def test_due_queue_wakes_at_due_time_and_on_close():
+    """期限ちょうどに起き、close()で待機が解除されるテスト"""
+    queue = DueQueue()
+    results = []
+
+    def consumer():
+        while True:
+            due = queue.wait_for_due()
+            if not due:
+                return
+            results.append((due, time.time()))
+
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    try:
+        # 待機中に先頭より早い期限が登録されたら起き直す
+        queue.schedule(1, datetime.now(timezone.utc) + timedelta(hours=1))
+        due_at = datetime.now(timezone.utc) + timedelta(milliseconds=100)
+        queue.schedule(2, due_at)
+        deadline = time.time() + 2
+        while not results and time.time() < deadline:
+            time.sleep(0.01)
+        assert results and results[0][0] == [2]
+        assert results[0][1] - due_at.timestamp() < 0.5
+    finally:
+        queue.close()
+        thread.join(timeout=2)
+    assert not thread.is_alive()
@@ -0,0 +1,108 @@
+"""
+スケジューラーのリーダー選出のテスト
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.db import SessionLocal
+from app.leader import LeaderElector, LeaderLease
+from app.models import SchedulerLease
+
+
+def _expire(name: str):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.name == name)
+            .values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_only_one_holder_and_failover_after_expiry():
+    """有効なリースは1プロセスだけが持ち、期限切れ・解放後は他プロセスが引き継ぐテスト"""
+    first = LeaderLease(SessionLocal, "test_failover", "worker-a", lease_seconds=30)
+    second = LeaderLease(SessionLocal, "test_failover", "worker-b", lease_seconds=30)
+
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    # 保持者は期限を更新できる
+    assert first.try_acquire()
+
+    # worker-aが落ちて更新が途絶えた
+    _expire("test_failover")
+    assert second.try_acquire()
+    assert not first.try_acquire()
+
+    # 正常終了時の解放後はすぐに取得できる
+    second.release()
+    assert first.try_acquire()
+
+
+def test_elector_starts_and_stops_scheduler_on_leadership_changes():
+    """リーダーになったら開始、リースを失ったら停止、終了時に解放するテスト"""
+    events = []
+    lease = LeaderLease(SessionLocal, "test_elector", "worker-a", lease_seconds=30)
+    rival = LeaderLease(SessionLocal, "test_elector", "worker-b", lease_seconds=30)
+    elector = LeaderElector(
+        lease,
+        on_elected=lambda: events.append("start"),
+        on_demoted=lambda: events.append("stop"),
+        renew_interval=10,
+    )
+
+    elector.step()
+    elector.step()
+    assert elector.is_leader
+    assert events == ["start"]
+
+    # 更新が遅れている間に他プロセスに取られた
+    _expire("test_elector")
+    assert rival.try_acquire()
+    elector.step()
+    assert not elector.is_leader
+    assert events == ["start", "stop"]
+
+    rival.release()
+    elector.step()
+    elector.stop()
+    assert events == ["start", "stop", "start", "stop"]
+    assert rival.try_acquire()
+
+
+def test_elector_releases_lease_when_scheduler_start_fails():
+    """スケジューラーの開始に失敗したらリースを手放し、次のstepで再試行するテスト"""
+    events = []
+    failures = [RuntimeError("scheduler start failed")]
+
+    def on_elected():
+        if failures:
+            raise failures.pop()
+        events.append("start")
+
+    lease = LeaderLease(SessionLocal, "test_start_failure", "worker-a", lease_seconds=30)
+    rival = LeaderLease(SessionLocal, "test_start_failure", "worker-b", lease_seconds=30)
+    elector = LeaderElector(
+        lease,
+        on_elected=on_elected,
+        on_demoted=lambda: events.append("stop"),
+        renew_interval=10,
+    )
+
+    with pytest.raises(RuntimeError):
+        elector.step()
+    assert not elector.is_leader
+    assert events == ["stop"]
+    # 他プロセスが引き継げる
+    assert rival.try_acquire()
+    rival.release()
+
+    elector.step()
+    assert elector.is_leader
+    assert events == ["stop", "start"]
+    elector.stop()
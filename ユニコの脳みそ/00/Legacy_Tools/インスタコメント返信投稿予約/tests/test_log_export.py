@@ -0,0 +1,98 @@
+"""
+ログのストリーミングエクスポートのテスト
+"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.db import ReadSessionLocal, SessionLocal
+from app.log_export import (
+    COMMENT_LOG_EXPORT, DM_LOG_EXPORT, EXPORT_FORMAT_CSV, EXPORT_FORMAT_NDJSON,
+    build_export_query, iter_export_chunks
+)
+from app.models import CommentLog, DMLog, IGAccount
+
+
+def _create_account(db, ig_user_id: str) -> IGAccount:
+    account = IGAccount(name=f"export_{ig_user_id}", ig_user_id=ig_user_id, access_token="t")
+    db.add(account)
+    db.commit()
+    db.refresh(account)
+    return account
+
+
+def test_export_comment_logs_as_csv_in_chunks():
+    """アカウント・期間で絞り込んだコメントログがyield_per件ごとのCSVチャンクで返るテスト"""
+    db = SessionLocal()
+    try:
+        account_id = _create_account(db, "export_csv_1").id
+        other_id = _create_account(db, "export_csv_2").id
+        base = datetime(2025, 3, 1)
+        db.add_all([
+            CommentLog(ig_account_id=account_id, instagram_comment_id=f"export_c_{i}",
+                       text=f'line "{i}"\nnext', replied=i % 2, created_at=base + timedelta(hours=i))
+            for i in range(5)
+        ])
+        db.add(CommentLog(ig_account_id=other_id, instagram_comment_id="export_other",
+                          created_at=base))
+        db.commit()
+    finally:
+        db.close()
+
+    query = build_export_query(
+        COMMENT_LOG_EXPORT,
+        start=base + timedelta(hours=1),
+        # タイムゾーン付きの指定はUTCに変換して比較する
+        end=datetime(2025, 3, 1, 14, tzinfo=timezone(timedelta(hours=9))),
+        filters=(CommentLog.ig_account_id == account_id,),
+    )
+    chunks = list(iter_export_chunks(
+        ReadSessionLocal, COMMENT_LOG_EXPORT, query, EXPORT_FORMAT_CSV, yield_per=2
+    ))
+
+    # ヘッダー + 2件 + 2件
+    assert len(chunks) == 3
+    assert chunks[0].startswith("\ufeff".encode("utf-8"))
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode("utf-8-sig"), newline="")))
+    assert [row["instagram_comment_id"] for row in rows] == [
+        "export_c_1", "export_c_2", "export_c_3", "export_c_4"
+    ]
+    assert rows[0]["text"] == 'line "1"\nnext'
+    assert rows[0]["created_at"] == "2025-03-01T01:00:00"
+    assert rows[0]["replied_at"] == ""
+
+
+def test_export_dm_logs_as_ndjson_and_reject_unknown_format():
+    """DMログがNDJSONで返り、未対応の形式は400になるテスト"""
+    from app.main import export_dm_logs
+
+    db = SessionLocal()
+    try:
+        account_id = _create_account(db, "export_ndjson_1").id
+        db.add_all([
+            DMLog(ig_account_id=account_id, message_id="export_m_in", direction="in",
+                  text="こんにちは", created_at=datetime(2025, 4, 1)),
+            DMLog(ig_account_id=account_id, message_id="export_m_out", direction="out",
+                  created_at=datetime(2025, 4, 1)),
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    query = build_export_query(
+        DM_LOG_EXPORT,
+        filters=(DMLog.ig_account_id == account_id, DMLog.direction == "in"),
+    )
+    body = b"".join(iter_export_chunks(ReadSessionLocal, DM_LOG_EXPORT, query, EXPORT_FORMAT_NDJSON))
+    rows = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+    assert [(row["message_id"], row["text"], row["replied_at"]) for row in rows] == [
+        ("export_m_in", "こんにちは", None)
+    ]
+
+    with pytest.raises(HTTPException) as exc_info:
+        export_dm_logs(format="xlsx")
+    assert exc_info.value.status_code == 400
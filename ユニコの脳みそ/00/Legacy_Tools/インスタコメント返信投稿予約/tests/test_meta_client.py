@@ -0,0 +1,81 @@
+"""
+Meta Graph APIクライアントのテスト
+"""
+import json
+
+import httpx
+import pytest
+
+from app import meta_client
+from app.meta_client import MetaAPIError
+
+
+@pytest.fixture
+def graph_api(monkeypatch):
+    """共有クライアントをMockTransportに差し替え、ハンドラーを設定する関数を返す"""
+    clients = []
+
+    def install(handler):
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        clients.append(client)
+        monkeypatch.setattr(meta_client, "_get_sync_client", lambda: client)
+
+    yield install
+    for client in clients:
+        client.close()
+
+
+def test_client_reuses_pool_for_all_operations(graph_api):
+    """4操作が1つの共有クライアントで実行されるテスト"""
+    requests_seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests_seen.append(request)
+        path = request.url.path
+        if path.endswith("/messages"):
+            body = json.loads(request.content)
+            assert body["recipient"] == {"id": "user_1"}
+            return httpx.Response(200, json={"message_id": "mid_1"})
+        if path.endswith("/media_publish"):
+            return httpx.Response(200, json={"id": "media_1"})
+        if path.endswith("/media"):
+            return httpx.Response(200, json={"id": "creation_1"})
+        if path.endswith("/replies"):
+            return httpx.Response(200, json={"id": "reply_1"})
+        return httpx.Response(404)
+
+    graph_api(handler)
+    creation_id = meta_client.create_media_for_post(
+        ig_user_id="123",
+        post_type="feed",
+        media_type="image",
+        image_url="https://example.com/image.jpg",
+        caption="test",
+        access_token="token",
+    )
+    media_id = meta_client.publish_media("123", creation_id, "token")
+    reply_id = meta_client.reply_to_comment("c_1", "thanks", "token")
+    msg_id = meta_client.send_instagram_dm(
+        ig_user_id="123",
+        recipient_id="user_1",
+        message="hello",
+        access_token="token",
+    )
+
+    assert (creation_id, media_id, reply_id, msg_id) == ("creation_1", "media_1", "reply_1", "mid_1")
+    assert len(requests_seen) == 4
+
+
+def test_client_raises_meta_api_error(graph_api):
+    """エラーレスポンスとバリデーションエラーがMetaAPIErrorになるテスト"""
+    graph_api(lambda request: httpx.Response(400, json={"error": {"message": "bad"}}))
+
+    with pytest.raises(MetaAPIError):
+        meta_client.reply_to_comment("c_1", "thanks", "token")
+    with pytest.raises(MetaAPIError):
+        meta_client.create_media_for_post(
+            ig_user_id="123",
+            post_type="reel",
+            media_type="video",
+            access_token="token",
+        )
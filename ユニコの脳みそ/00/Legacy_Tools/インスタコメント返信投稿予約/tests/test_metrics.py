@@ -0,0 +1,75 @@
+"""
+アプリ内メトリクスのテスト
+"""
+import pytest
+
+from app.metrics import Counter, Gauge, Histogram, MetricsRegistry, registry
+
+
+def test_counter_and_histogram_render_prometheus_text():
+    """カウンターとヒストグラム（累積バケット・合計・件数）の出力テスト"""
+    metrics = MetricsRegistry()
+    requests = metrics.register(Counter("api_requests_total", "API calls", ["operation", "status"]))
+    latency = metrics.register(Histogram("api_seconds", "API latency", ["operation"], buckets=(0.1, 1.0)))
+
+    requests.inc(operation="reply", status=200)
+    requests.inc(2, operation="reply", status=200)
+    latency.observe(0.05, operation="reply")
+    latency.observe(0.5, operation="reply")
+    latency.observe(5, operation="reply")
+
+    text = metrics.render()
+    assert "# TYPE api_requests_total counter" in text
+    assert 'api_requests_total{operation="reply",status="200"} 3' in text
+    assert 'api_seconds_bucket{operation="reply",le="0.1"} 1' in text
+    assert 'api_seconds_bucket{operation="reply",le="1"} 2' in text
+    assert 'api_seconds_bucket{operation="reply",le="+Inf"} 3' in text
+    assert 'api_seconds_sum{operation="reply"} 5.55' in text
+    assert 'api_seconds_count{operation="reply"} 3' in text
+    assert latency.count(operation="reply") == 3
+
+    with pytest.raises(ValueError):
+        requests.inc(operation="reply")
+    with pytest.raises(ValueError):
+        metrics.register(Counter("api_requests_total", "duplicate"))
+
+
+def test_gauge_reads_callbacks_and_skips_failures():
+    """ゲージは取得時にコールバックを呼び、失敗したコールバックは読み飛ばすテスト"""
+    metrics = MetricsRegistry()
+    depth = {"value": 3}
+    gauge = metrics.register(Gauge("queue_depth", "depth", lambda: {("a",): depth["value"]}, ["queue"]))
+    gauge.add_callback(lambda: 1 / 0)
+
+    assert 'queue_depth{queue="a"} 3' in metrics.render()
+    depth["value"] = 7
+    assert 'queue_depth{queue="a"} 7' in metrics.render()
+
+
+def test_histogram_timer_and_label_escaping():
+    """with文での計測とラベル値のエスケープのテスト"""
+    metrics = MetricsRegistry()
+    stage = metrics.register(Histogram("stage_seconds", "stage", ["stage"]))
+
+    with stage.time(stage='say "hi"\n'):
+        pass
+
+    assert 'stage_seconds_count{stage="say \\"hi\\"\\n"} 1' in metrics.render()
+
+
+def test_app_registry_exposes_db_pool_and_hot_path_metrics():
+    """アプリのレジストリにDBプール・Webhook・Graph API・スケジューラーのメトリクスが登録されているテスト"""
+    import app.scheduler  # noqa: F401
+    import app.webhook_processor  # noqa: F401
+
+    text = registry.render()
+    for name in (
+        "db_pool_checked_out",
+        "db_connection_hold_seconds",
+        "webhook_stage_seconds",
+        "graph_api_request_seconds",
+        "scheduler_due_lag_seconds",
+        "scheduler_due_queue_length",
+    ):
+        assert f"# TYPE {name} " in text
+    assert 'db_pool_checked_out{engine="write"}' in text
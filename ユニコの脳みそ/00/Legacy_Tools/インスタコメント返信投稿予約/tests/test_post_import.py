@@ -0,0 +1,131 @@
+"""
+予約投稿一括インポートのテスト
+"""
+import io
+import json
+
+from app.db import SessionLocal
+from app.enums import PostStatus
+from app.models import IGAccount, ScheduledPost
+from app.post_import import BULK_FORMAT_CSV, BULK_FORMAT_JSONL, import_posts, iter_rows
+
+
+def _create_account(db, ig_user_id: str) -> IGAccount:
+    account = IGAccount(name=f"bulk_{ig_user_id}", ig_user_id=ig_user_id, access_token="token")
+    db.add(account)
+    db.commit()
+    db.refresh(account)
+    return account
+
+
+def test_import_csv_in_chunks_with_row_errors():
+    """CSVをチャンク単位でINSERTし、不正な行を行番号付きで報告するテスト"""
+    db = SessionLocal()
+    try:
+        account = _create_account(db, "bulk_csv_1")
+        body = (
+            "ig_user_id,post_type,media_type,image_url,video_url,caption,scheduled_at\n"
+            'bulk_csv_1,feed,image,https://example.com/1.jpg,,"line1\nline2",2030-01-01T10:00:00Z\n'
+            "bulk_csv_1,reel,video,,,no video,2030-01-01T11:00:00\n"
+            "unknown_user,feed,image,https://example.com/2.jpg,,x,2030-01-01T12:00:00\n"
+            "bulk_csv_1,feed,image,https://example.com/3.jpg,,y,not-a-date\n"
+            "bulk_csv_1,feed,image,https://example.com/4.jpg,,z,2030-01-02T09:00:00\n"
+            "bulk_csv_1,feed,image,https://example.com/5.jpg,,w,2030-01-03T09:00:00\n"
+        )
+        scheduled = []
+        report = import_posts(
+            db,
+            iter_rows(io.StringIO(body, newline=""), BULK_FORMAT_CSV),
+            chunk_size=2,
+            max_errors=2,
+            on_inserted=scheduled.extend,
+        )
+
+        assert report["total"] == 6
+        assert report["created"] == 3
+        assert report["failed"] == 3
+        assert report["errors"] == [
+            {"row": 4, "error": "video_url is required for reel posts"},
+            {"row": 5, "error": "IGAccount not found for ig_user_id: unknown_user"},
+        ]
+        assert report["errors_truncated"] is True
+
+        posts = (
+            db.query(ScheduledPost)
+            .filter(ScheduledPost.ig_account_id == account.id)
+            .order_by(ScheduledPost.scheduled_at)
+            .all()
+        )
+        assert [post.caption for post in posts] == ["line1\nline2", "z", "w"]
+        assert all(post.status == PostStatus.PENDING for post in posts)
+        assert sorted(post_id for post_id, _ in scheduled) == sorted(post.id for post in posts)
+    finally:
+        db.close()
+
+
+def test_import_jsonl_resolves_account_id_and_reports_bad_lines():
+    """JSONLでig_account_id指定の行を取り込み、壊れた行をエラーにするテスト"""
+    db = SessionLocal()
+    try:
+        account = _create_account(db, "bulk_jsonl_1")
+        lines = [
+            json.dumps({
+                "ig_account_id": account.id,
+                "image_url": "https://example.com/a.jpg",
+                "caption": "jsonl",
+                "scheduled_at": "2030-02-01T10:00:00",
+            }),
+            "",
+            "{broken",
+            json.dumps(["not", "an", "object"]),
+        ]
+        report = import_posts(
+            db,
+            iter_rows(io.StringIO("\n".join(lines)), BULK_FORMAT_JSONL),
+            chunk_size=100,
+            max_errors=100,
+        )
+
+        assert report["created"] == 1
+        assert [error["row"] for error in report["errors"]] == [3, 4]
+        post = db.query(ScheduledPost).filter(ScheduledPost.caption == "jsonl").one()
+        assert post.ig_account_id == account.id
+    finally:
+        db.close()
+
+
+def test_invalid_utf8_late_in_body_imports_nothing(monkeypatch):
+    """後半に不正なUTF-8がある本文は、前半のチャンクも登録せずに400を返すテスト"""
+    import tempfile
+
+    import pytest
+    from fastapi import HTTPException
+
+    from app.config import settings
+    from app.main import _import_spooled_posts
+
+    monkeypatch.setattr(settings, "BULK_IMPORT_CHUNK_SIZE", 10)
+    db = SessionLocal()
+    spool = tempfile.SpooledTemporaryFile(max_size=16)
+    try:
+        account = _create_account(db, "bulk_utf8_1")
+        rows = [
+            json.dumps({
+                "ig_account_id": account.id,
+                "image_url": f"https://example.com/{i}.jpg",
+                "caption": f"utf8 {i}",
+                "scheduled_at": "2030-03-01T10:00:00",
+            })
+            # 読み込みバッファ（8KB）より後ろに不正なバイトが来る行数
+            for i in range(200)
+        ]
+        spool.write(("\n".join(rows) + "\n").encode("utf-8") + b"\xff\xfe broken\n")
+        spool.seek(0)
+
+        with pytest.raises(HTTPException) as exc_info:
+            _import_spooled_posts(db, spool, BULK_FORMAT_JSONL)
+        assert exc_info.value.status_code == 400
+        assert db.query(ScheduledPost).filter(ScheduledPost.ig_account_id == account.id).count() == 0
+    finally:
+        spool.close()
+        db.close()
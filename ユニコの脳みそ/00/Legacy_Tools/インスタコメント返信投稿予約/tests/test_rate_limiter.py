@@ -0,0 +1,81 @@
+"""
+Graph APIレート制限のテスト
+"""
+import json
+
+import pytest
+
+from app.enums import ApiEndpointClass
+from app.rate_limiter import (
+    RateLimiter,
+    RateLimitExceeded,
+    TokenBucket,
+    backoff_delay,
+    parse_usage_headers,
+)
+
+
+def test_token_bucket_allows_burst_then_reports_wait():
+    """容量分は即座に取得でき、使い切ったら待ち時間を返すテスト"""
+    bucket = TokenBucket(rate_per_second=1.0, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = bucket.reserve()
+    assert 0 < wait <= 1.0
+
+
+def test_rate_limiter_is_per_account_and_endpoint(monkeypatch):
+    """アカウント×エンドポイント種別ごとに独立したバケットを使うテスト"""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_BURST", 1)
+    monkeypatch.setattr(settings, "RATE_LIMIT_PUBLISH_PER_MINUTE", 1.0)
+    limiter = RateLimiter()
+
+    limiter.acquire("acct_a", ApiEndpointClass.PUBLISH, max_wait=0)
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        limiter.acquire("acct_a", ApiEndpointClass.PUBLISH, max_wait=0)
+    assert exc_info.value.retry_after > 0
+
+    # 他アカウント・他エンドポイントには影響しない
+    limiter.acquire("acct_b", ApiEndpointClass.PUBLISH, max_wait=0)
+    limiter.acquire("acct_a", ApiEndpointClass.DM, max_wait=0)
+
+
+def test_usage_headers_throttle_and_pause_bucket():
+    """使用率ヘッダーに応じてレートを下げ、上限到達で停止するテスト"""
+    headers = {
+        "x-app-usage": json.dumps({"call_count": 10, "total_cputime": 5, "total_time": 7}),
+        "x-business-use-case-usage": json.dumps({
+            "1789": [{
+                "type": "instagram",
+                "call_count": 90,
+                "total_cputime": 20,
+                "total_time": 30,
+                "estimated_time_to_regain_access": 0,
+            }],
+        }),
+    }
+    assert parse_usage_headers(headers) == (90.0, 0.0)
+
+    limiter = RateLimiter()
+    bucket = limiter.bucket("acct", ApiEndpointClass.PUBLISH)
+    limiter.observe("acct", ApiEndpointClass.PUBLISH, headers)
+    assert bucket.rate < bucket.base_rate
+
+    limiter.observe("acct", ApiEndpointClass.PUBLISH, {"x-app-usage": "{}"})
+    assert bucket.rate == bucket.base_rate
+
+    blocked = {
+        "x-business-use-case-usage": json.dumps({
+            "1789": [{"type": "instagram", "call_count": 100, "estimated_time_to_regain_access": 5}],
+        }),
+    }
+    limiter.observe("acct", ApiEndpointClass.PUBLISH, blocked)
+    assert bucket.reserve() > 290
+
+
+def test_backoff_delay_grows_and_is_capped():
+    """バックオフの上限が回数とともに増え、capを超えないテスト"""
+    for attempt in range(1, 10):
+        delay = backoff_delay(attempt, base=2.0, cap=60.0)
+        assert 1.0 <= delay <= min(60.0, 2.0 * 2 ** (attempt - 1))
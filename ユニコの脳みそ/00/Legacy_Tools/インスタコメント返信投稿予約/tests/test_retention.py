@@ -0,0 +1,97 @@
+"""
+ログの保持期間管理（集計・アーカイブ・削除）のテスト
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from app.db import SessionLocal
+from app.models import CommentLog, CommentReplyRule, IGAccount, LogDailyStat, RuleDailyHit
+from app.dashboard_counters import reconcile_dashboard_counters, read_dashboard_counters
+from app.retention import (
+    RetentionPolicy, apply_retention_policy, incremental_vacuum, iter_archived_rows,
+    _rollup_messages, _comment_counter_deltas
+)
+
+
+def test_old_comment_logs_are_rolled_up_archived_and_deleted(tmp_path):
+    """保持期間を過ぎたコメントログが日次集計・アーカイブされてから削除されるテスト"""
+    db = SessionLocal()
+    try:
+        account = IGAccount(name="retention", ig_user_id="retention_1", access_token="t")
+        db.add(account)
+        db.flush()
+        rule = CommentReplyRule(ig_account_id=account.id, keyword="price", reply_text="DM")
+        db.add(rule)
+        db.flush()
+        # 他のテストが作るログより古い時刻にして、このテストの行だけを保持期間切れにする
+        now = datetime(2020, 6, 1, 12, 0)
+        old_day = now - timedelta(days=100)
+        db.add_all([
+            CommentLog(ig_account_id=account.id, instagram_comment_id="ret_c1", text="price?",
+                       replied=1, used_rule_id=rule.id, created_at=old_day),
+            CommentLog(ig_account_id=account.id, instagram_comment_id="ret_c2", text="price!",
+                       replied=1, used_rule_id=rule.id, created_at=old_day + timedelta(hours=1)),
+            CommentLog(ig_account_id=account.id, instagram_comment_id="ret_c3", text="hello",
+                       replied=0, created_at=old_day + timedelta(days=1)),
+            CommentLog(ig_account_id=account.id, instagram_comment_id="ret_c4", text="recent",
+                       replied=0, created_at=now - timedelta(days=1)),
+        ])
+        db.commit()
+        reconcile_dashboard_counters(db)
+        unhandled_before = read_dashboard_counters(db)["unhandled_comments"]
+
+        policy = RetentionPolicy(
+            CommentLog,
+            90,
+            lambda session, rows: _rollup_messages(session, rows, "comment"),
+            _comment_counter_deltas,
+        )
+        deleted = apply_retention_policy(
+            db, policy, now=now, batch_size=2, archive_dir=str(tmp_path)
+        )
+
+        assert deleted == 3
+        remaining = db.query(CommentLog.instagram_comment_id).filter(
+            CommentLog.ig_account_id == account.id
+        ).all()
+        assert [row[0] for row in remaining] == ["ret_c4"]
+        assert read_dashboard_counters(db)["unhandled_comments"] == unhandled_before - 1
+
+        stats = {
+            stat.day: (stat.received, stat.replied)
+            for stat in db.query(LogDailyStat).filter(LogDailyStat.ig_account_id == account.id)
+        }
+        assert stats == {old_day.date(): (2, 2), (old_day + timedelta(days=1)).date(): (1, 0)}
+        hits = db.query(RuleDailyHit).filter(RuleDailyHit.rule_id == rule.id).one()
+        assert (hits.day, hits.hits) == (old_day.date(), 2)
+
+        archived = list(iter_archived_rows(
+            "comment_logs", old_day.date(), now.date(), archive_dir=str(tmp_path)
+        ))
+        assert sorted(row["instagram_comment_id"] for row in archived) == [
+            "ret_c1", "ret_c2", "ret_c3"
+        ]
+    finally:
+        db.close()
+
+
+def test_incremental_vacuum_releases_free_pages(tmp_path):
+    """auto_vacuum=INCREMENTALのDBで削除後の空きページが解放されるテスト"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'vacuum.db'}")
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute(text("CREATE TABLE blobs (id INTEGER PRIMARY KEY, body TEXT)"))
+        conn.execute(
+            text("INSERT INTO blobs (body) VALUES (:body)"),
+            [{"body": "x" * 4000} for _ in range(200)],
+        )
+        conn.execute(text("DELETE FROM blobs"))
+        conn.commit()
+        assert conn.exec_driver_sql("PRAGMA freelist_count").scalar() > 0
+
+    assert incremental_vacuum(engine, pages=10) == 10
+    assert incremental_vacuum(engine, pages=100000) > 0
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA freelist_count").scalar() == 0
+    engine.dispose()
@@ -38,3 +38,39 @@ def test_dm_rule_matching():
     assert "こんにちは" not in "さようなら".lower()
 
 
+def test_keyword_automaton_returns_highest_priority_match():
+    """オートマトンがテキスト中の最優先キーワードを1回の走査で見つけるテスト"""
+    from app.rule_matcher import KeywordAutomaton
+
+    # インデックスが小さいほど優先度が高い
+    automaton = KeywordAutomaton(["価格", "ありがとう", "がとう", "he", "she", "hers"])
+
+    assert automaton.search("ありがとうございます") == 1
+    assert automaton.search("ご質問ありがとう、価格は?") == 0
+    assert automaton.search("ushers") == 3
+    assert automaton.search("shx") is None
+    assert automaton.search("") is None
+
+
+def test_compiled_rule_set_matches_like_linear_scan():
+    """コンパイル済みルールが従来の線形走査と同じルールを選ぶテスト"""
+    import random
+    from app.rule_matcher import CompiledRuleSet
+
+    keywords = ["LINE", "line登録", "価格", "値段", "ありがとう", "DM", "プレゼント", "e"]
+    rules = [
+        CommentReplyRule(id=i + 1, keyword=kw, reply_text=f"reply {i}", priority=i)
+        for i, kw in enumerate(keywords)
+    ]
+    compiled = CompiledRuleSet(rules)
+
+    rng = random.Random(0)
+    alphabet = ["LINE", "line", "登録", "価格", "値", "段", "あり", "がとう", "dm", "プレ", "ゼント", "x", "E"]
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 6)))
+        expected = next(
+            (rule for rule in rules if rule.keyword.lower() in text.lower()),
+            None,
+        )
+        matched = compiled.match(text)
+        assert (matched.id if matched else None) == (expected.id if expected else None)
@@ -64,3 +64,287 @@ def test_process_due_posts_posts_pending_items(monkeypatch):
         db.close()
 
 
+def test_process_due_posts_claims_each_post_once(monkeypatch):
+    """確保済みの投稿が二重に公開されず、アカウント単位の同時実行数が守られるテスト"""
+    import threading
+    import time
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "SCHEDULER_BATCH_SIZE", 3)
+    monkeypatch.setattr(settings, "SCHEDULER_MAX_WORKERS", 4)
+    monkeypatch.setattr(settings, "SCHEDULER_PER_ACCOUNT_CONCURRENCY", 1)
+
+    db = SessionLocal()
+    try:
+        account = IGAccount(
+            name="claim_account",
+            ig_user_id="claim_123",
+            access_token="dummy_token",
+        )
+        db.add(account)
+        db.commit()
+        db.refresh(account)
+
+        now = datetime.now(timezone.utc)
+        posts = [
+            ScheduledPost(
+                ig_account_id=account.id,
+                post_type=PostType.FEED,
+                media_type=MediaType.IMAGE,
+                image_url=f"https://example.com/image_{i}.jpg",
+                caption=f"claim {i}",
+                scheduled_at=now - timedelta(minutes=1),
+                status=PostStatus.PENDING,
+            )
+            for i in range(7)
+        ]
+        db.add_all(posts)
+        db.commit()
+
+        lock = threading.Lock()
+        published = []
+        active = {"now": 0, "max": 0}
+
+        def dummy_create_media_for_post(**kwargs):
+            with lock:
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+            time.sleep(0.01)
+            with lock:
+                active["now"] -= 1
+            return f"creation_{kwargs['caption']}"
+
+        def dummy_publish_media(**kwargs):
+            with lock:
+                published.append(kwargs["creation_id"])
+            return "dummy_media_id"
+
+        monkeypatch.setattr(
+            "app.scheduler.create_media_for_post",
+            dummy_create_media_for_post,
+        )
+        monkeypatch.setattr(
+            "app.scheduler.publish_media",
+            dummy_publish_media,
+        )
+
+        process_due_posts()
+        process_due_posts()
+
+        assert sorted(published) == sorted(f"creation_claim {i}" for i in range(7))
+        assert active["max"] == 1
+        for post in posts:
+            db.refresh(post)
+            assert post.status == PostStatus.POSTED
+
+    finally:
+        db.close()
+
+
+def test_transient_error_requeues_post_with_backoff(monkeypatch):
+    """一時的なAPIエラーでは投稿をFAILEDにせずpendingに戻すテスト"""
+    from app.config import settings
+    from app.meta_client import MetaAPIError
+
+    monkeypatch.setattr(settings, "RETRY_MAX_ATTEMPTS", 2)
+
+    db = SessionLocal()
+    try:
+        account = IGAccount(
+            name="retry_account",
+            ig_user_id="retry_123",
+            access_token="dummy_token",
+        )
+        db.add(account)
+        db.commit()
+        db.refresh(account)
+
+        post = ScheduledPost(
+            ig_account_id=account.id,
+            post_type=PostType.FEED,
+            media_type=MediaType.IMAGE,
+            image_url="https://example.com/image.jpg",
+            caption="retry",
+            scheduled_at=datetime.now(timezone.utc) - timedelta(minutes=1),
+            status=PostStatus.PENDING,
+        )
+        db.add(post)
+        db.commit()
+        db.refresh(post)
+
+        def throttled_create_media_for_post(**kwargs):
+            raise MetaAPIError("throttled", status_code=400, error_code=4)
+
+        monkeypatch.setattr(
+            "app.scheduler.create_media_for_post",
+            throttled_create_media_for_post,
+        )
+
+        scheduled_at = post.scheduled_at
+        process_due_posts()
+        db.refresh(post)
+        assert post.status == PostStatus.PENDING
+        assert post.retry_count == 1
+        # 予約時刻はそのままで、再実行時刻だけが先になる
+        assert post.scheduled_at == scheduled_at
+        assert post.next_attempt_at > datetime.utcnow()
+
+        # 再実行時刻までは処理されない
+        process_due_posts()
+        db.refresh(post)
+        assert post.retry_count == 1
+
+        # リトライ上限に達したらFAILED
+        post.next_attempt_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+        db.commit()
+        process_due_posts()
+        db.refresh(post)
+        assert post.status == PostStatus.FAILED
+
+    finally:
+        db.close()
+
+
+def test_dispatcher_publishes_post_when_due(monkeypatch):
+    """期限キューに登録した投稿がポーリングを待たずに公開されるテスト"""
+    import threading
+    import time
+    from app.due_queue import due_queue
+    from app.scheduler import _dispatch_loop, notify_post_scheduled
+
+    db = SessionLocal()
+    try:
+        account = IGAccount(
+            name="dispatch_account",
+            ig_user_id="dispatch_123",
+            access_token="dummy_token",
+        )
+        db.add(account)
+        db.commit()
+        db.refresh(account)
+
+        post = ScheduledPost(
+            ig_account_id=account.id,
+            post_type=PostType.FEED,
+            media_type=MediaType.IMAGE,
+            image_url="https://example.com/image.jpg",
+            caption="dispatch",
+            scheduled_at=datetime.now(timezone.utc) + timedelta(milliseconds=200),
+            status=PostStatus.PENDING,
+        )
+        db.add(post)
+        db.commit()
+        db.refresh(post)
+
+        published = threading.Event()
+
+        def dummy_publish_media(**kwargs):
+            published.set()
+            return "dummy_media_id"
+
+        monkeypatch.setattr(
+            "app.scheduler.create_media_for_post",
+            lambda **kwargs: "dummy_creation_id",
+        )
+        monkeypatch.setattr("app.scheduler.publish_media", dummy_publish_media)
+
+        due_queue.reset()
+        thread = threading.Thread(target=_dispatch_loop)
+        thread.start()
+        try:
+            notify_post_scheduled(post.id, post.scheduled_at)
+            assert published.wait(timeout=3)
+        finally:
+            due_queue.close()
+            thread.join(timeout=5)
+
+        db.refresh(post)
+        assert post.status == PostStatus.POSTED
+
+    finally:
+        db.close()
+
+
+def test_video_container_is_published_after_processing_without_blocking_images(monkeypatch):
+    """動画コンテナの処理完了を待つ間も画像投稿が公開され、FINISHED後に動画が公開されるテスト"""
+    import threading
+    from app.enums import ContainerStatus
+    from app.scheduler import container_poller
+
+    db = SessionLocal()
+    try:
+        account = IGAccount(
+            name="video_account",
+            ig_user_id="video_123",
+            access_token="dummy_token",
+        )
+        db.add(account)
+        db.commit()
+        db.refresh(account)
+
+        due = datetime.now(timezone.utc) - timedelta(minutes=1)
+        reel = ScheduledPost(
+            ig_account_id=account.id,
+            post_type=PostType.REEL,
+            media_type=MediaType.VIDEO,
+            video_url="https://example.com/video.mp4",
+            caption="reel",
+            scheduled_at=due - timedelta(seconds=1),  # 画像より先に処理される
+            status=PostStatus.PENDING,
+        )
+        image = ScheduledPost(
+            ig_account_id=account.id,
+            post_type=PostType.FEED,
+            media_type=MediaType.IMAGE,
+            image_url="https://example.com/image.jpg",
+            caption="image",
+            scheduled_at=due,
+            status=PostStatus.PENDING,
+        )
+        db.add_all([reel, image])
+        db.commit()
+
+        status_calls = []
+        published = []
+        reel_published = threading.Event()
+
+        def dummy_get_container_statuses(container_ids, access_token, ig_user_id=None):
+            status_calls.append(list(container_ids))
+            state = ContainerStatus.IN_PROGRESS if len(status_calls) == 1 else ContainerStatus.FINISHED
+            return {container_id: state for container_id in container_ids}
+
+        def dummy_publish_media(**kwargs):
+            published.append(kwargs["creation_id"])
+            if kwargs["creation_id"] == "creation_reel":
+                reel_published.set()
+            return f"media_{kwargs['creation_id']}"
+
+        monkeypatch.setattr(
+            "app.scheduler.create_media_for_post",
+            lambda **kwargs: f"creation_{kwargs['caption']}",
+        )
+        monkeypatch.setattr("app.scheduler.publish_media", dummy_publish_media)
+        monkeypatch.setattr("app.scheduler.get_container_statuses", dummy_get_container_statuses)
+        monkeypatch.setattr(container_poller, "initial_delay", 0.05)
+
+        process_due_posts()
+
+        db.refresh(reel)
+        db.refresh(image)
+        assert image.status == PostStatus.POSTED
+        assert reel.status == PostStatus.PUBLISHING
+        assert reel.remote_media_id == "creation_reel"
+        assert published == ["creation_image"]
+
+        container_poller.start()
+        try:
+            assert reel_published.wait(timeout=5)
+        finally:
+            container_poller.stop()
+
+        db.refresh(reel)
+        assert reel.status == PostStatus.POSTED
+        assert status_calls == [["creation_reel"], ["creation_reel"]]
+
+    finally:
+        db.close()
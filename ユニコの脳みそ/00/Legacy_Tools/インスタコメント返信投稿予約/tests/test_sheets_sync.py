@@ -0,0 +1,90 @@
+"""
+Google Sheets同期サービスのテスト
+"""
+from app.db import SessionLocal
+from app.models import AppEventLog
+from app.sheets_sync import EVENT_LOG_HEADERS, SheetsSyncService
+
+
+class FakeWorksheet:
+    def __init__(self):
+        self.rows = []
+        self.calls = []
+
+    def row_values(self, row):
+        self.calls.append("row_values")
+        return self.rows[row - 1] if len(self.rows) >= row else []
+
+    def append_rows(self, rows, value_input_option=None):
+        self.calls.append("append_rows")
+        self.rows.extend(rows)
+
+    def batch_update(self, data, value_input_option=None):
+        self.calls.append("batch_update")
+        self.updated = data
+
+
+class FakeClient:
+    def __init__(self):
+        self.worksheet_obj = FakeWorksheet()
+        self.opened = 0
+
+    def open_by_key(self, key):
+        self.opened += 1
+        return self
+
+    def worksheet(self, name):
+        return self.worksheet_obj
+
+
+def test_export_event_logs_is_incremental_and_batched():
+    """送信済み位置より新しいログだけを、バッチ単位の少ない呼び出しで追記するテスト"""
+    clients = []
+
+    def factory(path):
+        clients.append(FakeClient())
+        return clients[-1]
+
+    service = SheetsSyncService("sheet_id", "sa.json", client_factory=factory)
+    db = SessionLocal()
+    try:
+        db.add_all([
+            AppEventLog(level="INFO", source="test", event_type="sync", message=f"m{i}")
+            for i in range(1200)
+        ])
+        db.commit()
+        total = db.query(AppEventLog).count()
+
+        exported = service.export_event_logs(db, "ログ", batch_size=500)
+        worksheet = clients[0].worksheet_obj
+        assert exported == total
+        assert worksheet.rows[0] == EVENT_LOG_HEADERS
+        assert len(worksheet.rows) == total + 1
+        # ヘッダー確認1回 + ヘッダー追記1回 + 500件ずつの追記
+        assert worksheet.calls.count("append_rows") == 1 + -(-total // 500)
+
+        db.add_all([
+            AppEventLog(level="INFO", source="test", event_type="sync", message=f"n{i}")
+            for i in range(3)
+        ])
+        db.commit()
+        worksheet.calls.clear()
+        assert service.export_event_logs(db, "ログ", batch_size=500) == 3
+        assert worksheet.calls == ["append_rows"]
+        assert [row[4] for row in worksheet.rows[-3:]] == ["n0", "n1", "n2"]
+
+        # 認証とスプレッドシートのオープンは1回だけ
+        assert len(clients) == 1 and clients[0].opened == 1
+    finally:
+        db.close()
+
+
+def test_batch_update_cells_uses_single_request():
+    """複数セルの更新が1回のbatch_updateになるテスト"""
+    client = FakeClient()
+    service = SheetsSyncService("sheet_id", "sa.json", client_factory=lambda path: client)
+    service.batch_update_cells("posts", [(f"F{row}", [["Scheduled"]]) for row in range(2, 1002)])
+
+    assert client.worksheet_obj.calls == ["batch_update"]
+    assert len(client.worksheet_obj.updated) == 1000
+    assert client.worksheet_obj.updated[0] == {"range": "F2", "values": [["Scheduled"]]}
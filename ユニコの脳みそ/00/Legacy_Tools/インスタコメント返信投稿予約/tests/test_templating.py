@@ -0,0 +1,86 @@
+"""
+返信テンプレートのコンパイル・描画のテスト
+"""
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from app.templating import (
+    TemplateContext, TemplateSyntaxError, compile_template, compile_template_or_literal
+)
+
+
+def test_render_variables_variants_and_escapes():
+    """変数の差し込み・ランダムな候補・波かっこのエスケープのテスト"""
+    template = compile_template("{greeting}、{username}さん！{ありがとう|感謝です}{{笑}}")
+    assert template.variables == {"greeting", "username"}
+    assert not template.is_static
+
+    # 2026-01-01 00:30 UTC = 日本時間 09:30
+    context = TemplateContext(username="taro", now=datetime(2026, 1, 1, 0, 30, tzinfo=timezone.utc))
+    rendered = {template.render(context, random.Random(seed)) for seed in range(20)}
+    assert rendered == {
+        "おはようございます、taroさん！ありがとう{笑}",
+        "おはようございます、taroさん！感謝です{笑}",
+    }
+
+    evening = TemplateContext(now=datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc))
+    assert compile_template("{time_of_day}の{greeting}").render(evening) == "夜のこんばんは"
+
+    # 同じ本文は再解析しない
+    assert compile_template("{greeting}、{username}さん！{ありがとう|感謝です}{{笑}}") is template
+
+
+def test_existing_texts_are_sent_as_is():
+    """変数を使わない文面・未知の変数名はそのまま送られるテスト"""
+    plain = compile_template("DMをお送りしました！")
+    assert plain.is_static
+    assert plain.render() == "DMをお送りしました！"
+
+    assert compile_template("{foo}と{}").render() == "{foo}と{}"
+
+    with pytest.raises(TemplateSyntaxError):
+        compile_template("{A|B")
+    assert compile_template_or_literal("{A|B").render() == "{A|B"
+
+
+def test_template_edit_invalidates_compiled_rules():
+    """テンプレートを編集するとルールキャッシュが作り直され、キャプションが差し込まれるテスト"""
+    from app.db import SessionLocal
+    from app.main import MessageTemplateUpdate, update_template
+    from app.models import CommentReplyRule, IGAccount, MessageTemplate, ScheduledPost
+    from app.rule_matcher import comment_rule_cache
+    from app.webhook_processor import render_reply
+
+    db = SessionLocal()
+    try:
+        account = IGAccount(name="template", ig_user_id="template_1", access_token="t")
+        db.add(account)
+        db.flush()
+        template = MessageTemplate(ig_account_id=account.id, name="price", body="DMしました")
+        db.add(template)
+        db.flush()
+        db.add(CommentReplyRule(
+            ig_account_id=account.id, keyword="価格", reply_text="fallback", template_id=template.id
+        ))
+        db.add(ScheduledPost(
+            ig_account_id=account.id, caption="春の新作", remote_media_id="template_media_1",
+            scheduled_at=datetime(2026, 1, 1), status="posted",
+        ))
+        db.commit()
+
+        matched = comment_rule_cache.get(db, account.id).match("価格は？")
+        assert render_reply(db, matched, account_id=account.id) == "DMしました"
+
+        update_template(
+            template.id,
+            MessageTemplateUpdate(body="@{username} 「{caption}」の詳細をDMしました"),
+            db,
+        )
+        matched = comment_rule_cache.get(db, account.id).match("価格は？")
+        assert render_reply(
+            db, matched, account_id=account.id, username="hanako", media_id="template_media_1"
+        ) == "@hanako 「春の新作」の詳細をDMしました"
+    finally:
+        db.close()
@@ -0,0 +1,38 @@
+"""
+イベントログユーティリティのテスト
+"""
+from app.db import SessionLocal
+from app.models import AppEventLog
+from app.utils_logging import log_event, flush_event_logs
+
+
+def test_log_event_is_buffered_and_bulk_written():
+    """log_eventがバッファされ、flushでまとめて書き込まれるテスト"""
+    db = SessionLocal()
+    try:
+        flush_event_logs()
+        before = db.query(AppEventLog).filter(AppEventLog.source == "test_sink").count()
+
+        for i in range(5):
+            log_event(
+                db,
+                level="info",
+                source="test_sink",
+                event_type="sink_test",
+                message=f"message {i}",
+                meta={"index": i},
+            )
+        flush_event_logs()
+
+        rows = (
+            db.query(AppEventLog)
+            .filter(AppEventLog.source == "test_sink")
+            .order_by(AppEventLog.id.asc())
+            .all()
+        )
+        assert len(rows) == before + 5
+        assert [row.message for row in rows[-5:]] == [f"message {i}" for i in range(5)]
+        assert all(row.level == "INFO" for row in rows[-5:])
+        assert rows[-1].meta == '{"index": 4}'
+    finally:
+        db.close()
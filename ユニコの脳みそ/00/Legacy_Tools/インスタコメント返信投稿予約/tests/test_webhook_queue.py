@@ -0,0 +1,163 @@
+"""
+Webhook受信キューのテスト
+"""
+from app.enums import WebhookEventStatus
+from app.webhook_queue import WebhookQueue, WebhookConsumerPool
+from app.webhook_processor import parse_comment_events, parse_dm_events
+
+
+def _comment_payload(comment_id: str) -> dict:
+    return {
+        "entry": [{
+            "id": "ig_1",
+            "changes": [{
+                "field": "comments",
+                "value": {"id": comment_id, "text": "hello", "from": {"id": "u_1"}},
+            }],
+        }],
+    }
+
+
+def test_enqueue_deduplicates_redelivered_events(tmp_path):
+    """Metaからの再送が重複排除されるテスト"""
+    queue = WebhookQueue(str(tmp_path / "queue.db"))
+
+    assert queue.enqueue(parse_comment_events(_comment_payload("c_1"))) == 1
+    assert queue.enqueue(parse_comment_events(_comment_payload("c_1"))) == 0
+    assert queue.enqueue(parse_comment_events(_comment_payload("c_2"))) == 1
+    assert queue.depth() == 2
+
+    events = queue.claim(10)
+    assert [e["data"]["value"]["id"] for e in events] == ["c_1", "c_2"]
+    assert queue.claim(10) == []
+
+    # 処理済みになった後の再送も重複として扱う
+    queue.ack([e["id"] for e in events])
+    assert queue.enqueue(parse_comment_events(_comment_payload("c_1"))) == 0
+    assert queue.depth() == 0
+
+
+def test_parse_skips_malformed_entries():
+    """辞書でないentry・changesの要素は読み飛ばし、例外にしないテスト"""
+    payload = _comment_payload("c_ok")
+    payload["entry"] += ["oops", {"id": "ig_1", "changes": "oops"}, {"id": "ig_1", "changes": [1, None]}]
+    payload["entry"][0]["changes"].append("oops")
+
+    assert [e["dedup_key"] for e in parse_comment_events(payload)] == ["comment:c_ok"]
+    assert parse_dm_events({"entry": [{"changes": [
+        {"field": "messages", "value": {"message": "oops"}},
+        {"field": "messages", "value": "oops"},
+    ]}]}) == [{"kind": "dm", "dedup_key": None, "data": {"entry_id": None, "value": {"message": "oops"}}}]
+    assert parse_comment_events({"entry": "oops"}) == []
+
+
+def test_consumer_retries_failed_events(tmp_path):
+    """処理に失敗したイベントがリトライされ、上限でdeadになるテスト"""
+    queue = WebhookQueue(str(tmp_path / "queue.db"))
+    queue.enqueue(parse_comment_events(_comment_payload("c_ok")))
+    queue.enqueue(parse_comment_events(_comment_payload("c_ng")))
+
+    def handler(events):
+        return [e["id"] for e in events if e["data"]["value"]["id"] == "c_ng"]
+
+    pool = WebhookConsumerPool(
+        queue, handler, workers=1, batch_size=10, poll_interval=0.01, max_attempts=2,
+    )
+    assert pool.run_once() == 2
+    assert pool.run_once() == 1
+    assert pool.run_once() == 0
+
+    statuses = dict(
+        queue._conn().execute("SELECT dedup_key, status FROM webhook_events").fetchall()
+    )
+    assert statuses == {
+        "comment:c_ok": WebhookEventStatus.DONE,
+        "comment:c_ng": WebhookEventStatus.DEAD,
+    }
+
+
+def test_requeue_stale_only_returns_old_processing_events(tmp_path):
+    """他プロセスが処理中のイベントは戻さず、古いprocessingだけをpendingに戻すテスト"""
+    from datetime import datetime, timedelta
+
+    queue = WebhookQueue(str(tmp_path / "queue.db"))
+    queue.enqueue(parse_comment_events(_comment_payload("c_stale")))
+    stale = queue.claim(1)
+    queue.enqueue(parse_comment_events(_comment_payload("c_busy")))
+
+    # 1件目は落ちたワーカーが取り出したまま放置された扱いにする
+    old = (datetime.utcnow() - timedelta(minutes=10)).isoformat()
+    queue._conn().execute("UPDATE webhook_events SET updated_at = ? WHERE id = ?", (old, stale[0]["id"]))
+    busy = queue.claim(1)
+
+    assert queue.requeue_stale(datetime.utcnow() - timedelta(minutes=5)) == 1
+    assert [e["id"] for e in queue.claim(10)] == [stale[0]["id"]]
+    assert busy[0]["id"] != stale[0]["id"]
+
+
+def test_rate_limited_reply_is_deferred_and_sent_later(tmp_path, monkeypatch):
+    """レート制限で送れなかった返信がキューに戻され、後で送信されるテスト"""
+    import time
+
+    import httpx
+
+    from app import meta_client
+    from app.config import settings
+    from app.db import SessionLocal
+    from app.models import CommentLog, CommentReplyRule, IGAccount
+    from app.rate_limiter import rate_limiter
+    from app.webhook_processor import handle_event_batch
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_BURST", 1)
+    monkeypatch.setattr(settings, "RATE_LIMIT_COMMENT_REPLY_PER_MINUTE", 600.0)
+    rate_limiter.reset()
+
+    replied = []
+
+    def graph_api(request: httpx.Request) -> httpx.Response:
+        replied.append(request.url.path)
+        return httpx.Response(200, json={"id": f"reply_{len(replied)}"})
+
+    client = httpx.Client(transport=httpx.MockTransport(graph_api))
+    monkeypatch.setattr(meta_client, "_get_sync_client", lambda: client)
+
+    db = SessionLocal()
+    try:
+        account = IGAccount(name="limited", ig_user_id="ig_limited", access_token="token")
+        db.add(account)
+        db.commit()
+        db.add(CommentReplyRule(ig_account_id=account.id, keyword="hello", reply_text="thanks"))
+        db.commit()
+
+        queue = WebhookQueue(str(tmp_path / "queue.db"))
+        for comment_id in ("c_limited_1", "c_limited_2"):
+            payload = _comment_payload(comment_id)
+            payload["entry"][0]["id"] = "ig_limited"
+            queue.enqueue(parse_comment_events(payload))
+
+        pool = WebhookConsumerPool(
+            queue, handle_event_batch, workers=1, batch_size=10, poll_interval=0.01, max_attempts=1,
+        )
+        # 1件目は送信、2件目はトークンが無いので待たずにキューへ戻る
+        assert pool.run_once() == 2
+        assert len(replied) == 1
+        assert queue.depth() == 1
+
+        deadline = time.monotonic() + 5
+        while queue.depth() and time.monotonic() < deadline:
+            pool.run_once()
+            time.sleep(0.05)
+
+        assert len(replied) == 2
+        rows = dict(
+            queue._conn().execute("SELECT dedup_key, status FROM webhook_events").fetchall()
+        )
+        # 後回しはリトライ上限の回数に数えない
+        assert set(rows.values()) == {WebhookEventStatus.DONE}
+        logs = db.query(CommentLog).filter(CommentLog.ig_account_id == account.id).all()
+        assert len(logs) == 2
+        assert all(log.replied for log in logs)
+    finally:
+        db.close()
+        client.close()
+        rate_limiter.reset()
@@ -9,7 +9,7 @@ import time
 
 from config import OUTPUT_DIR
 from collect_own_posts import collect_own_posts
-from collect_competitor_posts import collect_competitor_posts, collect_from_url
+from collect_competitor_posts import collect_competitor_posts, collect_from_url, crawl_competitors
 from collect_video_views import collect_views_for_posts
 from analyze_data import (
     calculate_basic_stats,
@@ -18,6 +18,7 @@ from analyze_data import (
     export_to_excel
 )
 from prompt_template import save_prompt_template, generate_quick_analysis_summary
+from post_store import update_posts
 
 # ページ設定
 st.set_page_config(
@@ -103,7 +104,7 @@ elif menu == "📥 データ収集":
         
         collection_method = st.radio(
             "収集方法",
-            ["アカウント名で収集", "投稿URLで収集"]
+            ["アカウント名で収集", "複数アカウントを巡回", "投稿URLで収集"]
         )
         
         if collection_method == "アカウント名で収集":
@@ -132,6 +133,34 @@ elif menu == "📥 データ収集":
                 else:
                     st.warning("アカウント名を入力してください。")
         
+        elif collection_method == "複数アカウントを巡回":
+            usernames_text = st.text_area("アカウント名（@なし、1行に1つ）", placeholder="example_account\nexample_account2")
+            max_posts = st.number_input("アカウントあたりの投稿数", min_value=1, max_value=200, value=50)
+            st.caption("途中で止まった巡回は、次回同じボタンで完了していないアカウントから再開します。")
+            
+            if st.button("巡回を開始", type="primary"):
+                usernames = [line.strip().lstrip('@') for line in usernames_text.splitlines() if line.strip()]
+                if usernames:
+                    with st.spinner(f"{len(usernames)}アカウントを巡回中..."):
+                        try:
+                            df = crawl_competitors(usernames, max_posts=max_posts)
+                            if not df.empty:
+                                if st.session_state.competitor_posts_df.empty:
+                                    st.session_state.competitor_posts_df = df
+                                else:
+                                    st.session_state.competitor_posts_df = pd.concat([
+                                        st.session_state.competitor_posts_df,
+                                        df
+                                    ], ignore_index=True).drop_duplicates(subset='メディアID', keep='last')
+                                st.success(f"✅ {len(df)}件の投稿を収集しました！")
+                                st.dataframe(df.head(10))
+                            else:
+                                st.error("投稿が見つかりませんでした。")
+                        except Exception as e:
+                            st.error(f"エラーが発生しました: {e}")
+                else:
+                    st.warning("アカウント名を入力してください。")
+        
         else:  # 投稿URLで収集
             post_url = st.text_input("投稿URL", placeholder="https://www.instagram.com/p/...")
             
@@ -161,8 +190,8 @@ elif menu == "📥 データ収集":
     # 再生数取得
     with tab3:
         st.subheader("動画投稿の再生数を取得")
-        st.markdown("Seleniumを使用して動画投稿の再生数をスクリーンショットで取得します。")
-        st.warning("⚠️ この機能は時間がかかります。動画投稿のみが対象です。")
+        st.markdown("Seleniumのヘッドレスブラウザで動画投稿の再生数をページから取得します。")
+        st.warning("⚠️ 動画投稿のみが対象です。投稿数が多いと数分かかります。")
         
         if not st.session_state.competitor_posts_df.empty:
             video_posts = st.session_state.competitor_posts_df[
@@ -181,6 +210,11 @@ elif menu == "📥 データ収集":
                                 original_idx = video_posts.index[video_posts['投稿URL'] == row['投稿URL']].tolist()
                                 if original_idx:
                                     st.session_state.competitor_posts_df.loc[original_idx[0], '再生数'] = row['再生数']
+                            # 次回の収集でも再生数を引き継ぐよう保存
+                            update_posts({
+                                row['メディアID']: {'再生数': row['再生数']}
+                                for _, row in updated_df.iterrows() if row['再生数'] != ''
+                            })
                             
                             st.success("✅ 再生数の取得が完了しました！")
                             st.dataframe(st.session_state.competitor_posts_df[
@@ -1,136 +1,328 @@
 """
 競合アカウントのInstagram投稿をInstaloaderで収集するモジュール
+
+収集結果はpost_storeに保存し、次回は前回より新しい投稿と
+指標更新の対象期間（HOT_WINDOW_DAYS）の投稿だけを取得する
+
+- ログインは1回だけ行い、セッションをファイルに保存して全ワーカーで使い回す
+- 投稿ごとの固定の待ち時間ではなく、全ワーカー共通のリクエスト予算
+  （1時間あたりの上限と最小間隔）に沿ってInstagramへのリクエストを送る
+- 複数アカウントはキューとして数ワーカーで巡回し、アカウントごとの途中経過を記録して
+  中断しても続きから再開する
 """
 import instaloader
 import pandas as pd
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
 from typing import List, Dict, Optional
+import threading
 import time
 import re
+import post_store
 from config import (
     INSTAGRAM_USERNAME,
     INSTAGRAM_PASSWORD,
-    SCRAPING_DELAY,
-    MAX_POSTS_PER_ACCOUNT
+    MAX_POSTS_PER_ACCOUNT,
+    INSTALOADER_SESSION_FILE,
+    CRAWL_MAX_WORKERS,
+    CRAWL_REQUESTS_PER_HOUR,
+    CRAWL_MIN_INTERVAL,
+    CRAWL_CHECKPOINT_EVERY
 )
 
+# 429（リクエスト過多）を受けたときに全ワーカーを止める秒数
+TOO_MANY_REQUESTS_BACKOFF = 15 * 60
 
-def extract_hashtags(caption: str) -> str:
+
+class PolitenessBudget:
     """
-    キャプションからハッシュタグを抽出
-    
-    Args:
-        caption: キャプション文字列
-        
-    Returns:
-        ハッシュタグの文字列（スペース区切り）
+    全ワーカー共通のリクエスト予算
+
+    直近1時間のリクエスト数がmax_requestsを超えないようにし、
+    リクエスト同士の間隔もmin_interval秒以上あける。
     """
-    if not caption:
-        return ''
-    
-    hashtags = re.findall(r'#\w+', caption)
-    return ' '.join(hashtags)
 
+    def __init__(
+        self,
+        max_requests: int = CRAWL_REQUESTS_PER_HOUR,
+        min_interval: float = CRAWL_MIN_INTERVAL,
+        window: float = 3600
+    ):
+        self.max_requests = max_requests
+        self.min_interval = min_interval
+        self.window = window
+        self._lock = threading.Lock()
+        self._sent = deque()
+        self._next_at = 0.0
 
-def collect_competitor_posts(
-    username: str,
-    max_posts: int = MAX_POSTS_PER_ACCOUNT,
-    login_required: bool = True
-) -> pd.DataFrame:
+    def acquire(self):
+        """リクエストを1回送ってよくなるまで待つ"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0] >= self.window:
+                    self._sent.popleft()
+                delay = self._next_at - now
+                if len(self._sent) >= self.max_requests:
+                    delay = max(delay, self._sent[0] + self.window - now)
+                if delay <= 0:
+                    self._sent.append(now)
+                    self._next_at = now + self.min_interval
+                    return
+            time.sleep(delay)
+
+    def backoff(self, seconds: float):
+        """一定時間すべてのリクエストを止める"""
+        with self._lock:
+            self._next_at = max(self._next_at, time.monotonic() + seconds)
+
+
+class BudgetRateController(instaloader.RateController):
+    """Instaloaderのリクエストの前にPolitenessBudgetを通す"""
+
+    def __init__(self, context: instaloader.InstaloaderContext, budget: PolitenessBudget):
+        super().__init__(context)
+        self.budget = budget
+
+    def wait_before_query(self, query_type: str):
+        super().wait_before_query(query_type)
+        self.budget.acquire()
+
+    def handle_429(self, query_type: str):
+        self.budget.backoff(TOO_MANY_REQUESTS_BACKOFF)
+        super().handle_429(query_type)
+
+
+# プロセス内で共通の予算（Streamlitで続けて収集しても合計で予算内に収まる）
+default_budget = PolitenessBudget()
+
+_session_lock = threading.Lock()
+_local = threading.local()
+
+
+def create_loader(login: bool = True, budget: Optional[PolitenessBudget] = None) -> instaloader.Instaloader:
     """
-    競合アカウントの投稿を収集してDataFrameに変換
-    
+    Instaloaderを作成し、保存済みのセッションでログイン状態にする
+
+    セッションファイルがないか無効な場合だけログインし、セッションを保存する。
+
     Args:
-        username: Instagramアカウント名（@なし）
-        max_posts: 取得する最大投稿数
-        login_required: ログインが必要かどうか（いいね数取得には必要）
-        
+        login: ログインするか（いいね数取得には必要）
+        budget: リクエスト予算（Noneならプロセス共通の予算）
+
     Returns:
-        投稿データのDataFrame
+        Instaloaderインスタンス
     """
-    print(f"競合アカウント @{username} の投稿を収集中... (最大{max_posts}件)")
-    
-    # Instaloaderの初期化
+    budget = budget or default_budget
     loader = instaloader.Instaloader(
         download_videos=False,
         download_video_thumbnails=False,
         download_geotags=False,
         download_comments=False,
         save_metadata=False,
-        compress_json=False
+        compress_json=False,
+        rate_controller=lambda context: BudgetRateController(context, budget)
     )
-    
-    # ログイン（必要に応じて）
-    if login_required and INSTAGRAM_USERNAME and INSTAGRAM_PASSWORD:
+
+    if not login or not INSTAGRAM_USERNAME:
+        return loader
+
+    with _session_lock:
+        try:
+            loader.load_session_from_file(INSTAGRAM_USERNAME, INSTALOADER_SESSION_FILE)
+            if loader.test_login():
+                return loader
+            print("保存済みのセッションが無効になっています。再ログインします。")
+        except FileNotFoundError:
+            pass
+
+        if not INSTAGRAM_PASSWORD:
+            print("ログイン情報が設定されていません。ログインなしで続行します。")
+            return loader
         try:
             loader.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
+            loader.save_session_to_file(INSTALOADER_SESSION_FILE)
             print("ログイン成功")
         except Exception as e:
             print(f"ログインエラー: {e}")
             print("ログインなしで続行します（いいね数などが取得できない可能性があります）")
-            login_required = False
-    
-    try:
-        # プロフィールを取得
-        profile = instaloader.Profile.from_username(loader.context, username)
-        print(f"アカウント名: {profile.full_name}")
-        print(f"フォロワー数: {profile.followers:,}")
-        
-        # 投稿を取得
-        posts = profile.get_posts()
-        
-        data = []
+    return loader
+
+
+def get_loader(login: bool = True) -> instaloader.Instaloader:
+    """このスレッド用のInstaloaderを取得（スレッドごとに1回だけ作成）"""
+    loaders = getattr(_local, 'loaders', None)
+    if loaders is None:
+        loaders = _local.loaders = {}
+    if login not in loaders:
+        loaders[login] = create_loader(login)
+    return loaders[login]
+
+
+def extract_hashtags(caption: str) -> str:
+    """
+    キャプションからハッシュタグを抽出
+
+    Args:
+        caption: キャプション文字列
+
+    Returns:
+        ハッシュタグの文字列（スペース区切り）
+    """
+    if not caption:
+        return ''
+
+    hashtags = re.findall(r'#\w+', caption)
+    return ' '.join(hashtags)
+
+
+def build_post_row(post: instaloader.Post, post_type: str, post_url: Optional[str] = None) -> Dict:
+    """
+    Instaloaderの投稿から1行分のデータを作成
+
+    Args:
+        post: 投稿
+        post_type: 投稿タイプ列の値
+        post_url: 投稿URL（Noneならshortcodeから作成）
+
+    Returns:
+        DataFrameの1行分の辞書
+    """
+    # 投稿日時をパース
+    post_date = post.date_local.strftime('%Y-%m-%d')
+    post_time = post.date_local.strftime('%H:%M')
+    weekday = post.date_local.strftime('%A')
+
+    caption = post.caption or ''
+    hashtags = extract_hashtags(caption)
+
+    return {
+        '投稿タイプ': post_type,
+        '投稿日時': f"{post_date} {post_time}",
+        '投稿日': post_date,
+        '投稿時間帯': post_time,
+        '曜日': weekday,
+        'いいね数': post.likes,
+        'コメント数': post.comments,
+        '保存数': '',  # Instaloaderでは取得不可
+        'リーチ数': '',
+        'インプレッション数': '',
+        'キャプション': caption,
+        'ハッシュタグ': hashtags,
+        'メディアタイプ': '動画' if post.is_video else '写真',
+        '投稿URL': post_url or f"https://www.instagram.com/p/{post.shortcode}/",
+        'メディアID': post.shortcode,
+        '再生数': ''  # 後でSeleniumで取得
+    }
+
+
+def _crawl_account(
+    loader: instaloader.Instaloader,
+    username: str,
+    max_posts: int,
+    incremental: bool
+) -> pd.DataFrame:
+    """
+    1アカウントの投稿を収集（エラーはそのまま送出する）
+
+    CRAWL_CHECKPOINT_EVERY件ごとに投稿を保存して投稿一覧の続きの状態を記録し、
+    中断後の次回実行ではその続きから再開する。
+    """
+    account_key = f'競合_{username}'
+    checkpoint = post_store.get_checkpoint(account_key) if incremental else None
+    if checkpoint:
+        since = checkpoint['since']
+        count = checkpoint['count']
+        print(f"競合アカウント @{username} の収集を再開します... ({count}件目から、最大{max_posts}件)")
+    else:
+        since = post_store.fetch_since(account_key) if incremental else None
         count = 0
-        
+        if since:
+            print(f"競合アカウント @{username} の投稿を収集中... ({since.strftime('%Y-%m-%d %H:%M')} UTC以降、最大{max_posts}件)")
+        else:
+            print(f"競合アカウント @{username} の投稿を収集中... (最大{max_posts}件)")
+
+    # プロフィールを取得
+    profile = instaloader.Profile.from_username(loader.context, username)
+    print(f"アカウント名: {profile.full_name}")
+    print(f"フォロワー数: {profile.followers:,}")
+
+    # 投稿を取得
+    posts = profile.get_posts()
+    if checkpoint and checkpoint['iterator'] and hasattr(posts, 'thaw'):
+        try:
+            posts.thaw(instaloader.FrozenNodeIterator(**checkpoint['iterator']))
+        except (TypeError, instaloader.exceptions.InvalidArgumentException) as e:
+            # 期限切れなどで続きから読めない場合は先頭から読み直す（保存済みの投稿は上書きされるだけ）
+            print(f"途中経過を使えないため先頭から収集します: {e}")
+            posts = profile.get_posts()
+            count = 0
+
+    stored = []
+    rows = []
+
+    def checkpoint_progress():
+        post_store.save_posts(account_key, stored)
+        stored.clear()
+        frozen = posts.freeze()._asdict() if hasattr(posts, 'freeze') else None
+        post_store.save_checkpoint(account_key, since, frozen, count)
+
+    try:
         for post in posts:
             if count >= max_posts:
                 break
-            
+
+            posted_at = post.date_utc.replace(tzinfo=timezone.utc)
+            # 投稿は新しい順（固定された投稿は除く）なので、遡り終えたら終了
+            if since is not None and posted_at < since:
+                if getattr(post, 'is_pinned', False):
+                    continue
+                break
+
             count += 1
             print(f"処理中: {count}/{max_posts}")
-            
-            # 投稿日時をパース
-            post_date = post.date_local.strftime('%Y-%m-%d')
-            post_time = post.date_local.strftime('%H:%M')
-            weekday = post.date_local.strftime('%A')
-            
-            caption = post.caption or ''
-            hashtags = extract_hashtags(caption)
-            
-            # いいね数とコメント数を取得
-            likes = post.likes
-            comments = post.comments
-            
-            row = {
-                '投稿タイプ': f'競合_{username}',
-                '投稿日時': f"{post_date} {post_time}",
-                '投稿日': post_date,
-                '投稿時間帯': post_time,
-                '曜日': weekday,
-                'いいね数': likes,
-                'コメント数': comments,
-                '保存数': '',  # Instaloaderでは取得不可
-                'リーチ数': '',
-                'インプレッション数': '',
-                'キャプション': caption,
-                'ハッシュタグ': hashtags,
-                'メディアタイプ': '動画' if post.is_video else '写真',
-                '投稿URL': f"https://www.instagram.com/p/{post.shortcode}/",
-                'メディアID': post.shortcode,
-                '再生数': ''  # 後でSeleniumで取得
-            }
-            
-            data.append(row)
-            
-            # BAN対策の遅延
-            if count < max_posts:
-                time.sleep(SCRAPING_DELAY)
-        
-        df = pd.DataFrame(data)
-        print(f"収集完了: {len(df)}件の投稿を取得しました。")
-        
-        return df
-        
+            row = build_post_row(post, account_key)
+            rows.append(row)
+            stored.append((row, posted_at))
+
+            if len(stored) >= CRAWL_CHECKPOINT_EVERY:
+                checkpoint_progress()
+    except BaseException:
+        # 中断時も取得済みの分を保存して、次回は続きから
+        checkpoint_progress()
+        raise
+
+    post_store.save_posts(account_key, stored)
+    post_store.clear_checkpoint(account_key)
+    print(f"収集完了: @{username} の{count}件の投稿を取得しました。")
+
+    if incremental:
+        return post_store.load_posts(account_key, max_posts)
+    return pd.DataFrame(rows)
+
+
+def collect_competitor_posts(
+    username: str,
+    max_posts: int = MAX_POSTS_PER_ACCOUNT,
+    login_required: bool = True,
+    incremental: bool = True
+) -> pd.DataFrame:
+    """
+    競合アカウントの投稿を収集してDataFrameに変換
+
+    Args:
+        username: Instagramアカウント名（@なし）
+        max_posts: 取得する最大投稿数
+        login_required: ログインが必要かどうか（いいね数取得には必要）
+        incremental: 保存済みの投稿は取り直さず、新しい投稿と
+            HOT_WINDOW_DAYS日以内の投稿だけを取得する（中断した収集は続きから再開する）
+
+    Returns:
+        投稿データのDataFrame（保存済みの投稿を含む新しい順）
+    """
+    try:
+        return _crawl_account(get_loader(login_required), username, max_posts, incremental)
     except instaloader.exceptions.ProfileNotExistsException:
         print(f"エラー: アカウント @{username} が見つかりませんでした。")
         return pd.DataFrame()
@@ -142,13 +334,65 @@ def collect_competitor_posts(
         return pd.DataFrame()
 
 
+def crawl_competitors(
+    usernames: List[str],
+    max_posts: int = MAX_POSTS_PER_ACCOUNT,
+    job: str = 'competitors',
+    resume: bool = True,
+    max_workers: int = CRAWL_MAX_WORKERS
+) -> pd.DataFrame:
+    """
+    複数の競合アカウントをキューとして巡回
+
+    前回の巡回が途中で止まっていれば、完了していないアカウントだけを
+    （途中まで収集したアカウントはその続きから）巡回する。
+
+    Args:
+        usernames: Instagramアカウント名（@なし）のリスト
+        max_posts: アカウントあたりの最大投稿数
+        job: 巡回の名前（進み具合の記録に使う）
+        resume: 中断した巡回の続きから再開するか
+        max_workers: 同時に巡回するアカウント数（リクエスト予算は全体で共通）
+
+    Returns:
+        巡回したアカウントの投稿データを結合したDataFrame
+    """
+    pending = post_store.start_crawl_queue(job, usernames, resume=resume)
+    skipped = len(usernames) - len(pending)
+    print(f"{len(pending)}アカウントを巡回します" + (f"（完了済みの{skipped}アカウントは省略）" if skipped else ''))
+
+    def crawl(username: str) -> pd.DataFrame:
+        try:
+            df = _crawl_account(get_loader(), username, max_posts, incremental=True)
+        except (
+            instaloader.exceptions.ProfileNotExistsException,
+            instaloader.exceptions.PrivateProfileNotFollowedException
+        ) as e:
+            print(f"エラー: @{username} は取得できません: {e}")
+            post_store.mark_crawl_status(job, username, post_store.CRAWL_STATUS_SKIPPED)
+            return pd.DataFrame()
+        except Exception as e:
+            print(f"エラー: @{username} の収集に失敗しました（次回の再開時に再試行します）: {e}")
+            post_store.mark_crawl_status(job, username, post_store.CRAWL_STATUS_ERROR)
+            return pd.DataFrame()
+        post_store.mark_crawl_status(job, username, post_store.CRAWL_STATUS_DONE)
+        return df
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        dfs = [df for df in executor.map(crawl, pending) if not df.empty]
+
+    if not dfs:
+        return pd.DataFrame()
+    return pd.concat(dfs, ignore_index=True)
+
+
 def collect_from_url(post_url: str) -> Optional[Dict]:
     """
     投稿URLから1件の投稿データを取得
-    
+
     Args:
         post_url: Instagram投稿のURL
-        
+
     Returns:
         投稿データの辞書、またはNone
     """
@@ -157,53 +401,12 @@ def collect_from_url(post_url: str) -> Optional[Dict]:
     if not shortcode_match:
         print("無効なURLです。")
         return None
-    
+
     shortcode = shortcode_match.group(1)
-    
-    loader = instaloader.Instaloader(
-        download_videos=False,
-        download_video_thumbnails=False,
-        download_geotags=False,
-        download_comments=False,
-        save_metadata=False,
-        compress_json=False
-    )
-    
-    # ログイン（必要に応じて）
-    if INSTAGRAM_USERNAME and INSTAGRAM_PASSWORD:
-        try:
-            loader.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
-        except Exception as e:
-            print(f"ログインエラー: {e}")
-    
+
     try:
-        post = instaloader.Post.from_shortcode(loader.context, shortcode)
-        
-        post_date = post.date_local.strftime('%Y-%m-%d')
-        post_time = post.date_local.strftime('%H:%M')
-        weekday = post.date_local.strftime('%A')
-        
-        caption = post.caption or ''
-        hashtags = extract_hashtags(caption)
-        
-        return {
-            '投稿タイプ': '競合_個別',
-            '投稿日時': f"{post_date} {post_time}",
-            '投稿日': post_date,
-            '投稿時間帯': post_time,
-            '曜日': weekday,
-            'いいね数': post.likes,
-            'コメント数': post.comments,
-            '保存数': '',
-            'リーチ数': '',
-            'インプレッション数': '',
-            'キャプション': caption,
-            'ハッシュタグ': hashtags,
-            'メディアタイプ': '動画' if post.is_video else '写真',
-            '投稿URL': post_url,
-            'メディアID': post.shortcode,
-            '再生数': ''
-        }
+        post = instaloader.Post.from_shortcode(get_loader().context, shortcode)
+        return build_post_row(post, '競合_個別', post_url)
     except Exception as e:
         print(f"投稿取得エラー: {e}")
         return None
@@ -211,13 +414,8 @@ def collect_from_url(post_url: str) -> Optional[Dict]:
 
 if __name__ == '__main__':
     # テスト実行
-    # df = collect_competitor_posts('example_account', max_posts=10)
+    # df = crawl_competitors(['example_account', 'example_account2'], max_posts=10)
     # if not df.empty:
     #     print(df.head())
     #     df.to_csv('output/competitor_posts.csv', index=False, encoding='utf-8-sig')
     pass
-
-
-
-
-
@@ -1,185 +1,433 @@
 """
 自身のInstagram投稿をGraph APIで収集するモジュール
+
+- 投稿一覧の取得時にフィールド展開（insights.metric(...)）でインサイトもまとめて取得する
+- 展開できなかったページの投稿は、最大50件ずつのID指定（?ids=）でインサイトを取得する
+- 固定のsleepではなく、レスポンスのレート制限ヘッダー（使用率）を見て間隔を調整する
+- 収集結果はpost_storeに保存し、次回は前回より新しい投稿と指標更新の対象期間の投稿だけを取得する
 """
+import json
+import re
+import threading
+import time
 import requests
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Optional
-import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import post_store
 from config import (
     INSTAGRAM_ACCESS_TOKEN,
     INSTAGRAM_BUSINESS_ACCOUNT_ID,
-    GRAPH_API_BASE_URL
+    GRAPH_API_BASE_URL,
+    GRAPH_API_BATCH_SIZE,
+    GRAPH_API_MAX_WORKERS
 )
 
+MEDIA_FIELDS = 'id,caption,media_type,media_url,permalink,timestamp,like_count,comments_count'
+INSIGHT_METRICS = 'saved,reach,impressions'
+INSIGHTS_FIELD = f'insights.metric({INSIGHT_METRICS})'
+PAGE_SIZE = 50
+
+# post_storeでのアカウントのキー（投稿タイプ列の値）
+OWN_ACCOUNT_KEY = '自分'
+
+# レート制限を示すGraph APIのエラーコード
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613}
+RATE_LIMIT_BACKOFF_SECONDS = 60
+MAX_RETRIES = 3
+
+
+class RateLimitError(requests.exceptions.RequestException):
+    """リトライしてもレート制限が解除されなかった（HTTPErrorとは区別する）"""
+
+
+class RatePacer:
+    """
+    レート制限ヘッダーの使用率からリクエスト間隔を決める（スレッド間で共有）
+
+    使用率が50%未満なら待たず、それ以上は使用率に応じて間隔を広げる。
+    レート制限エラーを受けたら一定時間すべてのリクエストを止める。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+        self.usage = 0.0
+
+    def wait(self):
+        """次のリクエストを送ってよい時刻まで待つ"""
+        with self._lock:
+            delay = self._next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, response: requests.Response):
+        """レスポンスヘッダーの使用率を反映"""
+        usage = _usage_percent(response.headers)
+        if usage is None:
+            return
+        if usage < 50:
+            delay = 0.0
+        else:
+            # 50% -> 0秒、75% -> 約2秒、100% -> 30秒
+            delay = 30 * ((usage - 50) / 50) ** 2
+        with self._lock:
+            self.usage = usage
+            self._next_at = max(self._next_at, time.monotonic() + delay)
+
+    def backoff(self, seconds: float):
+        """一定時間リクエストを止める"""
+        with self._lock:
+            self._next_at = max(self._next_at, time.monotonic() + seconds)
+
+
+def _usage_percent(headers) -> Optional[float]:
+    """
+    x-app-usage / x-business-use-case-usage から最も高い使用率（%）を取り出す
+
+    Returns:
+        使用率（ヘッダーがなければNone）
+    """
+    values = []
+    for name in ('x-app-usage', 'x-business-use-case-usage'):
+        raw = headers.get(name)
+        if not raw:
+            continue
+        try:
+            usage = json.loads(raw)
+        except ValueError:
+            continue
+        # x-business-use-case-usage は {ID: [{...}]} の形
+        entries = [usage] if name == 'x-app-usage' else [
+            entry for items in usage.values() for entry in items
+        ]
+        for entry in entries:
+            for key in ('call_count', 'total_time', 'total_cputime'):
+                if isinstance(entry.get(key), (int, float)):
+                    values.append(float(entry[key]))
+    return max(values) if values else None
+
+
+def _is_rate_limited(response: requests.Response) -> bool:
+    if response.status_code == 429:
+        return True
+    try:
+        error = response.json().get('error', {})
+    except ValueError:
+        return False
+    return error.get('code') in RATE_LIMIT_ERROR_CODES
+
+
+def _get(session: requests.Session, pacer: RatePacer, url: str, params: Optional[Dict] = None) -> requests.Response:
+    """
+    レート制限を考慮してGETする（レート制限エラーは待ってからやり直す）
+
+    Raises:
+        RateLimitError: MAX_RETRIES回やり直してもレート制限エラーだった場合
+        requests.exceptions.RequestException: リクエストに失敗した場合
+    """
+    for attempt in range(MAX_RETRIES):
+        pacer.wait()
+        response = session.get(url, params=params, timeout=30)
+        pacer.update(response)
+        if _is_rate_limited(response):
+            pacer.backoff(RATE_LIMIT_BACKOFF_SECONDS)
+            if attempt == MAX_RETRIES - 1:
+                raise RateLimitError(f"レート制限が解除されませんでした: {url.split('?')[0]}", response=response)
+            print(f"レート制限のため{RATE_LIMIT_BACKOFF_SECONDS}秒待機します")
+            continue
+        response.raise_for_status()
+        return response
+    return response
+
+
+def _with_fields(url: str, fields: str) -> str:
+    """URLのクエリのfieldsを置き換える（paging.nextのURLのインサイト展開を外す・戻すため）"""
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != 'fields']
+    query.append(('fields', fields))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
 
-def get_media_list(limit: int = 25) -> List[Dict]:
+def _parse_timestamp(timestamp: str) -> datetime:
+    """Graph APIの日時（例: 2024-01-01T12:00:00+0000）をパース"""
+    return datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S%z')
+
+
+def _parse_insights(data: Dict) -> Dict:
+    """インサイトのレスポンス（{'data': [...]}）を {指標名: 値} に変換"""
+    insights = {}
+    for metric in data.get('data', []):
+        insights[metric['name']] = metric['values'][0]['value'] if metric.get('values') else 0
+    return insights
+
+
+def get_media_list(
+    limit: int = 25,
+    with_insights: bool = False,
+    since: Optional[datetime] = None,
+    session: Optional[requests.Session] = None,
+    pacer: Optional[RatePacer] = None
+) -> List[Dict]:
     """
     Graph APIを使用して自分の投稿一覧を取得
-    
+
     Args:
         limit: 取得する投稿数の上限
-        
+        with_insights: インサイトもフィールド展開でまとめて取得するか
+            （取得できた投稿には 'insights' キーに {指標名: 値} が入る）
+        since: この日時より古い投稿に達したら取得をやめる（一覧は新しい順）
+
     Returns:
         投稿データのリスト
     """
     if not INSTAGRAM_ACCESS_TOKEN or not INSTAGRAM_BUSINESS_ACCOUNT_ID:
         raise ValueError("Instagram Graph APIの設定が完了していません。.envファイルを確認してください。")
-    
-    url = f"{GRAPH_API_BASE_URL}/{INSTAGRAM_BUSINESS_ACCOUNT_ID}/media"
+
+    session = session or requests.Session()
+    pacer = pacer or RatePacer()
+    fields = f"{MEDIA_FIELDS},{INSIGHTS_FIELD}" if with_insights else MEDIA_FIELDS
     params = {
-        'fields': 'id,caption,media_type,media_url,permalink,timestamp,like_count,comments_count',
+        'fields': fields,
         'access_token': INSTAGRAM_ACCESS_TOKEN,
-        'limit': limit
+        'limit': min(limit, PAGE_SIZE)
     }
-    
+    # 2ページ目以降（paging.next）と同じく、パラメータはURLに含めて扱う
+    url = f"{GRAPH_API_BASE_URL}/{INSTAGRAM_BUSINESS_ACCOUNT_ID}/media?{urlencode(params)}"
+
     all_posts = []
     next_url = url
-    
+
     while next_url and len(all_posts) < limit:
         try:
-            response = requests.get(next_url, params=params if next_url == url else None)
-            response.raise_for_status()
+            try:
+                response = _get(session, pacer, next_url)
+            except requests.exceptions.HTTPError:
+                if not with_insights:
+                    raise
+                # インサイトに対応していない投稿を含むページは、一覧だけ取り直す
+                # （インサイトはget_media_insights_batchで後から取得する）
+                response = _get(session, pacer, _with_fields(next_url, MEDIA_FIELDS))
             data = response.json()
-            
-            if 'data' in data:
-                all_posts.extend(data['data'])
-            
+
+            reached_since = False
+            for post in data.get('data', []):
+                if since is not None and post.get('timestamp') and _parse_timestamp(post['timestamp']) < since:
+                    reached_since = True
+                    break
+                if 'insights' in post:
+                    post['insights'] = _parse_insights(post['insights'])
+                all_posts.append(post)
+
             # 次のページがあるかチェック
-            if 'paging' in data and 'next' in data['paging']:
-                next_url = data['paging']['next']
-                params = None  # 次のURLには既にパラメータが含まれている
-                time.sleep(1)  # API制限対策
+            if reached_since:
+                next_url = None
+            elif 'paging' in data and 'next' in data['paging']:
+                # 一覧だけ取り直したページの続きでも、インサイトの展開を試す
+                next_url = _with_fields(data['paging']['next'], fields)
             else:
                 next_url = None
-                
+
         except requests.exceptions.RequestException as e:
             print(f"APIリクエストエラー: {e}")
             break
-    
+
     return all_posts[:limit]
 
 
-def get_media_insights(media_id: str) -> Dict:
+def get_media_insights(
+    media_id: str,
+    session: Optional[requests.Session] = None,
+    pacer: Optional[RatePacer] = None
+) -> Dict:
     """
     投稿のインサイトデータ（保存数など）を取得
-    
+
     Args:
         media_id: メディアID
-        
+
     Returns:
         インサイトデータ
     """
     url = f"{GRAPH_API_BASE_URL}/{media_id}/insights"
     params = {
-        'metric': 'saved,reach,impressions',
+        'metric': INSIGHT_METRICS,
         'access_token': INSTAGRAM_ACCESS_TOKEN
     }
-    
+
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        insights = {}
-        if 'data' in data:
-            for metric in data['data']:
-                insights[metric['name']] = metric['values'][0]['value'] if metric['values'] else 0
-        
-        return insights
+        response = _get(session or requests.Session(), pacer or RatePacer(), url, params)
+        return _parse_insights(response.json())
     except requests.exceptions.RequestException as e:
         print(f"インサイト取得エラー (media_id: {media_id}): {e}")
         return {}
 
 
+def get_media_insights_batch(
+    media_ids: List[str],
+    session: Optional[requests.Session] = None,
+    pacer: Optional[RatePacer] = None,
+    max_workers: int = GRAPH_API_MAX_WORKERS
+) -> Dict[str, Dict]:
+    """
+    複数の投稿のインサイトを最大GRAPH_API_BATCH_SIZE件ずつまとめて取得
+
+    1回のリクエストでID指定（?ids=）した投稿のインサイトを取得し、
+    失敗したまとまり（インサイト非対応の投稿を含むなど）だけ1件ずつ取得する。
+
+    Args:
+        media_ids: メディアIDのリスト
+        max_workers: 同時に送るリクエスト数
+
+    Returns:
+        {メディアID: インサイトデータ}
+    """
+    session = session or requests.Session()
+    pacer = pacer or RatePacer()
+    chunks = [
+        media_ids[i:i + GRAPH_API_BATCH_SIZE]
+        for i in range(0, len(media_ids), GRAPH_API_BATCH_SIZE)
+    ]
+
+    def fetch_chunk(chunk: List[str]) -> Dict[str, Dict]:
+        params = {
+            'ids': ','.join(chunk),
+            'fields': INSIGHTS_FIELD,
+            'access_token': INSTAGRAM_ACCESS_TOKEN
+        }
+        try:
+            data = _get(session, pacer, f"{GRAPH_API_BASE_URL}/", params).json()
+            return {
+                media_id: _parse_insights(data.get(media_id, {}).get('insights', {}))
+                for media_id in chunk
+            }
+        except requests.exceptions.RequestException:
+            return {
+                media_id: get_media_insights(media_id, session, pacer)
+                for media_id in chunk
+            }
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for chunk_result in executor.map(fetch_chunk, chunks):
+            results.update(chunk_result)
+    return results
+
+
 def extract_hashtags(caption: str) -> str:
     """
     キャプションからハッシュタグを抽出
-    
+
     Args:
         caption: キャプション文字列
-        
+
     Returns:
         ハッシュタグの文字列（カンマ区切り）
     """
     if not caption:
         return ''
-    
-    import re
+
     hashtags = re.findall(r'#\w+', caption)
     return ' '.join(hashtags)
 
 
-def collect_own_posts(limit: int = 100) -> pd.DataFrame:
+def build_post_row(post: Dict, insights: Dict) -> Dict:
+    """
+    APIの投稿データとインサイトから1行分のデータを作成
+
+    Args:
+        post: 投稿データ
+        insights: インサイトデータ
+
+    Returns:
+        DataFrameの1行分の辞書
+    """
+    # 投稿日時をパース
+    timestamp = post.get('timestamp', '')
+    if timestamp:
+        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        post_time = dt.strftime('%H:%M')
+        post_date = dt.strftime('%Y-%m-%d')
+        weekday = dt.strftime('%A')
+    else:
+        post_time = ''
+        post_date = ''
+        weekday = ''
+
+    caption = post.get('caption', '')
+    hashtags = extract_hashtags(caption)
+
+    return {
+        '投稿タイプ': OWN_ACCOUNT_KEY,
+        '投稿日時': f"{post_date} {post_time}" if post_date and post_time else timestamp,
+        '投稿日': post_date,
+        '投稿時間帯': post_time,
+        '曜日': weekday,
+        'いいね数': post.get('like_count', {}).get('count', 0) if isinstance(post.get('like_count'), dict) else post.get('like_count', 0),
+        'コメント数': post.get('comments_count', {}).get('count', 0) if isinstance(post.get('comments_count'), dict) else post.get('comments_count', 0),
+        '保存数': insights.get('saved', 0),
+        'リーチ数': insights.get('reach', 0),
+        'インプレッション数': insights.get('impressions', 0),
+        'キャプション': caption,
+        'ハッシュタグ': hashtags,
+        'メディアタイプ': post.get('media_type', ''),
+        '投稿URL': post.get('permalink', ''),
+        'メディアID': post.get('id', ''),
+        '再生数': ''  # Graph APIでは取得不可
+    }
+
+
+def collect_own_posts(limit: int = 100, incremental: bool = True) -> pd.DataFrame:
     """
     自分の投稿を収集してDataFrameに変換
-    
+
     Args:
         limit: 取得する投稿数の上限
-        
+        incremental: 保存済みの投稿は取り直さず、新しい投稿と
+            HOT_WINDOW_DAYS日以内の投稿だけを取得する
+
     Returns:
-        投稿データのDataFrame
+        投稿データのDataFrame（保存済みの投稿を含む新しい順）
     """
-    print(f"自分の投稿を収集中... (最大{limit}件)")
-    
-    posts = get_media_list(limit)
-    
+    since = post_store.fetch_since(OWN_ACCOUNT_KEY) if incremental else None
+    if since:
+        print(f"自分の投稿を収集中... ({since.strftime('%Y-%m-%d %H:%M')} UTC以降、最大{limit}件)")
+    else:
+        print(f"自分の投稿を収集中... (最大{limit}件)")
+
+    session = requests.Session()
+    pacer = RatePacer()
+    posts = get_media_list(limit, with_insights=True, since=since, session=session, pacer=pacer)
+
     if not posts:
+        if incremental:
+            print("新しい投稿はありませんでした。")
+            return post_store.load_posts(OWN_ACCOUNT_KEY, limit)
         print("投稿が見つかりませんでした。")
         return pd.DataFrame()
-    
-    data = []
-    
-    for i, post in enumerate(posts, 1):
-        print(f"処理中: {i}/{len(posts)}")
-        
-        # インサイトデータを取得（保存数など）
-        insights = get_media_insights(post.get('id', ''))
-        
-        # 投稿日時をパース
-        timestamp = post.get('timestamp', '')
-        if timestamp:
-            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-            post_time = dt.strftime('%H:%M')
-            post_date = dt.strftime('%Y-%m-%d')
-            weekday = dt.strftime('%A')
-        else:
-            post_time = ''
-            post_date = ''
-            weekday = ''
-        
-        caption = post.get('caption', '')
-        hashtags = extract_hashtags(caption)
-        
-        row = {
-            '投稿タイプ': '自分',
-            '投稿日時': f"{post_date} {post_time}" if post_date and post_time else timestamp,
-            '投稿日': post_date,
-            '投稿時間帯': post_time,
-            '曜日': weekday,
-            'いいね数': post.get('like_count', {}).get('count', 0) if isinstance(post.get('like_count'), dict) else post.get('like_count', 0),
-            'コメント数': post.get('comments_count', {}).get('count', 0) if isinstance(post.get('comments_count'), dict) else post.get('comments_count', 0),
-            '保存数': insights.get('saved', 0),
-            'リーチ数': insights.get('reach', 0),
-            'インプレッション数': insights.get('impressions', 0),
-            'キャプション': caption,
-            'ハッシュタグ': hashtags,
-            'メディアタイプ': post.get('media_type', ''),
-            '投稿URL': post.get('permalink', ''),
-            'メディアID': post.get('id', ''),
-            '再生数': ''  # Graph APIでは取得不可
-        }
-        
-        data.append(row)
-        
-        # API制限対策
-        if i < len(posts):
-            time.sleep(1)
-    
-    df = pd.DataFrame(data)
-    print(f"収集完了: {len(df)}件の投稿を取得しました。")
-    
-    return df
+
+    # フィールド展開で取得できなかった投稿のインサイトをまとめて取得
+    missing = [post['id'] for post in posts if 'insights' not in post and post.get('id')]
+    batch_insights = {}
+    if missing:
+        print(f"インサイトを追加取得中: {len(missing)}件")
+        batch_insights = get_media_insights_batch(missing, session=session, pacer=pacer)
+
+    data = [
+        build_post_row(post, post.get('insights') or batch_insights.get(post.get('id', ''), {}))
+        for post in posts
+    ]
+    print(f"収集完了: {len(data)}件の投稿を取得しました。")
+
+    post_store.save_posts(OWN_ACCOUNT_KEY, [
+        (row, _parse_timestamp(post['timestamp']))
+        for row, post in zip(data, posts) if post.get('timestamp')
+    ])
+    if incremental:
+        return post_store.load_posts(OWN_ACCOUNT_KEY, limit)
+    return pd.DataFrame(data)
 
 
 if __name__ == '__main__':
@@ -188,8 +436,3 @@ if __name__ == '__main__':
     if not df.empty:
         print(df.head())
         df.to_csv('output/own_posts.csv', index=False, encoding='utf-8-sig')
-
-
-
-
-
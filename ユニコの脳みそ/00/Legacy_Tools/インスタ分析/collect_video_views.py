@@ -1,149 +1,415 @@
 """
-Seleniumを使用して動画投稿の再生数をスクリーンショットで取得するモジュール
+Seleniumを使用して動画投稿の再生数を取得するモジュール
+
+- ログイン済みのヘッドレスブラウザを数個用意して使い回し（ログインは1回、Cookieを保存して共有）
+- 再生数は固定の待ち時間ではなく、要素が表示されるのを待ってページ（DOM）から読み取る
+- 読み取れなかった投稿だけスクリーンショットとOCRで取得を試みる
+  （再生数の表示領域を切り出して縮小・二値化し、画像の内容ごとに結果をキャッシュ、
+  OCRはプロセスプールで並列に実行）
+- 複数の投稿は、ブラウザの数だけ同時に、全体のリクエスト予算の範囲で処理する
 """
 import pandas as pd
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
-import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+import hashlib
+import json
 import os
+import queue
+import threading
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 from config import (
     INSTAGRAM_USERNAME,
     INSTAGRAM_PASSWORD,
-    SCREENSHOTS_DIR
+    SCREENSHOTS_DIR,
+    BROWSER_COOKIES_FILE,
+    BROWSER_POOL_SIZE,
+    BROWSER_WAIT_TIMEOUT,
+    BROWSER_REQUESTS_PER_HOUR,
+    BROWSER_MIN_INTERVAL,
+    OCR_CROP_BOX,
+    OCR_MAX_WIDTH,
+    OCR_BINARIZE_THRESHOLD,
+    OCR_CACHE_FILE,
+    OCR_MAX_WORKERS
 )
+from collect_competitor_posts import PolitenessBudget
 import pytesseract
-from PIL import Image
+from PIL import Image, ImageOps, ImageStat
 import re
 
+INSTAGRAM_URL = 'https://www.instagram.com/'
+
+# 再生数の表示（例: "1,234 views", "1.2K plays", "再生回数 1.2万回"）
+VIEW_TEXT_XPATH = (
+    "//section//span[contains(., 'views') or contains(., 'plays') or contains(., '再生')]"
+    " | //main//span[contains(., 'views') or contains(., 'plays') or contains(., '再生')]"
+)
+# ページに埋め込まれたJSONの再生数
+VIEW_COUNT_JSON_PATTERN = re.compile(r'"(?:play_count|video_play_count|video_view_count|view_count)"\s*:\s*(\d+)')
+VIEW_TEXT_PATTERNS = [
+    re.compile(r'([\d,.]+)\s*([KkMm万億]?)\s*(?:views?|plays?)', re.IGNORECASE),
+    re.compile(r'再生(?:回数|数)?[：:\s]*([\d,.]+)\s*([KkMm万億]?)'),
+    re.compile(r'([\d,.]+)\s*([KkMm万億]?)\s*回再生'),
+]
+UNIT_MULTIPLIERS = {'': 1, 'K': 1_000, 'M': 1_000_000, '万': 10_000, '億': 100_000_000}
+
+# プロセス内で共通の予算（ページの読み込み回数）
+browser_budget = PolitenessBudget(
+    max_requests=BROWSER_REQUESTS_PER_HOUR,
+    min_interval=BROWSER_MIN_INTERVAL
+)
+
+_login_lock = threading.Lock()
+
+
+def parse_view_count(text: str) -> Optional[int]:
+    """
+    再生数の表示から数値を取り出す（数値の直後の単位だけを掛ける）
+
+    Args:
+        text: 再生数を含む文字列（例: "1.2K views", "再生回数 3.4万回"）
+
+    Returns:
+        再生数、またはNone
+    """
+    for pattern in VIEW_TEXT_PATTERNS:
+        match = pattern.search(text or '')
+        if not match:
+            continue
+        number, unit = match.group(1).replace(',', ''), match.group(2).upper()
+        try:
+            return int(float(number) * UNIT_MULTIPLIERS[unit])
+        except ValueError:
+            continue
+    return None
+
 
-def setup_driver(headless: bool = False) -> webdriver.Chrome:
+def setup_driver(headless: bool = True) -> webdriver.Chrome:
     """
     Selenium WebDriverをセットアップ
-    
+
     Args:
         headless: ヘッドレスモードで実行するか
-        
+
     Returns:
         WebDriverインスタンス
     """
     chrome_options = Options()
     if headless:
-        chrome_options.add_argument('--headless')
+        chrome_options.add_argument('--headless=new')
     chrome_options.add_argument('--no-sandbox')
     chrome_options.add_argument('--disable-dev-shm-usage')
     chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_argument('--window-size=1280,1600')
     chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
-    
+    # 画像は読み込まない（再生数の取得には不要）
+    chrome_options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+
     service = Service(ChromeDriverManager().install())
     driver = webdriver.Chrome(service=service, options=chrome_options)
-    driver.maximize_window()
-    
+    if not headless:
+        driver.maximize_window()
+
     return driver
 
 
-def login_instagram(driver: webdriver.Chrome) -> bool:
+def _load_cookies(driver: webdriver.Chrome) -> bool:
+    """保存済みのCookieでログイン状態にする"""
+    if not os.path.exists(BROWSER_COOKIES_FILE):
+        return False
+    with open(BROWSER_COOKIES_FILE, 'r', encoding='utf-8') as f:
+        cookies = json.load(f)
+
+    # Cookieは同じドメインを開いてからでないと設定できない
+    driver.get(INSTAGRAM_URL)
+    for cookie in cookies:
+        cookie.pop('sameSite', None)
+        try:
+            driver.add_cookie(cookie)
+        except WebDriverException:
+            pass
+    return driver.get_cookie('sessionid') is not None
+
+
+def _save_cookies(driver: webdriver.Chrome):
+    with open(BROWSER_COOKIES_FILE, 'w', encoding='utf-8') as f:
+        json.dump(driver.get_cookies(), f)
+
+
+def login_instagram(driver: webdriver.Chrome, use_saved_cookies: bool = True) -> bool:
     """
     Instagramにログイン
-    
+
+    保存済みのCookieがあればそれを使い、なければフォームからログインしてCookieを保存する。
+
     Args:
         driver: WebDriverインスタンス
-        
+        use_saved_cookies: 保存済みのCookieを使うか
+
     Returns:
         ログイン成功したかどうか
     """
-    if not INSTAGRAM_USERNAME or not INSTAGRAM_PASSWORD:
-        print("ログイン情報が設定されていません。")
-        return False
-    
-    try:
-        driver.get('https://www.instagram.com/accounts/login/')
-        time.sleep(3)
-        
-        # ユーザー名を入力
-        username_input = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.NAME, 'username'))
-        )
-        username_input.send_keys(INSTAGRAM_USERNAME)
-        
-        # パスワードを入力
-        password_input = driver.find_element(By.NAME, 'password')
-        password_input.send_keys(INSTAGRAM_PASSWORD)
-        
-        # ログインボタンをクリック
-        login_button = driver.find_element(By.XPATH, "//button[@type='submit']")
-        login_button.click()
-        
-        # ログイン完了を待つ
-        time.sleep(5)
-        
-        # ホーム画面に遷移したか確認
-        if 'instagram.com' in driver.current_url and 'login' not in driver.current_url:
+    with _login_lock:
+        try:
+            if use_saved_cookies and _load_cookies(driver):
+                return True
+        except (OSError, ValueError, WebDriverException) as e:
+            print(f"保存済みCookieの読み込みエラー: {e}")
+
+        if not INSTAGRAM_USERNAME or not INSTAGRAM_PASSWORD:
+            print("ログイン情報が設定されていません。")
+            return False
+
+        try:
+            driver.get('https://www.instagram.com/accounts/login/')
+
+            # ユーザー名を入力
+            username_input = WebDriverWait(driver, BROWSER_WAIT_TIMEOUT).until(
+                EC.presence_of_element_located((By.NAME, 'username'))
+            )
+            username_input.send_keys(INSTAGRAM_USERNAME)
+
+            # パスワードを入力
+            password_input = driver.find_element(By.NAME, 'password')
+            password_input.send_keys(INSTAGRAM_PASSWORD)
+
+            # ログインボタンをクリック
+            login_button = driver.find_element(By.XPATH, "//button[@type='submit']")
+            login_button.click()
+
+            # ログイン完了（セッションCookieの発行）を待つ
+            WebDriverWait(driver, BROWSER_WAIT_TIMEOUT * 2).until(
+                lambda d: d.get_cookie('sessionid') is not None
+            )
+            _save_cookies(driver)
             print("ログイン成功")
             return True
-        else:
+
+        except TimeoutException:
             print("ログイン失敗")
             return False
-            
-    except Exception as e:
-        print(f"ログインエラー: {e}")
+        except Exception as e:
+            print(f"ログインエラー: {e}")
+            return False
+
+
+class BrowserPool:
+    """
+    ログイン済みのブラウザを使い回すプール
+
+    ブラウザは必要になったときに作成・ログインし、close()まで使い回す。
+    借りている間にWebDriverのエラーが起きたブラウザは戻さずに終了し、次に必要になったときに作り直す。
+    from_driverで渡された呼び出し元のブラウザは終了も作り直しもしない。
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, headless: bool = True):
+        self.size = max(1, size)
+        self.headless = headless
+        self._idle = queue.Queue()
+        self._drivers: List[webdriver.Chrome] = []
+        self._lock = threading.Lock()
+        # 呼び出し元から借りたブラウザ（close()やエラー時にも終了しない）
+        self._borrowed: List[webdriver.Chrome] = []
+        # ログインに失敗したら以降はブラウザを作らない（ログインの試行を繰り返さない）
+        self._login_failed = False
+
+    @classmethod
+    def from_driver(cls, driver: webdriver.Chrome) -> 'BrowserPool':
+        """既存のログイン済みWebDriver1つでプールを作成（このWebDriverは終了しない）"""
+        pool = cls(size=1)
+        pool._borrowed.append(driver)
+        pool._drivers.append(driver)
+        pool._idle.put(driver)
+        return pool
+
+    def _create(self) -> Optional[webdriver.Chrome]:
+        if self._login_failed:
+            return None
+        driver = setup_driver(headless=self.headless)
+        if not login_instagram(driver):
+            self._login_failed = True
+            driver.quit()
+            return None
+        return driver
+
+    @contextmanager
+    def acquire(self) -> Iterator[webdriver.Chrome]:
+        """空いているブラウザを借りる（上限まではその場で作成する）"""
+        driver = None
+        while driver is None:
+            try:
+                driver = self._idle.get_nowait()
+                break
+            except queue.Empty:
+                pass
+            with self._lock:
+                can_create = len(self._drivers) < self.size
+                if can_create:
+                    # 作成中も上限を超えないよう先に枠を確保
+                    self._drivers.append(None)
+            if can_create:
+                try:
+                    driver = self._create()
+                finally:
+                    with self._lock:
+                        self._drivers.remove(None)
+                        if driver is not None:
+                            self._drivers.append(driver)
+                if driver is None:
+                    raise RuntimeError('Instagramにログインできませんでした。')
+            else:
+                try:
+                    driver = self._idle.get(timeout=1)
+                except queue.Empty:
+                    # 使用中のブラウザが捨てられて枠が空いていれば作り直す
+                    continue
+        broken = False
+        try:
+            yield driver
+        except TimeoutException:
+            # 要素の待ち時間切れはブラウザの故障ではない
+            raise
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            if broken and not self._is_borrowed(driver):
+                self._discard(driver)
+            else:
+                self._idle.put(driver)
+
+    def _is_borrowed(self, driver: webdriver.Chrome) -> bool:
+        return any(driver is borrowed for borrowed in self._borrowed)
+
+    def _discard(self, driver: webdriver.Chrome):
+        """落ちた・応答しなくなったブラウザをプールから外して終了"""
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    def close(self):
+        """プールが作成したブラウザをすべて終了（呼び出し元から借りたものは残す）"""
+        with self._lock:
+            drivers, self._drivers = [d for d in self._drivers if d is not None], []
+        for driver in drivers:
+            if self._is_borrowed(driver):
+                continue
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+
+
+def _open_video_post(post_url: str, driver: webdriver.Chrome) -> bool:
+    """
+    投稿ページを開き、動画要素が表示されるまで待つ
+
+    Returns:
+        動画投稿が表示されたか
+    """
+    browser_budget.acquire()
+    driver.get(post_url)
+    try:
+        WebDriverWait(driver, BROWSER_WAIT_TIMEOUT).until(
+            EC.presence_of_element_located((By.TAG_NAME, 'video'))
+        )
+        return True
+    except TimeoutException:
         return False
 
 
+def read_views_from_page(driver: webdriver.Chrome) -> Optional[int]:
+    """
+    開いている投稿ページのDOMから再生数を読み取る
+
+    再生数の表示を待って読み取り、見つからなければページに埋め込まれたJSONから探す。
+
+    Args:
+        driver: 投稿ページを開いているWebDriver
+
+    Returns:
+        再生数、またはNone
+    """
+    try:
+        elements = WebDriverWait(driver, BROWSER_WAIT_TIMEOUT).until(
+            lambda d: d.find_elements(By.XPATH, VIEW_TEXT_XPATH)
+        )
+        for element in elements:
+            views = parse_view_count(element.text)
+            if views is not None:
+                return views
+    except TimeoutException:
+        pass
+
+    match = VIEW_COUNT_JSON_PATTERN.search(driver.page_source)
+    return int(match.group(1)) if match else None
+
+
+def get_video_views(post_url: str, driver: webdriver.Chrome) -> Optional[int]:
+    """
+    投稿URLの再生数をページから取得
+
+    Args:
+        post_url: Instagram投稿のURL
+        driver: ログイン済みのWebDriver
+
+    Returns:
+        再生数、またはNone（動画でない・読み取れない場合）
+    """
+    if not _open_video_post(post_url, driver):
+        print(f"動画が見つかりませんでした: {post_url}")
+        return None
+    return read_views_from_page(driver)
+
+
 def get_video_views_screenshot(post_url: str, driver: Optional[webdriver.Chrome] = None) -> Optional[str]:
     """
     投稿URLから再生数を表示している画面をスクリーンショットで保存
-    
+
     Args:
         post_url: Instagram投稿のURL
-        driver: WebDriverインスタンス（Noneの場合は新規作成）
-        
+        driver: ログイン済みのWebDriver（Noneの場合は新規作成してログイン）
+
     Returns:
         スクリーンショットのファイルパス、またはNone
     """
     should_close_driver = driver is None
-    
+
     try:
         if driver is None:
-            driver = setup_driver(headless=False)  # スクショのためヘッドレスはFalse
-        
-        # ログイン
-        if not login_instagram(driver):
-            return None
-        
-        # 投稿ページに移動
-        driver.get(post_url)
-        time.sleep(5)  # ページ読み込み待機
-        
-        # 動画かどうか確認（簡易的な方法）
-        try:
-            # 再生ボタンや動画要素を探す
-            video_elements = driver.find_elements(By.TAG_NAME, 'video')
-            if not video_elements:
+            driver = setup_driver()
+            if not login_instagram(driver):
+                return None
+
+        # 開いているページが対象の投稿でなければ開き直す
+        if driver.current_url.rstrip('/') != post_url.rstrip('/'):
+            if not _open_video_post(post_url, driver):
                 print("この投稿は動画ではありません。")
                 return None
-        except:
-            pass
-        
-        # 再生数が表示されるまで少し待つ
-        time.sleep(3)
-        
+
         # スクリーンショットを撮影
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        shortcode = post_url.split('/p/')[-1].rstrip('/')
+        shortcode = post_url.rstrip('/').split('/')[-1]
         screenshot_path = os.path.join(SCREENSHOTS_DIR, f'{shortcode}_{timestamp}.png')
-        
+
         driver.save_screenshot(screenshot_path)
         print(f"スクリーンショット保存: {screenshot_path}")
-        
+
         return screenshot_path
-        
+
     except Exception as e:
         print(f"スクリーンショット取得エラー: {e}")
         return None
@@ -152,120 +418,247 @@ def get_video_views_screenshot(post_url: str, driver: Optional[webdriver.Chrome]
             driver.quit()
 
 
+_ocr_lang: Optional[str] = None
+_ocr_cache_lock = threading.Lock()
+
+
+def _ocr_languages() -> str:
+    """使えるOCR言語（日本語のデータがあれば日本語表示の「再生」も読む）"""
+    global _ocr_lang
+    if _ocr_lang is None:
+        try:
+            installed = set(pytesseract.get_languages(config=''))
+        except Exception:
+            installed = set()
+        _ocr_lang = 'jpn+eng' if 'jpn' in installed else 'eng'
+    return _ocr_lang
+
+
+def preprocess_for_ocr(image: Image.Image, crop_box: Tuple[float, float, float, float] = OCR_CROP_BOX) -> Image.Image:
+    """
+    再生数の表示領域だけを切り出し、縮小・二値化する
+
+    Args:
+        image: スクリーンショット画像
+        crop_box: 切り出す領域（左, 上, 右, 下）を画像サイズに対する割合で指定
+
+    Returns:
+        OCR用の白黒画像
+    """
+    width, height = image.size
+    left, top, right, bottom = crop_box
+    region = image.crop((int(width * left), int(height * top), int(width * right), int(height * bottom)))
+
+    if region.width > OCR_MAX_WIDTH:
+        region = region.resize(
+            (OCR_MAX_WIDTH, max(1, region.height * OCR_MAX_WIDTH // region.width)),
+            Image.LANCZOS
+        )
+
+    gray = ImageOps.grayscale(region)
+    # ダークモード（暗い背景に明るい文字）は白黒を反転して黒文字にそろえる
+    if ImageStat.Stat(gray).mean[0] < 128:
+        gray = ImageOps.invert(gray)
+    return gray.point(lambda value: 255 if value > OCR_BINARIZE_THRESHOLD else 0, mode='1')
+
+
+def _ocr_views(screenshot_path: str, crop_box: Tuple[float, float, float, float]) -> Optional[int]:
+    """1枚の画像をOCRして再生数を返す（プロセスプールのワーカーで実行）"""
+    with Image.open(screenshot_path) as image:
+        prepared = preprocess_for_ocr(image.convert('RGB'), crop_box)
+    # 画面の部品ごとに散らばった文字を読む
+    text = pytesseract.image_to_string(prepared, lang=_ocr_languages(), config='--psm 11')
+    return parse_view_count(text)
+
+
+def _image_hash(screenshot_path: str) -> str:
+    """画像の内容のハッシュ（同じ画像はファイル名が違っても同じ）"""
+    digest = hashlib.sha256()
+    with open(screenshot_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_key(image_hash: str, crop_box: Tuple[float, float, float, float]) -> str:
+    """画像の内容とOCRの設定（切り出し・縮小・二値化・言語）ごとのキャッシュキー"""
+    box = ','.join(str(value) for value in crop_box)
+    return f"{image_hash}:{box}:{OCR_MAX_WIDTH}:{OCR_BINARIZE_THRESHOLD}:{_ocr_languages()}"
+
+
+def _load_ocr_cache() -> Dict[str, Optional[int]]:
+    if not os.path.exists(OCR_CACHE_FILE):
+        return {}
+    try:
+        with open(OCR_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_ocr_cache(updates: Dict[str, Optional[int]]):
+    with _ocr_cache_lock:
+        cache = _load_ocr_cache()
+        cache.update(updates)
+        tmp_path = f"{OCR_CACHE_FILE}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, OCR_CACHE_FILE)
+
+
+def _ocr_views_safe(screenshot_path: str, crop_box: Tuple[float, float, float, float]) -> Tuple[Optional[int], bool]:
+    """
+    例外を送出せずにOCRする（プロセスプールで1枚の失敗が全体を止めないように）
+
+    Returns:
+        (再生数またはNone, OCRを実行できたか)
+    """
+    try:
+        return _ocr_views(screenshot_path, crop_box), True
+    except Exception as e:
+        print(f"OCRエラー ({screenshot_path}): {e}")
+        return None, False
+
+
+def extract_views_from_screenshots(
+    screenshot_paths: List[str],
+    crop_box: Tuple[float, float, float, float] = OCR_CROP_BOX,
+    max_workers: int = OCR_MAX_WORKERS
+) -> Dict[str, Optional[int]]:
+    """
+    複数のスクリーンショットからOCRで再生数を抽出（実験的機能）
+
+    画像の内容のハッシュで結果をキャッシュし、未処理の画像だけを
+    プロセスプールで並列にOCRする。
+
+    Args:
+        screenshot_paths: スクリーンショットのファイルパスのリスト
+        crop_box: 再生数の表示領域（左, 上, 右, 下）を画像サイズに対する割合で指定
+        max_workers: OCRを同時に実行するプロセス数
+
+    Returns:
+        {ファイルパス: 再生数またはNone}
+    """
+    keys = {}
+    for path in screenshot_paths:
+        try:
+            keys[path] = _cache_key(_image_hash(path), crop_box)
+        except OSError as e:
+            print(f"OCRエラー: {e}")
+    cache = _load_ocr_cache()
+    # 同じ内容の画像は1回だけOCRする
+    pending = {}
+    for path, key in keys.items():
+        if key not in cache and key not in pending:
+            pending[key] = path
+
+    results = {}
+    if pending:
+        if len(pending) == 1 or max_workers <= 1:
+            outputs = [_ocr_views_safe(path, crop_box) for path in pending.values()]
+        else:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+                outputs = list(executor.map(_ocr_views_safe, pending.values(), [crop_box] * len(pending)))
+        results = dict(zip(pending.keys(), outputs))
+        # 失敗（例外）したものはキャッシュしない
+        _save_ocr_cache({key: views for key, (views, ok) in results.items() if ok})
+
+    views_by_key = dict(cache)
+    views_by_key.update({key: views for key, (views, _) in results.items()})
+    return {path: views_by_key.get(keys[path]) if path in keys else None for path in screenshot_paths}
+
+
 def extract_views_from_screenshot(screenshot_path: str) -> Optional[int]:
     """
     スクリーンショット画像からOCRで再生数を抽出（実験的機能）
-    
+
     Args:
         screenshot_path: スクリーンショットのファイルパス
-        
+
     Returns:
         再生数、またはNone
     """
-    try:
-        # 画像を読み込み
-        image = Image.open(screenshot_path)
-        
-        # OCRでテキスト抽出
-        text = pytesseract.image_to_string(image, lang='eng')
-        
-        # 再生数らしき数字を探す（例: "1.2K views", "500 views"など）
-        # これは簡易的な実装で、実際の画面レイアウトに依存します
-        view_patterns = [
-            r'(\d+\.?\d*)\s*[KkMm]?\s*views?',
-            r'再生数[：:]\s*(\d+\.?\d*)\s*[KkMm]?',
-        ]
-        
-        for pattern in view_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                views_str = match.group(1)
-                try:
-                    views = float(views_str)
-                    # KやMの単位を考慮（簡易実装）
-                    if 'K' in text.upper() or 'k' in text:
-                        views *= 1000
-                    elif 'M' in text.upper() or 'm' in text:
-                        views *= 1000000
-                    return int(views)
-                except:
-                    pass
-        
-        return None
-        
-    except Exception as e:
-        print(f"OCRエラー: {e}")
-        return None
+    return extract_views_from_screenshots([screenshot_path], max_workers=1)[screenshot_path]
 
 
-def collect_views_for_posts(df: pd.DataFrame, driver: Optional[webdriver.Chrome] = None) -> pd.DataFrame:
+def collect_views_for_posts(
+    df: pd.DataFrame,
+    driver: Optional[webdriver.Chrome] = None,
+    pool_size: int = BROWSER_POOL_SIZE
+) -> pd.DataFrame:
     """
     複数の投稿の再生数を一括で取得
-    
+
     Args:
         df: 投稿データのDataFrame（投稿URL列が必要）
-        driver: WebDriverインスタンス
-        
+        driver: ログイン済みのWebDriver（指定した場合はこの1つだけで順に処理）
+        pool_size: 同時に使うブラウザの数
+
     Returns:
         再生数が追加されたDataFrame
     """
-    import pandas as pd
-    
     if df.empty or '投稿URL' not in df.columns:
         return df
-    
-    should_close_driver = driver is None
-    
+
+    pool = BrowserPool.from_driver(driver) if driver is not None else BrowserPool(size=pool_size)
+    targets = [
+        (position, row.get('投稿URL', ''))
+        for position, (_, row) in enumerate(df.iterrows())
+        if row.get('投稿URL', '') and row.get('メディアタイプ', '') == '動画'
+    ]
+    views_list = [''] * len(df)
+    # ページから読み取れなかった投稿のスクリーンショット（後でまとめてOCRする）
+    screenshots = {}
+    done = [0]
+    done_lock = threading.Lock()
+
+    def fetch(target) -> None:
+        position, post_url = target
+        try:
+            with pool.acquire() as browser:
+                views = get_video_views(post_url, browser)
+                if views is None:
+                    # ページから読み取れなかったときだけOCRを試す
+                    screenshot_path = get_video_views_screenshot(post_url, browser)
+                    if screenshot_path:
+                        screenshots[position] = screenshot_path
+        except Exception as e:
+            print(f"再生数取得エラー ({post_url}): {e}")
+            views = None
+        views_list[position] = views if views is not None else ''
+        with done_lock:
+            done[0] += 1
+            print(f"再生数取得中: {done[0]}/{len(targets)}")
+
     try:
-        if driver is None:
-            driver = setup_driver(headless=False)
-            if not login_instagram(driver):
-                return df
-        
-        views_list = []
-        
-        for idx, row in df.iterrows():
-            post_url = row.get('投稿URL', '')
-            media_type = row.get('メディアタイプ', '')
-            
-            if not post_url or media_type != '動画':
-                views_list.append('')
-                continue
-            
-            print(f"再生数取得中: {idx+1}/{len(df)}")
-            
-            # スクリーンショット取得
-            screenshot_path = get_video_views_screenshot(post_url, driver)
-            
-            if screenshot_path:
-                # OCRで再生数を抽出（試行）
-                views = extract_views_from_screenshot(screenshot_path)
-                views_list.append(views if views else '')
-            else:
-                views_list.append('')
-            
-            # BAN対策の遅延
-            time.sleep(10)
-        
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            list(executor.map(fetch, targets))
+
+        if screenshots:
+            print(f"OCRで再生数を抽出中: {len(screenshots)}件")
+            ocr_views = extract_views_from_screenshots(list(screenshots.values()))
+            for position, screenshot_path in screenshots.items():
+                views = ocr_views.get(screenshot_path)
+                views_list[position] = views if views is not None else ''
+
         # DataFrameに再生数列を追加
         df = df.copy()
         df['再生数'] = views_list
-        
+
         return df
-        
+
     except Exception as e:
         print(f"一括取得エラー: {e}")
         return df
     finally:
-        if should_close_driver and driver:
-            driver.quit()
+        # 渡されたdriverは終了せず、プールが作成したブラウザだけを閉じる
+        pool.close()
 
 
 if __name__ == '__main__':
     # テスト実行
-    # screenshot = get_video_views_screenshot('https://www.instagram.com/p/example/')
-    # if screenshot:
-    #     views = extract_views_from_screenshot(screenshot)
-    #     print(f"再生数: {views}")
+    # pool = BrowserPool(size=1)
+    # with pool.acquire() as driver:
+    #     print(f"再生数: {get_video_views('https://www.instagram.com/reel/example/', driver)}")
+    # pool.close()
     pass
-
@@ -17,16 +17,40 @@ INSTAGRAM_PASSWORD = os.getenv('INSTAGRAM_PASSWORD', '')
 
 # API設定
 GRAPH_API_BASE_URL = 'https://graph.instagram.com'
+GRAPH_API_BATCH_SIZE = 50  # ID指定でまとめてインサイトを取得する件数（APIの上限は50）
+GRAPH_API_MAX_WORKERS = 4  # インサイト取得の同時リクエスト数
 
 # スクレイピング設定
-SCRAPING_DELAY = 60  # 秒（BAN対策）
 MAX_POSTS_PER_ACCOUNT = 100  # アカウントあたりの最大取得投稿数
+CRAWL_REQUESTS_PER_HOUR = 200  # Instagramへのリクエスト数の上限（1時間あたり、全ワーカー合計。BAN対策）
+CRAWL_MIN_INTERVAL = 5  # リクエスト同士の最小間隔（秒、全ワーカー合計）
+CRAWL_MAX_WORKERS = 2  # 同時に巡回する競合アカウント数
+CRAWL_CHECKPOINT_EVERY = 12  # 途中経過を保存する投稿数（中断時はここから再開）
+
+# 再生数取得（Selenium）設定
+BROWSER_POOL_SIZE = 3  # 同時に使うヘッドレスブラウザの数
+BROWSER_WAIT_TIMEOUT = 10  # 要素の表示を待つ最大秒数
+BROWSER_REQUESTS_PER_HOUR = 300  # 投稿ページを開く回数の上限（1時間あたり、全ブラウザ合計。BAN対策）
+BROWSER_MIN_INTERVAL = 2  # 投稿ページを開く最小間隔（秒、全ブラウザ合計）
+
+# 再生数のOCR（ページから読み取れなかった場合の予備）設定
+OCR_CROP_BOX = (0.5, 0.3, 1.0, 1.0)  # 再生数の表示領域（左, 上, 右, 下）を画像サイズに対する割合で指定
+OCR_MAX_WIDTH = 1000  # 切り出した画像をこの幅（px）まで縮小してからOCRする
+OCR_BINARIZE_THRESHOLD = 160  # 二値化のしきい値（0〜255、これより明るい画素を白にする）
+OCR_MAX_WORKERS = os.cpu_count() or 1  # OCRを同時に実行するプロセス数
 
 # 出力ディレクトリ
 OUTPUT_DIR = 'output'
 SCREENSHOTS_DIR = 'screenshots'
 DATA_DIR = 'data'
 
+# 投稿データの保存先（差分収集用）
+POST_STORE_PATH = os.path.join(DATA_DIR, 'posts.db')
+HOT_WINDOW_DAYS = 7  # 投稿からこの日数以内の投稿は、収集のたびにいいね数などを更新する
+INSTALOADER_SESSION_FILE = os.path.join(DATA_DIR, 'instaloader_session')  # ログインセッションの保存先
+BROWSER_COOKIES_FILE = os.path.join(DATA_DIR, 'browser_cookies.json')  # ブラウザのログインCookieの保存先
+OCR_CACHE_FILE = os.path.join(DATA_DIR, 'ocr_cache.json')  # OCR結果のキャッシュ（画像の内容のハッシュごと）
+
 # ディレクトリ作成
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(SCREENSHOTS_DIR, exist_ok=True)
@@ -0,0 +1,316 @@
+"""
+収集した投稿をSQLiteに保存するモジュール
+
+- 投稿はメディアIDをキーに1行ずつ保存し、再実行時は上書き（空の値では上書きしない）
+- アカウントごとに「最後に見た投稿の日時」（カーソル）を記録し、次回はそれより新しい投稿だけを取得する
+- 投稿からHOT_WINDOW_DAYS日以内の投稿は、毎回いいね数などを取り直す
+- 競合アカウントの巡回は、アカウントごとの途中経過（チェックポイント）と
+  巡回キューの進み具合を記録し、中断しても続きから再開できる
+"""
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import pandas as pd
+from config import POST_STORE_PATH, HOT_WINDOW_DAYS
+
+# 巡回キューの状態
+CRAWL_STATUS_PENDING = 'pending'
+CRAWL_STATUS_DONE = 'done'
+CRAWL_STATUS_SKIPPED = 'skipped'  # 存在しない・非公開など、再試行しても取れないアカウント
+CRAWL_STATUS_ERROR = 'error'  # 再開時に再試行する
+CRAWL_FINISHED_STATUSES = (CRAWL_STATUS_DONE, CRAWL_STATUS_SKIPPED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    media_id TEXT PRIMARY KEY,
+    account TEXT NOT NULL,
+    posted_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    fetched_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_posts_account_posted_at ON posts (account, posted_at);
+CREATE TABLE IF NOT EXISTS cursors (
+    account TEXT PRIMARY KEY,
+    last_posted_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+    account TEXT PRIMARY KEY,
+    since TEXT,
+    iterator TEXT,
+    count INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS crawl_queue (
+    job TEXT NOT NULL,
+    account TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (job, account)
+);
+"""
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _to_utc_text(value: datetime) -> str:
+    """日時をUTCのISO形式文字列に変換（文字列の大小で日時順に並ぶ）"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _from_utc_text(value: str) -> datetime:
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+def get_cursor(account: str, db_path: str = POST_STORE_PATH) -> Optional[datetime]:
+    """
+    アカウントの最後に見た投稿の日時を取得
+
+    Args:
+        account: アカウントのキー（投稿タイプ列の値）
+
+    Returns:
+        投稿日時（UTC）、初回はNone
+    """
+    with closing(_connect(db_path)) as conn:
+        row = conn.execute(
+            'SELECT last_posted_at FROM cursors WHERE account = ?', (account,)
+        ).fetchone()
+    return _from_utc_text(row[0]) if row else None
+
+
+def fetch_since(account: str, db_path: str = POST_STORE_PATH) -> Optional[datetime]:
+    """
+    今回の収集でどこまで遡ればよいかを返す
+
+    カーソルより新しい投稿と、HOT_WINDOW_DAYS日以内の投稿（指標の更新対象）を
+    取得できるよう、古いほうの日時を返す。
+
+    Returns:
+        この日時より古い投稿は取得不要（初回はNone = すべて取得）
+    """
+    cursor = get_cursor(account, db_path)
+    if cursor is None:
+        return None
+    hot_since = datetime.now(timezone.utc) - timedelta(days=HOT_WINDOW_DAYS)
+    return min(cursor, hot_since)
+
+
+def save_posts(
+    account: str,
+    posts: Iterable[Tuple[Dict, datetime]],
+    db_path: str = POST_STORE_PATH
+) -> int:
+    """
+    投稿を保存し、カーソルを進める
+
+    Args:
+        account: アカウントのキー
+        posts: (1行分のデータ, 投稿日時) のリスト
+
+    Returns:
+        保存した件数
+    """
+    now = _to_utc_text(datetime.now(timezone.utc))
+    count = 0
+    latest = None
+    with closing(_connect(db_path)) as conn, conn:
+        for row, posted_at in posts:
+            media_id = str(row.get('メディアID', ''))
+            if not media_id:
+                continue
+            posted_text = _to_utc_text(posted_at)
+            existing = conn.execute(
+                'SELECT data FROM posts WHERE media_id = ?', (media_id,)
+            ).fetchone()
+            merged = json.loads(existing[0]) if existing else {}
+            # 後から取得した再生数などを空の値で消さない
+            merged.update({key: value for key, value in row.items() if value not in ('', None)})
+            for key in row:
+                merged.setdefault(key, row[key])
+            conn.execute(
+                'INSERT OR REPLACE INTO posts (media_id, account, posted_at, data, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (media_id, account, posted_text, json.dumps(merged, ensure_ascii=False, default=str), now)
+            )
+            count += 1
+            latest = max(latest, posted_text) if latest else posted_text
+
+        if latest:
+            conn.execute(
+                'INSERT INTO cursors (account, last_posted_at, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(account) DO UPDATE SET '
+                'last_posted_at = MAX(last_posted_at, excluded.last_posted_at), '
+                'updated_at = excluded.updated_at',
+                (account, latest, now)
+            )
+    return count
+
+
+def update_posts(updates: Dict[str, Dict], db_path: str = POST_STORE_PATH) -> int:
+    """
+    保存済みの投稿の一部の列を更新（再生数など）
+
+    Args:
+        updates: {メディアID: {列名: 値}}
+
+    Returns:
+        更新した件数
+    """
+    count = 0
+    with closing(_connect(db_path)) as conn, conn:
+        for media_id, fields in updates.items():
+            existing = conn.execute(
+                'SELECT data FROM posts WHERE media_id = ?', (str(media_id),)
+            ).fetchone()
+            if not existing:
+                continue
+            data = json.loads(existing[0])
+            data.update(fields)
+            conn.execute(
+                'UPDATE posts SET data = ? WHERE media_id = ?',
+                (json.dumps(data, ensure_ascii=False, default=str), str(media_id))
+            )
+            count += 1
+    return count
+
+
+def load_posts(
+    account: Optional[str] = None,
+    limit: Optional[int] = None,
+    db_path: str = POST_STORE_PATH
+) -> pd.DataFrame:
+    """
+    保存済みの投稿を新しい順にDataFrameで取得
+
+    Args:
+        account: アカウントのキー（Noneならすべて）
+        limit: 取得する件数の上限
+
+    Returns:
+        投稿データのDataFrame
+    """
+    query = 'SELECT data FROM posts'
+    params: List = []
+    if account is not None:
+        query += ' WHERE account = ?'
+        params.append(account)
+    query += ' ORDER BY posted_at DESC'
+    if limit:
+        query += ' LIMIT ?'
+        params.append(int(limit))
+
+    with closing(_connect(db_path)) as conn:
+        rows = [json.loads(data) for (data,) in conn.execute(query, params)]
+    return pd.DataFrame(rows)
+
+
+def get_checkpoint(account: str, db_path: str = POST_STORE_PATH) -> Optional[Dict]:
+    """
+    途中で中断したアカウントの巡回状態を取得
+
+    Returns:
+        {'since': 遡る日時またはNone, 'iterator': 投稿一覧の続きの状態（JSON可能な辞書）またはNone,
+         'count': 処理済みの件数}、中断していなければNone
+    """
+    with closing(_connect(db_path)) as conn:
+        row = conn.execute(
+            'SELECT since, iterator, count FROM crawl_checkpoints WHERE account = ?', (account,)
+        ).fetchone()
+    if not row:
+        return None
+    since, iterator, count = row
+    return {
+        'since': _from_utc_text(since) if since else None,
+        'iterator': json.loads(iterator) if iterator else None,
+        'count': count
+    }
+
+
+def save_checkpoint(
+    account: str,
+    since: Optional[datetime],
+    iterator: Optional[Dict],
+    count: int,
+    db_path: str = POST_STORE_PATH
+):
+    """アカウントの巡回状態を記録"""
+    with closing(_connect(db_path)) as conn, conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO crawl_checkpoints (account, since, iterator, count, updated_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (
+                account,
+                _to_utc_text(since) if since else None,
+                json.dumps(iterator) if iterator is not None else None,
+                count,
+                _to_utc_text(datetime.now(timezone.utc))
+            )
+        )
+
+
+def clear_checkpoint(account: str, db_path: str = POST_STORE_PATH):
+    """アカウントの巡回が完了したら途中経過を消す"""
+    with closing(_connect(db_path)) as conn, conn:
+        conn.execute('DELETE FROM crawl_checkpoints WHERE account = ?', (account,))
+
+
+def start_crawl_queue(
+    job: str,
+    accounts: List[str],
+    resume: bool = True,
+    db_path: str = POST_STORE_PATH
+) -> List[str]:
+    """
+    巡回キューを開始し、これから処理するアカウントを返す
+
+    前回の巡回が途中で止まっていれば（未完了のアカウントがあれば）その続きだけを返し、
+    すべて完了していれば（またはresume=Falseなら）全アカウントを最初から巡回する。
+
+    Args:
+        job: 巡回の名前
+        accounts: 巡回するアカウントのリスト
+
+    Returns:
+        処理するアカウントのリスト（指定順）
+    """
+    now = _to_utc_text(datetime.now(timezone.utc))
+    with closing(_connect(db_path)) as conn, conn:
+        statuses = dict(conn.execute(
+            'SELECT account, status FROM crawl_queue WHERE job = ?', (job,)
+        ).fetchall())
+        unfinished = [
+            account for account in accounts
+            if account in statuses and statuses[account] not in CRAWL_FINISHED_STATUSES
+        ]
+        if resume and unfinished:
+            pending = [
+                account for account in accounts
+                if statuses.get(account) not in CRAWL_FINISHED_STATUSES
+            ]
+        else:
+            pending = list(accounts)
+            conn.execute('DELETE FROM crawl_queue WHERE job = ?', (job,))
+        conn.executemany(
+            'INSERT OR REPLACE INTO crawl_queue (job, account, status, updated_at) VALUES (?, ?, ?, ?)',
+            [(job, account, CRAWL_STATUS_PENDING, now) for account in pending]
+        )
+    return pending
+
+
+def mark_crawl_status(job: str, account: str, status: str, db_path: str = POST_STORE_PATH):
+    """巡回キューのアカウントの状態を更新"""
+    with closing(_connect(db_path)) as conn, conn:
+        conn.execute(
+            'UPDATE crawl_queue SET status = ?, updated_at = ? WHERE job = ? AND account = ?',
+            (status, _to_utc_text(datetime.now(timezone.utc)), job, account)
+        )